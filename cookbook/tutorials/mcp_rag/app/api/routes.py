@@ -1,9 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Security, status
+import json
+from fastapi import APIRouter, Depends, HTTPException, Response, Security, status
+from fastapi.responses import StreamingResponse
 from fastapi.security.api_key import APIKeyHeader
-from typing import Dict, List, Any
+from typing import AsyncIterator, Dict, Any, Type
+from pydantic import BaseModel
 from config import settings
-from services.search import search_documents
-from models.search import SearchRequest, SearchResult, SearchResponse
+from services.search import search_documents_page, search_documents_batch, stream_documents, response_cache, index_generation
+from services import local_search
+from services.index import QueueFullError, submit_job, get_job
+from lib.gemini_client import cache, coalescer, hedged, query_cache
+from lib.metrics import timed
+from lib.cursor import InvalidCursorError
+from lib.hedging import CircuitOpenError, DeadlineExceededError
+from lib.file_filter import FileFilter
+from models.search import SearchRequest, SearchResult, SearchResponse, BatchSearchRequest, BatchSearchResponse, StreamSearchRequest
+from models.index import IndexRequest, IndexJobResponse
 
 router = APIRouter()
 
@@ -12,29 +23,186 @@ api_key_header = APIKeyHeader(name="X-API-Key")
 
 # Validate API key
 async def get_api_key(api_key: str = Security(api_key_header)):
-    if api_key != settings.API_KEY:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid API Key"
-        )
+    with timed("auth"):
+        if api_key != settings.API_KEY:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid API Key"
+            )
     return api_key
 
+# Serialize responses here rather than in FastAPI, so the time shows up as a stage
+def serialize(model: Type[BaseModel], content: Dict[str, Any]) -> Response:
+    with timed("serialize"):
+        return Response(model.model_validate(content).model_dump_json(), media_type="application/json")
+
+# A query embedding that timed out or was not sent is an error, not an empty result
+def embedding_unavailable(error: Exception) -> HTTPException:
+    if isinstance(error, CircuitOpenError):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(error),
+            headers={"Retry-After": str(max(1, round(settings.GEMINI_BREAKER_RESET)))}
+        )
+    return HTTPException(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        detail=str(error)
+    )
+
 
 @router.post("/search", response_model=SearchResponse, tags=["search"])
 async def search(
     request: SearchRequest,
     api_key: str = Depends(get_api_key)
-) -> Dict[str, List[Dict[str, Any]]]:
+) -> Response:
     """
     Search for documents using semantic search
 
     This endpoint performs semantic search using Gemini embeddings and Supabase pgvector.
-    It returns documents matching the query ranked by similarity.
+    It returns documents matching the query ranked by similarity, up to 50 per page.
+    A full page comes with `next_cursor`; send it back as `cursor` with the same
+    query, threshold and filters to get the next page. `file_prefix` and
+    `file_glob` restrict the search to some files, inside the index scan, and
+    `ef_search` sets the HNSW candidate list of every page. Pages are always
+    scanned in strict order, which the cursor relies on, so `iterative_scan`
+    is rejected with a 422.
     """
-    results = await search_documents(
+    try:
+        results, next_cursor = await search_documents_page(
+            query           = request.query,
+            match_threshold = request.match_threshold,
+            match_count     = request.match_count,
+            cursor          = request.cursor,
+            file_filter     = FileFilter.create(request.file_prefix, request.file_glob),
+            ef_search       = request.ef_search
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except (DeadlineExceededError, CircuitOpenError) as e:
+        raise embedding_unavailable(e)
+
+    return serialize(SearchResponse, {"results": results, "next_cursor": next_cursor})
+
+
+@router.post("/search/stream", tags=["search"])
+async def search_stream(
+    request: StreamSearchRequest,
+    api_key: str = Depends(get_api_key)
+) -> StreamingResponse:
+    """
+    Stream search results as newline-delimited JSON, best first
+
+    Results are fetched from the database one page at a time as the client
+    reads them, up to `max_results`. Closing the connection stops the search.
+    The query is embedded and the first page read before the response starts,
+    so their errors still set the status code.
+    """
+    results = stream_documents(
         query           = request.query,
         match_threshold = request.match_threshold,
-        match_count     = request.match_count
+        max_results     = request.max_results,
+        page_size       = request.page_size,
+        file_filter     = FileFilter.create(request.file_prefix, request.file_glob)
     )
 
-    return {"results": results}
+    try:
+        first = await anext(results, None)
+    except (DeadlineExceededError, CircuitOpenError) as e:
+        raise embedding_unavailable(e)
+
+    async def lines() -> AsyncIterator[str]:
+        if first is None:
+            return
+        yield json.dumps(first) + "\n"
+        async for item in results:
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post("/search/batch", response_model=BatchSearchResponse, tags=["search"])
+async def search_batch(
+    request: BatchSearchRequest,
+    api_key: str = Depends(get_api_key)
+) -> Response:
+    """
+    Run several searches in one request
+
+    All queries are embedded with a single Gemini call and matched in one
+    database round trip. Results are returned per query, in request order,
+    plus the deduplicated union of all results when `merge` is true.
+    """
+    try:
+        results, merged = await search_documents_batch(
+            queries = [query.model_dump() for query in request.queries],
+            merge   = request.merge
+        )
+    except (DeadlineExceededError, CircuitOpenError) as e:
+        raise embedding_unavailable(e)
+
+    return serialize(BatchSearchResponse, {"results": [{"results": query_results} for query_results in results], "merged": merged})
+
+
+@router.post("/index", response_model=IndexJobResponse, status_code=status.HTTP_202_ACCEPTED, tags=["index"])
+async def index(
+    request: IndexRequest,
+    api_key: str = Depends(get_api_key)
+) -> Dict[str, Any]:
+    """
+    Queue documents for indexing
+
+    Documents are split, embedded and upserted by a background worker. The
+    response is the queued job, poll `/index/{job_id}` for its progress.
+    Answers 503 when `RAG_INDEX_QUEUE_SIZE` jobs are already waiting.
+    """
+    try:
+        job = submit_job([document.model_dump() for document in request.documents], replace=request.replace)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+    return job.info()
+
+
+@router.get("/index/{job_id}", response_model=IndexJobResponse, tags=["index"])
+async def index_status(
+    job_id: str,
+    api_key: str = Depends(get_api_key)
+) -> Dict[str, Any]:
+    """
+    Status, counters, progress and throughput of an indexing job
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unknown indexing job"
+        )
+    return job.info()
+
+
+@router.get("/cache/stats", tags=["cache"])
+async def cache_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    """
+    Hit and miss counters of the embedding caches
+
+    `query_cache` is the in-process LRU/TTL cache for query embeddings,
+    `embedding_cache` the shared on-disk cache behind it, `coalescer`
+    counts the query embeddings merged into shared Gemini calls and
+    `response_cache` holds whole search responses for the current index generation.
+    `hedging` counts the query embedding calls that were hedged, missed their deadline or
+    were rejected by the circuit breaker.
+    `local_index` reports the in-process replica when `RAG_SEARCH_BACKEND=local`.
+    """
+    return {
+        "query_cache"    : query_cache.info() if query_cache else None,
+        "embedding_cache": dict(cache.stats) if cache else None,
+        "coalescer"      : coalescer.info() if coalescer else None,
+        "hedging"        : hedged.info() if hedged else None,
+        "response_cache" : {**response_cache.info(), "generation": index_generation.generation} if response_cache else None,
+        "local_index"    : local_search.info() if settings.RAG_SEARCH_BACKEND == "local" else None,
+    }
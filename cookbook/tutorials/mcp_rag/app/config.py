@@ -1,22 +1,69 @@
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
-    API_KEY                 : str   = "mcp-vector-search-api-key"
+    API_KEY                   : str   = "mcp-vector-search-api-key"
 
     # Supabase
-    SUPABASE_URL            : str   = "https://<PROJECT_ID>.supabase.co"
-    SUPABASE_KEY            : str
+    SUPABASE_URL              : str   = "https://<PROJECT_ID>.supabase.co"
+    SUPABASE_KEY              : str
 
     # Gemini
-    GEMINI_API_KEY          : str
-    GEMINI_MODEL_ID         : str
-    GEMINI_EMBEDDING_ID     : str   = "text-embedding-004"
+    GEMINI_API_KEY            : str
+    GEMINI_MODEL_ID           : str
+    GEMINI_EMBEDDING_ID       : str   = "text-embedding-004"
 
     # RAG
-    RAG_ENABLED             : bool  = True
-    RAG_EMBEDDING_SIZE      : int   = 768
-    RAG_MATCH_THRESHOLD     : float = 0.36
-    RAG_MATCH_COUNT         : int   = 4
+    RAG_ENABLED               : bool  = True
+    RAG_EMBEDDING_SIZE        : int   = 768
+    RAG_MATCH_THRESHOLD       : float = 0.36
+    RAG_MATCH_COUNT           : int   = 4
+    RAG_EMBEDDING_CACHE_PATH  : str   = ".embedding_cache.db"   # Empty to disable
+    RAG_EMBEDDING_CACHE_SIZE  : int   = 100_000
+    RAG_SEARCH_WORKERS        : int   = 32                      # Searches running Gemini and Supabase calls at once
+    RAG_QUERY_CACHE_SIZE      : int   = 10_000                  # Query embeddings kept in memory, 0 to disable
+    RAG_QUERY_CACHE_TTL       : float = 3600                    # Seconds before a cached query embedding expires, 0 for no expiry
+    RAG_COALESCE_WAIT_MS      : float = 5                       # Wait for concurrent queries to share an embedding call, 0 to disable
+    RAG_COALESCE_MAX_BATCH    : int   = 100                     # Queries per coalesced embedding call (Gemini limit)
+    RAG_COALESCE_IN_FLIGHT    : int   = 8                       # Coalesced embedding calls running at once
+    RAG_RESPONSE_CACHE_SIZE   : int   = 1_000                   # Search responses kept in memory, 0 to disable
+    RAG_RESPONSE_CACHE_TTL    : float = 3600                    # Seconds before a cached search response expires, 0 for no expiry
+    RAG_INDEX_GENERATION_POLL : float = 5                       # Seconds between reads of the index generation
+    RAG_SEARCH_BACKEND        : str   = "supabase"              # "supabase" (match RPC) or "local" (in-process replica)
+    RAG_RERANK_CANDIDATES     : int   = Field(0, ge=0, le=1000) # >0: two-stage search, rerank this many candidates of the truncated index (HNSW's ef_search, at most 1000)
+    RAG_HNSW_EF_SEARCH        : int   = Field(0, ge=0, le=1000) # hnsw.ef_search of the match functions, 0 to keep the database setting (40)
+    RAG_HNSW_ITERATIVE_SCAN   : str   = ""                      # hnsw.iterative_scan of batch searches: "off", "relaxed_order" or "strict_order", empty to keep the database setting
+    RAG_LOCAL_SYNC_INTERVAL   : float = 30                      # Seconds between incremental syncs of the local replica
+    RAG_LOCAL_SYNC_OVERLAP    : float = 60                      # Seconds of updated_at re-read on every sync, for late commits
+    RAG_LOCAL_RECONCILE_EVERY : float = 600                     # Seconds between full ID scans to drop deleted rows
+    RAG_LOCAL_IVF_MIN_ROWS    : int   = 20_000                  # Rows before the local replica builds an IVF index, exact below
+    RAG_LOCAL_NPROBE          : int   = 8                       # IVF lists searched per query
+
+    # Indexing API
+    RAG_INDEX_WORKERS         : int   = 2                       # Indexing jobs running at once
+    RAG_INDEX_QUEUE_SIZE      : int   = 100                     # Jobs waiting before POST /index answers 503
+    RAG_INDEX_EMBED_BATCH     : int   = 100                     # Texts per Gemini embedding call (Gemini limit)
+    RAG_INDEX_JOB_HISTORY     : int   = 1_000                   # Jobs kept for GET /index/{job_id}, oldest finished ones dropped first
+
+    # HTTP clients (Supabase and Gemini)
+    SUPABASE_TIMEOUT          : float = 20                      # Seconds per PostgREST request
+    GEMINI_TIMEOUT            : float = 30                      # Seconds per Gemini request
+    GEMINI_QUERY_DEADLINE     : float = 2                       # Seconds a search waits for its query embedding, 0 for GEMINI_TIMEOUT and no hedging
+    GEMINI_HEDGE_QUANTILE     : float = 0.95                    # Resend a query embedding slower than this quantile of recent calls, 0 to disable
+    GEMINI_HEDGE_MIN_DELAY    : float = 0.05                    # Seconds before a query embedding is resent, at least
+    GEMINI_BREAKER_FAILURES   : int   = 5                       # Consecutive failed query embeddings that open the circuit, 0 to disable
+    GEMINI_BREAKER_RESET      : float = 10                      # Seconds the circuit stays open before a trial request
+    HTTP_MAX_CONNECTIONS      : int   = 100                     # Connections per client
+    HTTP_MAX_KEEPALIVE        : int   = 32                      # Idle connections kept open per client, match RAG_SEARCH_WORKERS
+    HTTP_KEEPALIVE_EXPIRY     : float = 60                      # Seconds an idle connection stays open
+    HTTP2_ENABLED             : bool  = True                    # Multiplex requests over one connection per client
+    WARMUP_ENABLED            : bool  = True                    # Open connections (and load the local index) before serving
+    WARMUP_REQUESTS           : int   = 4                       # Concurrent probes per client, to open more than one HTTP/1.1 connection
+    WARMUP_TIMEOUT            : float = 15                      # Seconds before startup gives up on warming up
+
+    # Observability
+    METRICS_ENABLED           : bool  = True                    # Serve Prometheus metrics at /metrics
+    SERVER_TIMING_ENABLED     : bool  = False                   # Add a Server-Timing header with stage durations to responses
 
     model_config = SettingsConfigDict(env_file=".env")
 
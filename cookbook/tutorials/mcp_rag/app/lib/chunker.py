@@ -0,0 +1,67 @@
+import hashlib
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Used by the indexing API and the indexer (indexer/chunker.py), so both produce the same chunks and IDs
+CHUNK_SIZE    = 600
+CHUNK_OVERLAP = 200
+
+@lru_cache(maxsize=None)
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    """Get the text splitter, built once per process"""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+
+def content_hash(text: str) -> str:
+    """Return the hex SHA-256 digest of a piece of text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def split_document(text: str, file_id: str) -> List[Dict[str, Any]]:
+    """
+    Split a document into chunks with content-addressed IDs
+
+    IDs are `{file_id}_{first 16 hex of the chunk hash}`, so edits elsewhere in
+    the document don't change them. Repeated texts within a document get an
+    ordinal to keep IDs unique.
+
+    Args:
+        text: Document content
+        file_id: ID of the document, stored as file_id
+
+    Returns:
+        List of chunk dictionaries with id, file_id, content, start_pos, end_pos and hash
+    """
+    chunk_dicts = []
+    seen: Dict[str, int] = {}
+    search_from = 0
+    for chunk_text in get_text_splitter().split_text(text):
+        # Find the exact start position, searching forward from the previous chunk
+        start_pos = text.find(chunk_text, search_from)
+        if start_pos < 0:
+            start_pos = text.find(chunk_text)
+        if start_pos < 0:
+            # Not a verbatim slice of the text, keep the running offset instead of -1
+            start_pos = search_from
+        end_pos = min(start_pos + len(chunk_text), len(text))
+        search_from = max(search_from, end_pos - CHUNK_OVERLAP)
+
+        chunk_hash = content_hash(chunk_text)
+        seen[chunk_hash] = seen.get(chunk_hash, 0) + 1
+        chunk_id = f"{file_id}_{chunk_hash[:16]}"
+        if seen[chunk_hash] > 1:
+            chunk_id += f"_{seen[chunk_hash]}"
+
+        chunk_dicts.append({
+            "id"       : chunk_id,
+            "file_id"  : file_id,
+            "content"  : chunk_text,
+            "start_pos": start_pos,
+            "end_pos"  : end_pos,
+            "hash"     : chunk_hash
+        })
+
+    return chunk_dicts
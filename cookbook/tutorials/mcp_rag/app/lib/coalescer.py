@@ -0,0 +1,115 @@
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+Embedding = List[float]
+BatchFn   = Callable[[List[str]], List[Embedding]]
+
+
+class EmbeddingCoalescer:
+    """
+    Merge concurrent embedding requests into batched API calls
+
+    Texts submitted from many threads are collected for up to `max_wait` seconds
+    (or until `max_batch` texts are waiting) and sent in a single call. Each
+    caller gets a future for its own vector. A text that is already waiting or
+    in flight is not sent again; its callers share the same future (single-flight).
+    """
+
+    def __init__(self, batch_fn: BatchFn, max_batch: int = 100, max_wait: float = 0.005, max_in_flight: int = 8):
+        """
+        Args:
+            batch_fn: Function embedding a list of texts in one call, one vector per text
+            max_batch: Maximum texts per call
+            max_wait: Seconds to wait for more texts after the first one arrives
+            max_in_flight: Maximum concurrent calls
+        """
+        self.batch_fn  = batch_fn
+        self.max_batch = max_batch
+        self.max_wait  = max_wait
+
+        self.condition = threading.Condition()
+        self.waiting: Dict[str, Future] = {}    # Collected, not sent yet
+        self.in_flight: Dict[str, Future] = {}  # Sent, waiting for the response
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="coalesce")
+
+        self.stats = {"texts": 0, "merged": 0, "calls": 0, "errors": 0}
+
+        self.collector = threading.Thread(target=self._collect, name="coalesce-collector", daemon=True)
+        self.collector.start()
+
+    def submit(self, text: str) -> "Future[Embedding]":
+        """
+        Queue a text for the next batch
+
+        Args:
+            text: Text to embed
+
+        Returns:
+            Future resolving to the text's vector, or raising the error of the call
+        """
+        with self.condition:
+            self.stats["texts"] += 1
+            future = self.waiting.get(text) or self.in_flight.get(text)
+            if future is not None:
+                self.stats["merged"] += 1
+                return future
+
+            future = Future()
+            self.waiting[text] = future
+            self.condition.notify()
+            return future
+
+    def embed(self, texts: List[str]) -> List[Embedding]:
+        """Embed texts through the coalescer, blocking until every vector is available"""
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def _collect(self) -> None:
+        while True:
+            with self.condition:
+                while not self.waiting:
+                    self.condition.wait()
+
+                # Give concurrent requests a moment to join the batch
+                deadline = time.monotonic() + self.max_wait
+                while len(self.waiting) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                batch = list(self.waiting.items())[:self.max_batch]
+                for text, future in batch:
+                    del self.waiting[text]
+                    self.in_flight[text] = future
+                self.stats["calls"] += 1
+
+            self.executor.submit(self._send, batch)
+
+    def _send(self, batch: List[Tuple[str, Future]]) -> None:
+        try:
+            vectors = self.batch_fn([text for text, _ in batch])
+            if len(vectors) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+        except Exception as e:
+            with self.condition:
+                self.stats["errors"] += 1
+                for text, _ in batch:
+                    self.in_flight.pop(text, None)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        with self.condition:
+            for text, _ in batch:
+                self.in_flight.pop(text, None)
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+    def info(self) -> Dict[str, Any]:
+        """Return the counters and the average number of texts per call"""
+        with self.condition:
+            sent = self.stats["texts"] - self.stats["merged"]
+            return {**self.stats, "texts_per_call": round(sent / self.stats["calls"], 2) if self.stats["calls"] else 0.0}
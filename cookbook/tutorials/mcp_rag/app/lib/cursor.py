@@ -0,0 +1,55 @@
+import json
+import base64
+import hashlib
+from typing import Optional, Tuple
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a cursor is malformed or belongs to another search"""
+
+
+def _search_key(query: str, threshold: float) -> str:
+    """Short digest of the search a cursor belongs to"""
+    return hashlib.sha256(f"{threshold!r}\x00{query}".encode("utf-8")).hexdigest()[:16]
+
+def encode_cursor(query: str, threshold: float, similarity: float, row_id: str) -> str:
+    """
+    Build the opaque cursor pointing after a row of a search
+
+    Args:
+        query: Normalized query text of the search
+        threshold: Similarity threshold of the search
+        similarity: Unrounded similarity of the last row of the page
+        row_id: ID of the last row of the page
+
+    Returns:
+        URL-safe cursor string
+    """
+    payload = json.dumps({"k": _search_key(query, threshold), "s": similarity, "id": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: Optional[str], query: str, threshold: float) -> Optional[Tuple[float, str]]:
+    """
+    Read a cursor built by `encode_cursor`
+
+    Args:
+        cursor: The cursor, or None for the first page
+        query: Normalized query text of the search
+        threshold: Similarity threshold of the search
+
+    Returns:
+        Tuple of (similarity, id) of the row to continue after, or None for the first page
+
+    Raises:
+        InvalidCursorError: If the cursor cannot be read or was issued for a different query or threshold
+    """
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        key, similarity, row_id = payload["k"], float(payload["s"]), str(payload["id"])
+    except Exception:
+        raise InvalidCursorError("Malformed cursor")
+    if key != _search_key(query, threshold):
+        raise InvalidCursorError("Cursor belongs to a different query or threshold")
+    return similarity, row_id
@@ -0,0 +1,205 @@
+"""
+Persistent content-addressed embedding cache
+
+Embeddings are stored in a local SQLite file keyed by
+(model id, output dimensionality, task type, SHA-256 of the text), so the same
+text is never sent to Gemini twice for the same model settings. Vectors are
+stored as float32 blobs. When the cache grows past `max_entries`, the least
+recently used entries are evicted. Lookups only read: the last-use times of
+hits are kept in memory and written in one transaction with the next put, or
+once `touch_batch` of them are pending, so a hit costs no write or fsync.
+
+The cache is an optimization: SQLite errors (a locked, full or corrupt file)
+are logged, and a lookup then answers misses and a store is dropped.
+
+The file can be shared between processes (the indexers and the search API),
+SQLite takes care of locking.
+"""
+
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+Embedding = List[float]
+
+SCHEMA = """
+create table if not exists embeddings (
+    model_id   text    not null,
+    dimension  integer not null,
+    task_type  text    not null,
+    text_hash  text    not null,
+    vector     blob    not null,
+    last_used  real    not null,
+    primary key (model_id, dimension, task_type, text_hash)
+);
+create index if not exists embeddings_last_used on embeddings (last_used);
+"""
+
+SQLITE_MAX_PARAMS = 500  # Stay well below SQLite's host parameter limit
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text: str) -> str:
+    """Return the cache key component for a text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk embedding cache with bulk get/put and LRU eviction"""
+
+    def __init__(self, path: str, max_entries: int = 1_000_000, touch_batch: int = 1_000):
+        """
+        Open (or create) the cache file
+
+        Args:
+            path: Location of the SQLite file
+            max_entries: Number of embeddings to keep before evicting the least recently used
+            touch_batch: Pending last-use updates that trigger a write without waiting for a put
+        """
+        self.path        = path
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.lock        = threading.Lock()
+
+        # Last use of the hits not yet written, by primary key
+        self.touched: Dict[Tuple[str, int, str, str], float] = {}
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("pragma synchronous=normal")
+        self.conn.executescript(SCHEMA)
+        self.count = self.conn.execute("select count(*) from embeddings").fetchone()[0]
+
+        self.stats = {"hits": 0, "misses": 0, "errors": 0}
+
+    def get_many(self, model_id: str, dimension: int, task_type: str, texts: Sequence[str]) -> List[Optional[Embedding]]:
+        """
+        Look up embeddings for many texts at once
+
+        Args:
+            model_id: Embedding model
+            dimension: Output dimensionality
+            task_type: Embedding task type, e.g. RETRIEVAL_DOCUMENT
+            texts: Texts to look up
+
+        Returns:
+            One embedding per text, None for cache misses
+        """
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+
+        with self.lock:
+            try:
+                for i in range(0, len(hashes), SQLITE_MAX_PARAMS):
+                    sub_batch = hashes[i:i + SQLITE_MAX_PARAMS]
+                    placeholders = ",".join("?" * len(sub_batch))
+                    rows = self.conn.execute(
+                        f"select text_hash, vector from embeddings "
+                        f"where model_id = ? and dimension = ? and task_type = ? and text_hash in ({placeholders})",
+                        (model_id, dimension, task_type, *sub_batch)
+                    ).fetchall()
+                    found.update(rows)
+
+                # Touch the hits so they survive eviction, written later in one batch
+                now = time.time()
+                for h in found:
+                    self.touched[(model_id, dimension, task_type, h)] = now
+                if len(self.touched) >= self.touch_batch:
+                    self._flush_touched()
+                    self.conn.commit()
+            except sqlite3.Error as e:
+                self.stats["errors"] += 1
+                logger.warning(f"Embedding cache lookup failed, treating {len(hashes)} texts as misses: {e}")
+                self._rollback()
+                found = {}
+
+            self.stats["hits"] += sum(1 for h in hashes if h in found)
+            self.stats["misses"] += sum(1 for h in hashes if h not in found)
+
+        return [array("f", found[h]).tolist() if h in found else None for h in hashes]
+
+    def put_many(self, model_id: str, dimension: int, task_type: str, texts: Sequence[str], embeddings: Sequence[Embedding]) -> None:
+        """
+        Store embeddings for many texts at once
+
+        Args:
+            model_id: Embedding model
+            dimension: Output dimensionality
+            task_type: Embedding task type, e.g. RETRIEVAL_DOCUMENT
+            texts: Texts that were embedded
+            embeddings: One embedding per text (empty embeddings are skipped)
+        """
+        now = time.time()
+        rows = [
+            (model_id, dimension, task_type, text_hash(text), array("f", embedding).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+            if embedding
+        ]
+        if not rows:
+            return
+
+        with self.lock:
+            try:
+                self.conn.executemany("insert or replace into embeddings values (?, ?, ?, ?, ?, ?)", rows)
+                self._flush_touched()
+                self.conn.commit()
+                self.count += len(rows)
+                if self.count > self.max_entries:
+                    self._evict()
+            except sqlite3.Error as e:
+                self.stats["errors"] += 1
+                logger.warning(f"Embedding cache write failed, dropping {len(rows)} embeddings: {e}")
+                self._rollback()
+
+    def flush(self) -> None:
+        """Write the pending last-use times of cache hits"""
+        with self.lock:
+            try:
+                self._flush_touched()
+                self.conn.commit()
+            except sqlite3.Error as e:
+                self.stats["errors"] += 1
+                logger.warning(f"Embedding cache flush failed: {e}")
+                self._rollback()
+
+    def _flush_touched(self) -> None:
+        # Pending touches are dropped on failure, they only order the evictions
+        touched, self.touched = self.touched, {}
+        if touched:
+            self.conn.executemany(
+                "update embeddings set last_used = ? where model_id = ? and dimension = ? and task_type = ? and text_hash = ?",
+                [(last_used, *key) for key, last_used in touched.items()]
+            )
+
+    def _rollback(self) -> None:
+        try:
+            self.conn.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _evict(self) -> None:
+        # Other processes may share the file, so recount before deleting
+        self.count = self.conn.execute("select count(*) from embeddings").fetchone()[0]
+        excess = self.count - self.max_entries
+        if excess <= 0:
+            return
+
+        # Evict a little extra so we don't evict on every put
+        excess += self.max_entries // 10
+        self.conn.execute(
+            "delete from embeddings where rowid in (select rowid from embeddings order by last_used limit ?)",
+            (excess,)
+        )
+        self.conn.commit()
+        self.count = max(0, self.count - excess)
+
+    def close(self) -> None:
+        """Write the pending last-use times and close the underlying SQLite connection"""
+        self.flush()
+        with self.lock:
+            self.conn.close()
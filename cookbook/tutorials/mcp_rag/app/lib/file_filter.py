@@ -0,0 +1,93 @@
+import re
+from typing import Dict, Optional, Tuple
+
+GLOB_WILDCARDS = "*?"
+
+
+def glob_to_regex(glob: str) -> str:
+    """
+    Translate a path glob to an anchored regular expression
+
+    `**` matches any number of path segments (`**/` also matches none), `*`
+    anything within a segment and `?` one character other than `/`. Every other
+    character is literal. The result is valid for both Python's `re` and
+    PostgreSQL's `~` operator.
+
+    Args:
+        glob: Glob over file_ids, e.g. "docs/**/*.md"
+
+    Returns:
+        Regular expression matching the whole file_id
+    """
+    parts = []
+    i = 0
+    while i < len(glob):
+        if glob.startswith("**/", i):
+            parts.append("(.*/)?")
+            i += 3
+        elif glob.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif glob[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif glob[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        else:
+            parts.append(re.escape(glob[i]) if not glob[i].isalnum() else glob[i])
+            i += 1
+    return "^" + "".join(parts) + "$"
+
+def literal_prefix(glob: str) -> str:
+    """Return the part of a glob before its first wildcard"""
+    end = min((glob.find(char) for char in GLOB_WILDCARDS if char in glob), default=len(glob))
+    return glob[:end]
+
+
+class FileFilter:
+    """
+    Restriction of a search to some file_ids, by prefix and/or glob
+
+    The literal start of the glob is used as a prefix too, so that a glob like
+    "docs/**/*.md" is pushed down to the "docs" scope (the top-level directory
+    of the file_id, indexed in `file_scope`) like the prefix "docs/".
+    """
+
+    def __init__(self, prefix: Optional[str] = None, glob: Optional[str] = None):
+        """
+        Args:
+            prefix: Literal start of the file_ids to search
+            glob: Glob the file_ids to search must match
+        """
+        self.glob    = glob or None
+        self.pattern = glob_to_regex(glob) if glob else None
+
+        # Keep the longer of the two prefixes when one extends the other, both are checked anyway
+        prefix, implied = prefix or "", literal_prefix(glob) if glob else ""
+        self.prefix = (implied if implied.startswith(prefix) else prefix) or None
+
+    @classmethod
+    def create(cls, prefix: Optional[str] = None, glob: Optional[str] = None) -> Optional["FileFilter"]:
+        """Return a filter, or None when neither a prefix nor a glob is given"""
+        return cls(prefix, glob) if prefix or glob else None
+
+    @property
+    def scope(self) -> Optional[str]:
+        """Top-level directory every matching file_id is in, if the prefix pins it down"""
+        if self.prefix and "/" in self.prefix:
+            return self.prefix.split("/", 1)[0]
+        return None
+
+    def key(self) -> Tuple[Optional[str], Optional[str]]:
+        """Hashable identity of the filter, for cache keys and cursors"""
+        return self.prefix, self.pattern
+
+    def matches(self, file_id: str) -> bool:
+        if self.prefix and not file_id.startswith(self.prefix):
+            return False
+        return self.pattern is None or re.match(self.pattern, file_id) is not None
+
+    def params(self) -> Dict[str, Optional[str]]:
+        """Arguments of the `match_file_embeddings[_mrl|_page]` functions"""
+        return {"p_file_prefix": self.prefix, "p_file_pattern": self.pattern}
@@ -1,33 +1,193 @@
 from google import genai
-from google.genai.types import ContentEmbedding, EmbedContentConfig
-from typing import List, Union
+from google.genai.types import ContentEmbedding, EmbedContentConfig, HttpOptions
+import logging
+import time
+from typing import List, Optional, Union
 from config import settings
 from models.embedding import EmbeddingTaskTypeEnum
+from lib.embedding_cache import EmbeddingCache
+from lib.query_cache import QueryCache, normalize_query
+from lib.coalescer import EmbeddingCoalescer
+from lib.hedging import CircuitBreaker, CircuitOpenError, DeadlineExceededError, HedgedCaller
+from lib.metrics import CACHE_LOOKUPS, EMBED_QUERY_OUTCOMES, EMBED_REQUEST_ERRORS, EMBED_REQUEST_SECONDS
+from lib.http_pool import client_args
 
-# Initialize Gemini client
-client = genai.Client(api_key=settings.GEMINI_API_KEY)
+logger = logging.getLogger(__name__)
 
-def embed_content(
-    contents  : Union[str, List[str]],
-    task_type : EmbeddingTaskTypeEnum = EmbeddingTaskTypeEnum.RETRIEVAL_QUERY
-) -> List[ContentEmbedding]:
+def create_client() -> genai.Client:
+    """Create a Gemini client using the configured connection pool and timeout"""
+    return genai.Client(
+        api_key      = settings.GEMINI_API_KEY,
+        http_options = HttpOptions(
+            timeout     = int(settings.GEMINI_TIMEOUT * 1000),  # Milliseconds
+            client_args = client_args(),
+        ),
+    )
+
+# Gemini client, created by `open_pool` on every app startup rather than on import
+client: Optional[genai.Client] = None
+
+def open_pool() -> None:
+    """Create the Gemini client, replacing the one closed by a previous `close`"""
+    global client
+    client = create_client()
+
+def warmup() -> None:
+    """Open a connection to the Gemini API with a one-word embedding"""
+    request_embeddings(["warmup"], EmbeddingTaskTypeEnum.RETRIEVAL_QUERY)
+
+def close() -> None:
+    """Close the Gemini client's pooled connections, and write the cache's pending last-use times"""
+    # Client.close only exists in recent google-genai releases
+    if client is not None and hasattr(client, "close"):
+        client.close()
+    if cache is not None:
+        cache.flush()
+
+# Initialize the on-disk embedding cache (shared with the indexers if they use the same file)
+cache: Optional[EmbeddingCache] = (
+    EmbeddingCache(settings.RAG_EMBEDDING_CACHE_PATH, settings.RAG_EMBEDDING_CACHE_SIZE)
+    if settings.RAG_EMBEDDING_CACHE_PATH else None
+)
+
+# In-process LRU/TTL cache for query embeddings, checked before the on-disk cache
+query_cache: Optional[QueryCache] = (
+    QueryCache(settings.RAG_QUERY_CACHE_SIZE, settings.RAG_QUERY_CACHE_TTL)
+    if settings.RAG_QUERY_CACHE_SIZE else None
+)
+
+def request_embeddings(texts: List[str], task_type: EmbeddingTaskTypeEnum) -> List[List[float]]:
     """
-    Generate embeddings for content using Gemini model
+    Embed texts with a single Gemini call, without caching
     Args:
-        contents : The content to embed, either a string or list of strings
+        texts    : The texts to embed
         task_type: The type of embedding task
     Returns:
-        List of content embeddings
+        One vector per text
     """
+    start = time.perf_counter()
     try:
         response = client.models.embed_content(
             model    = settings.GEMINI_EMBEDDING_ID,
-            contents = contents,
+            contents = texts,
             config   = EmbedContentConfig(
                 task_type = task_type,
                 output_dimensionality = settings.RAG_EMBEDDING_SIZE,
             )
         )
-        return response.embeddings
-    except:
-        return [ContentEmbedding(values=[])]
\ No newline at end of file
+    except Exception:
+        EMBED_REQUEST_ERRORS.inc()
+        raise
+    finally:
+        EMBED_REQUEST_SECONDS.observe(time.perf_counter() - start)
+    return [embedding.values for embedding in response.embeddings]
+
+# Query embeddings are on the search path: they get a deadline, a second request when
+# the first is slower than usual, and fail fast while Gemini keeps failing
+hedged: Optional[HedgedCaller] = (
+    HedgedCaller(
+        deadline        = settings.GEMINI_QUERY_DEADLINE,
+        hedge_quantile  = settings.GEMINI_HEDGE_QUANTILE,
+        min_hedge_delay = settings.GEMINI_HEDGE_MIN_DELAY,
+        breaker         = CircuitBreaker(settings.GEMINI_BREAKER_FAILURES, settings.GEMINI_BREAKER_RESET) if settings.GEMINI_BREAKER_FAILURES else None,
+        max_workers     = 2 * settings.RAG_SEARCH_WORKERS,
+        on_outcome      = lambda outcome: EMBED_QUERY_OUTCOMES.inc(outcome=outcome),
+    )
+    if settings.GEMINI_QUERY_DEADLINE > 0 else None
+)
+
+def request_query_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Embed query texts with `request_embeddings`, through the deadline, hedging and circuit breaker
+    Args:
+        texts: The queries to embed
+    Returns:
+        One vector per text
+    Raises:
+        DeadlineExceededError: If Gemini did not answer within GEMINI_QUERY_DEADLINE
+        CircuitOpenError: If recent calls kept failing, without calling Gemini
+    """
+    if hedged is None:
+        return request_embeddings(texts, EmbeddingTaskTypeEnum.RETRIEVAL_QUERY)
+    return hedged.call(request_embeddings, texts, EmbeddingTaskTypeEnum.RETRIEVAL_QUERY)
+
+# Concurrent query embeddings are merged into batched calls
+coalescer: Optional[EmbeddingCoalescer] = (
+    EmbeddingCoalescer(
+        request_query_embeddings,
+        max_batch     = settings.RAG_COALESCE_MAX_BATCH,
+        max_wait      = settings.RAG_COALESCE_WAIT_MS / 1000,
+        max_in_flight = settings.RAG_COALESCE_IN_FLIGHT,
+    )
+    if settings.RAG_COALESCE_WAIT_MS > 0 else None
+)
+
+def embed_content(
+    contents  : Union[str, List[str]],
+    task_type : EmbeddingTaskTypeEnum = EmbeddingTaskTypeEnum.RETRIEVAL_QUERY
+) -> List[ContentEmbedding]:
+    """
+    Generate embeddings for content using Gemini model
+    Args:
+        contents : The content to embed, either a string or list of strings
+        task_type: The type of embedding task
+    Returns:
+        List of content embeddings, a single empty one if Gemini answered with an error
+    Raises:
+        DeadlineExceededError: If a query embedding did not arrive within GEMINI_QUERY_DEADLINE
+        CircuitOpenError: If query embeddings are failing fast while Gemini keeps failing
+    """
+    texts = [contents] if isinstance(contents, str) else list(contents)
+    cache_key = (settings.GEMINI_EMBEDDING_ID, settings.RAG_EMBEDDING_SIZE, EmbeddingTaskTypeEnum(task_type).value)
+
+    # Repeated queries are answered from memory
+    use_query_cache = query_cache is not None and cache_key[2] == EmbeddingTaskTypeEnum.RETRIEVAL_QUERY.value
+    if use_query_cache:
+        texts   = [normalize_query(text) for text in texts]
+        vectors = [query_cache.get((*cache_key, text)) for text in texts]
+        hits    = sum(vector is not None for vector in vectors)
+        CACHE_LOOKUPS.inc(hits, cache="query", result="hit")
+        CACHE_LOOKUPS.inc(len(texts) - hits, cache="query", result="miss")
+    else:
+        vectors = [None] * len(texts)
+
+    # Then from the on-disk cache
+    pending = [i for i, vector in enumerate(vectors) if vector is None]
+    if cache and pending:
+        for i, vector in zip(pending, cache.get_many(*cache_key, [texts[i] for i in pending])):
+            vectors[i] = vector
+        hits = sum(vectors[i] is not None for i in pending)
+        CACHE_LOOKUPS.inc(hits, cache="embedding", result="hit")
+        CACHE_LOOKUPS.inc(len(pending) - hits, cache="embedding", result="miss")
+
+    # Only send the texts that are not cached yet
+    misses = [i for i, vector in enumerate(vectors) if vector is None]
+
+    if misses:
+        try:
+            if coalescer is not None and cache_key[2] == EmbeddingTaskTypeEnum.RETRIEVAL_QUERY.value:
+                # Share a call with the other queries arriving right now
+                embeddings = coalescer.embed([texts[i] for i in misses])
+            elif cache_key[2] == EmbeddingTaskTypeEnum.RETRIEVAL_QUERY.value:
+                embeddings = request_query_embeddings([texts[i] for i in misses])
+            else:
+                embeddings = request_embeddings([texts[i] for i in misses], task_type)
+        except (DeadlineExceededError, CircuitOpenError):
+            # Raised so the API can answer 504 and 503 instead of an empty 200
+            raise
+        except Exception as e:
+            # Any other failure means no results, as before the deadline and circuit breaker
+            logger.exception(f"Gemini embedding request failed: {e!r}")
+            return [ContentEmbedding(values=[])]
+
+        if cache:
+            cache.put_many(*cache_key, [texts[i] for i in misses], embeddings)
+        for i, values in zip(misses, embeddings):
+            vectors[i] = values
+
+    if use_query_cache:
+        for i in pending:
+            if vectors[i]:
+                query_cache.put((*cache_key, texts[i]), vectors[i])
+
+    return [ContentEmbedding(values=values) for values in vectors]
@@ -0,0 +1,238 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when no attempt of a call answered before its deadline"""
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while the circuit breaker is open"""
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies, for picking the hedging delay"""
+
+    def __init__(self, window: int = 1000, min_samples: int = 20):
+        """
+        Args:
+            window: Number of most recent latencies kept
+            min_samples: Latencies needed before `quantile` returns a value
+        """
+        self.min_samples = min_samples
+        self.lock        = threading.Lock()
+        self.samples: deque = deque(maxlen=window)
+        self.cached: Dict[float, tuple] = {}  # quantile -> (samples seen when computed, value)
+        self.seen = 0
+
+    def observe(self, seconds: float) -> None:
+        with self.lock:
+            self.samples.append(seconds)
+            self.seen += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the q-quantile of the window, None until `min_samples` latencies were observed"""
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            # Recomputed every few samples, not on every call
+            seen, value = self.cached.get(q, (-1, 0.0))
+            if self.seen - seen >= 10 or seen < 0:
+                value = float(np.quantile(np.fromiter(self.samples, dtype=np.float64), q))
+                self.cached[q] = (self.seen, value)
+            return value
+
+
+class CircuitBreaker:
+    """
+    Fail fast while a dependency keeps failing
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    are rejected without being sent. After `reset_timeout` seconds one trial
+    call is let through (half-open): its success closes the circuit, its
+    failure opens it for another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout     = reset_timeout
+        self.lock              = threading.Lock()
+        self.state             = "closed"
+        self.failures          = 0
+        self.opened_at         = 0.0
+
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def allow(self) -> bool:
+        """Return whether a call may be sent now, moving an expired open circuit to half-open"""
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.state, self.failures = "closed", 0
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.stats["opened"] += 1
+                self.state, self.opened_at = "open", time.monotonic()
+
+    def info(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"state": self.state, "failures": self.failures, **self.stats}
+
+
+class HedgedCaller:
+    """
+    Run blocking calls with a deadline, a hedged second attempt and a circuit breaker
+
+    Each call is sent on a worker thread. If it has not answered after the
+    `hedge_quantile` of recent latencies, the same call is sent once more and
+    the first successful answer wins. If neither answers before `deadline`
+    seconds, `DeadlineExceededError` is raised; the attempts still running are
+    left to finish (bounded by the client's own timeout) and their answers are
+    dropped. Timeouts and errors count as failures for the circuit breaker.
+    """
+
+    def __init__(
+        self,
+        deadline       : float,
+        hedge_quantile : float = 0.95,
+        min_hedge_delay: float = 0.05,
+        breaker        : Optional[CircuitBreaker] = None,
+        max_workers    : int = 64,
+        on_outcome     : Optional[Callable[[str], None]] = None,
+    ):
+        """
+        Args:
+            deadline: Seconds a call may take in total
+            hedge_quantile: Latency quantile after which the second attempt is sent, 0 to never hedge
+            min_hedge_delay: Seconds to wait at least before hedging
+            breaker: Circuit breaker consulted before and updated after each call
+            max_workers: Threads running attempts, two per call at most
+            on_outcome: Called with "first", "hedge", "deadline", "error" or "rejected" after each call
+        """
+        self.deadline        = deadline
+        self.hedge_quantile  = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.breaker         = breaker
+        self.on_outcome      = on_outcome
+        self.latencies       = LatencyTracker()
+        self.executor        = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+        self.lock  = threading.Lock()
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "deadline_exceeded": 0, "errors": 0, "rejected": 0}
+
+    def _count(self, key: str) -> None:
+        with self.lock:
+            self.stats[key] += 1
+
+    def _finish(self, outcome: str) -> None:
+        if self.on_outcome is not None:
+            self.on_outcome(outcome)
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before the second attempt, None to never send one"""
+        if not self.hedge_quantile:
+            return None
+        observed = self.latencies.quantile(self.hedge_quantile)
+        # Until enough latencies are known, hedge halfway to the deadline
+        delay = observed if observed is not None else self.deadline / 2
+        return max(delay, self.min_hedge_delay)
+
+    def _attempt(self, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.latencies.observe(time.perf_counter() - start)
+        return result
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Call `fn(*args, **kwargs)` with the deadline, hedging and circuit breaker
+
+        Returns:
+            The result of the first attempt that succeeded
+
+        Raises:
+            CircuitOpenError: If the circuit breaker is open, without calling `fn`
+            DeadlineExceededError: If no attempt answered within the deadline
+            Exception: The error of the last attempt, if every attempt failed
+        """
+        if self.breaker is not None and not self.breaker.allow():
+            self._count("rejected")
+            self._finish("rejected")
+            raise CircuitOpenError("Circuit breaker is open, not calling the provider")
+
+        self._count("calls")
+        start = time.monotonic()
+        end = start + self.deadline
+        delay = self.hedge_delay()
+        hedge_at = start + delay if delay is not None and delay < self.deadline else None
+
+        attempts: List[Future] = [self.executor.submit(self._attempt, fn, args, kwargs)]
+        pending = set(attempts)
+        error: Optional[BaseException] = None
+        while True:
+            wake = hedge_at if hedge_at is not None and len(attempts) == 1 else end
+            done, pending = wait(pending, timeout=max(wake - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = "first" if future is attempts[0] else "hedge"
+                    if winner == "hedge":
+                        self._count("hedge_wins")
+                    if self.breaker is not None:
+                        self.breaker.record_success()
+                    self._finish(winner)
+                    return future.result()
+                error = future.exception()
+
+            if not pending:
+                # Every attempt sent so far failed
+                self._count("errors")
+                outcome = "error"
+                break
+            if time.monotonic() >= end:
+                self._count("deadline_exceeded")
+                outcome = "deadline"
+                error = DeadlineExceededError(f"No answer within {self.deadline:.2f}s ({len(attempts)} attempts)")
+                break
+            if len(attempts) == 1 and hedge_at is not None and time.monotonic() >= hedge_at:
+                # The first attempt is slower than usual, race a second one against it
+                self._count("hedged")
+                hedge = self.executor.submit(self._attempt, fn, args, kwargs)
+                attempts.append(hedge)
+                pending.add(hedge)
+
+        if self.breaker is not None:
+            self.breaker.record_failure()
+        self._finish(outcome)
+        raise error
+
+    def info(self) -> Dict[str, Any]:
+        """Return the call counters, the current hedging delay and the circuit state"""
+        with self.lock:
+            stats = dict(self.stats)
+        return {
+            **stats,
+            "hedge_delay" : self.hedge_delay(),
+            "breaker"     : self.breaker.info() if self.breaker is not None else None,
+        }
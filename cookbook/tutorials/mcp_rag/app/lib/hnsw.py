@@ -0,0 +1,51 @@
+from typing import Any, Dict, Optional, Tuple
+
+# Values of pgvector's hnsw.iterative_scan (0.8+)
+ITERATIVE_SCAN_MODES = ("off", "relaxed_order", "strict_order")
+
+
+class HnswParams:
+    """
+    HNSW search parameters of one call to the match functions
+
+    `ef_search` is the size of the candidate list kept while walking the graph:
+    higher finds more of the true nearest rows at the cost of latency, and it
+    also caps the rows one scan returns. `iterative_scan` lets the scan continue
+    past `ef_search` rows when the threshold or file filters reject too many
+    of them. Both are set with `set_config(..., true)`, so they only last for
+    the transaction of the call. Unset values keep the database's settings.
+    """
+
+    def __init__(self, ef_search: Optional[int] = None, iterative_scan: Optional[str] = None):
+        """
+        Args:
+            ef_search: Candidate list size, 1 to 1000 (pgvector's bounds)
+            iterative_scan: One of ITERATIVE_SCAN_MODES
+
+        Raises:
+            ValueError: If a value is outside what pgvector accepts
+        """
+        if ef_search is not None and not 1 <= ef_search <= 1000:
+            raise ValueError(f"ef_search must be between 1 and 1000, got {ef_search}")
+        if iterative_scan is not None and iterative_scan not in ITERATIVE_SCAN_MODES:
+            raise ValueError(f"iterative_scan must be one of {', '.join(ITERATIVE_SCAN_MODES)}, got {iterative_scan!r}")
+        self.ef_search      = ef_search
+        self.iterative_scan = iterative_scan
+
+    @classmethod
+    def create(cls, ef_search: Optional[int] = None, iterative_scan: Optional[str] = None) -> Optional["HnswParams"]:
+        """Return the parameters, or None when neither is set"""
+        return cls(ef_search, iterative_scan) if ef_search or iterative_scan else None
+
+    def key(self) -> Tuple[Optional[int], Optional[str]]:
+        """Hashable identity of the parameters, for cache keys"""
+        return self.ef_search, self.iterative_scan
+
+    def params(self) -> Dict[str, Any]:
+        """Arguments of `match_file_embeddings[_batch]`, only the ones that are set"""
+        params: Dict[str, Any] = {}
+        if self.ef_search is not None:
+            params["p_ef_search"] = self.ef_search
+        if self.iterative_scan is not None:
+            params["p_iterative_scan"] = self.iterative_scan
+        return params
@@ -0,0 +1,15 @@
+from typing import Any, Dict
+import httpx
+from config import settings
+
+def http_limits() -> httpx.Limits:
+    """Connection pool limits shared by the Supabase and Gemini clients"""
+    return httpx.Limits(
+        max_connections           = settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections = settings.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry          = settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+def client_args() -> Dict[str, Any]:
+    """Keyword arguments for an `httpx.Client` using the shared pool settings"""
+    return {"limits": http_limits(), "http2": settings.HTTP2_ENABLED}
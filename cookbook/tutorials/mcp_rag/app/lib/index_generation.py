@@ -0,0 +1,76 @@
+import time
+import logging
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class IndexGeneration:
+    """
+    Polled copy of the index generation counter
+
+    The counter is bumped in the database whenever `file_embeddings` is written
+    (see `supabase/index_generation.sql`). It is re-read in a background thread
+    at most once every `poll_interval` seconds, so searches never wait for it.
+    Writes made by other processes (the standalone indexers) are therefore seen
+    up to `poll_interval` seconds plus one read later, and cached responses can
+    be that stale. Writes made by this process call `invalidate`, which stops
+    caching until the generation was read again after the write.
+    """
+
+    def __init__(self, fetch_fn: Callable[[], int], poll_interval: float = 5.0):
+        """
+        Args:
+            fetch_fn: Function reading the current generation from the database
+            poll_interval: Seconds between reads
+        """
+        self.fetch_fn      = fetch_fn
+        self.poll_interval = poll_interval
+        self.lock          = threading.Lock()
+        self.generation: Optional[int] = None
+        self.checked_at    = 0.0
+        self.refreshing    = False
+        self.writes        = 0  # Bumped by `invalidate`, a read started before a write is discarded
+        self.failed        = False
+
+    def get(self) -> Optional[int]:
+        """
+        Return the last generation read, starting a new read in the background if it is too old
+
+        Returns:
+            The generation, or None until it was read (callers should not cache then)
+        """
+        with self.lock:
+            if self.refreshing or time.monotonic() - self.checked_at < self.poll_interval:
+                return self.generation
+            # Only one read at a time, searches keep using the previous value meanwhile
+            self.refreshing = True
+            writes = self.writes
+        threading.Thread(target=self._refresh, args=(writes,), name="index-generation", daemon=True).start()
+        return self.generation
+
+    def invalidate(self) -> None:
+        """Forget the generation after a write of this process, until it is read again"""
+        with self.lock:
+            self.generation = None
+            self.checked_at = 0.0
+            self.writes    += 1
+
+    def _refresh(self, writes: int) -> None:
+        try:
+            generation = self.fetch_fn()
+            failed = False
+        except Exception as e:
+            if not self.failed:
+                logger.warning(f"Could not read the index generation, response cache disabled: {e}")
+            generation, failed = None, True
+
+        with self.lock:
+            self.refreshing = False
+            self.failed     = failed
+            if self.writes != writes:
+                # Written meanwhile, the value may predate the write: read again on the next search
+                return
+            self.generation = generation
+            self.checked_at = time.monotonic()
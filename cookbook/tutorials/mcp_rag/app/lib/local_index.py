@@ -0,0 +1,314 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from lib.file_filter import FileFilter
+
+
+class LocalIndex:
+    """
+    In-memory replica of file_embeddings with inner-product search
+
+    Vectors are kept in a float32 matrix. Small tables are searched exactly; once
+    the table has `ivf_min_rows` rows an IVF index is built by `optimize` (k-means
+    centroids, each row assigned to its closest centroid) and a query only scores
+    the rows of its `nprobe` closest centroids. Results match `match_file_embeddings`:
+    similarity is the inner product, rows at or below the threshold are dropped,
+    and at most 50 rows are returned, in (similarity desc, id) order like
+    `match_file_embeddings_page`.
+    """
+
+    def __init__(self, dimension: int, nprobe: int = 8, ivf_min_rows: int = 20_000, max_count: int = 50):
+        """
+        Args:
+            dimension: Embedding size
+            nprobe: Centroids searched per query once the IVF index is built
+            ivf_min_rows: Rows needed before building the IVF index, below that search is exact
+            max_count: Upper bound on results per query, like `least(p_match_count, 50)`
+        """
+        self.dimension    = dimension
+        self.nprobe       = nprobe
+        self.ivf_min_rows = ivf_min_rows
+        self.max_count    = max_count
+        self.lock         = threading.RLock()
+
+        # Row storage, dead rows are dropped when the IVF index is rebuilt.
+        # The arrays grow by doubling, only the first len(self.ids) rows are used.
+        self.ids: List[str]      = []
+        self.file_ids: List[str] = []
+        self.contents: List[str] = []
+        self.vectors     = np.zeros((0, dimension), dtype=np.float32)
+        self.alive       = np.zeros(0, dtype=bool)
+        self.assignments = np.zeros(0, dtype=np.int32)  # IVF list of each row, -1 if none
+        self.positions: Dict[str, int] = {}
+
+        # IVF index. While it is being rebuilt outside the lock, `moved` collects
+        # the positions of the rows replaced meanwhile, to assign them again.
+        self.centroids: Optional[np.ndarray] = None
+        self.built_rows = 0
+        self.rebuilding = False
+        self.moved: set = set()
+
+        # Rows matching each recently used file filter, rebuilt after rows are added or moved
+        self.generation = 0
+        self.filter_masks: Dict[tuple, Tuple[int, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def upsert(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Insert or replace rows
+
+        Args:
+            rows: Rows with id, file_id, content and embedding
+
+        Returns:
+            Number of rows written
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+
+        with self.lock:
+            self.generation += 1
+            new_vectors = []
+            for row in rows:
+                vector = np.asarray(row["embedding"], dtype=np.float32)
+                position = self.positions.get(row["id"])
+                if position is not None:
+                    self.file_ids[position] = row["file_id"]
+                    self.contents[position] = row["content"]
+                    self.vectors[position] = vector
+                    if self.centroids is not None:
+                        self.assignments[position] = self._assign(vector[None, :])[0]
+                    if self.rebuilding:
+                        self.moved.add(position)
+                    continue
+
+                self.positions[row["id"]] = len(self.ids)
+                self.ids.append(row["id"])
+                self.file_ids.append(row["file_id"])
+                self.contents.append(row["content"])
+                new_vectors.append(vector)
+
+            if new_vectors:
+                added = np.vstack(new_vectors)
+                end = len(self.ids)
+                start = end - len(added)
+                self._reserve(end)
+                self.vectors[start:end] = added
+                self.alive[start:end] = True
+                self.assignments[start:end] = self._assign(added) if self.centroids is not None else -1
+        return len(rows)
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """
+        Remove rows by ID
+
+        Args:
+            ids: IDs to remove, unknown IDs are ignored
+
+        Returns:
+            Number of rows removed
+        """
+        removed = 0
+        with self.lock:
+            for chunk_id in ids:
+                position = self.positions.pop(chunk_id, None)
+                if position is not None:
+                    self.alive[position] = False
+                    self.assignments[position] = -1
+                    removed += 1
+        return removed
+
+    def retain(self, ids: Iterable[str]) -> int:
+        """Remove every row whose ID is not in `ids`, returning the number removed"""
+        keep = set(ids)
+        with self.lock:
+            return self.remove([chunk_id for chunk_id in list(self.positions) if chunk_id not in keep])
+
+    def _reserve(self, size: int) -> None:
+        capacity = len(self.vectors)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 1024)
+        used = len(self.vectors)
+        vectors = np.zeros((capacity, self.dimension), dtype=np.float32)
+        alive = np.zeros(capacity, dtype=bool)
+        assignments = np.full(capacity, -1, dtype=np.int32)
+        vectors[:used], alive[:used], assignments[:used] = self.vectors, self.alive, self.assignments
+        self.vectors, self.alive, self.assignments = vectors, alive, assignments
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def optimize(self) -> None:
+        """
+        Drop deleted rows and (re)build the IVF index if the table changed enough
+
+        Called after a batch of changes rather than on every write. The index is
+        built when the table crosses `ivf_min_rows` and rebuilt when it changed
+        by more than a quarter since the last build. The k-means runs outside the
+        lock on the rows present when it starts, so searches and writes go on
+        meanwhile (with the previous index); the new index is then swapped in,
+        and the rows written in the meantime are assigned to it.
+        """
+        with self.lock:
+            if self.rebuilding:
+                return
+            size = self._maybe_rebuild()
+            if size is None:
+                return
+            self.rebuilding, self.moved = True, set()
+            # Rows are only appended or replaced in place until the swap, so this view stays valid
+            vectors = self.vectors[:size]
+
+        try:
+            centroids   = self._kmeans(vectors)
+            assignments = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+        except Exception:
+            with self.lock:
+                self.rebuilding = False
+            raise
+
+        with self.lock:
+            self.rebuilding = False
+            self.centroids = centroids
+            end = len(self.ids)
+            self.assignments[:size] = np.where(self.alive[:size], assignments, -1)
+            # Rows replaced or added during the build
+            moved = np.fromiter(self.moved, dtype=np.int64, count=len(self.moved))
+            if len(moved):
+                self.assignments[moved] = np.where(self.alive[moved], self._assign(self.vectors[moved]), -1)
+            if end > size:
+                self.assignments[size:end] = np.where(self.alive[size:end], self._assign(self.vectors[size:end]), -1)
+            self.moved = set()
+            self.built_rows = size
+
+    def _maybe_rebuild(self) -> Optional[int]:
+        """Compact the rows, returning how many the IVF index must be built on, None if it needs no build"""
+        live = len(self.positions)
+        if live < self.ivf_min_rows:
+            if self.centroids is not None or len(self.ids) > 2 * max(live, 1):
+                self._compact()
+                self.centroids = None
+                self.assignments[:] = -1
+            return None
+        if self.centroids is None or abs(len(self.ids) - self.built_rows) > self.built_rows // 4:
+            self._compact()
+            return len(self.ids)
+        return None
+
+    def _compact(self) -> None:
+        keep = np.flatnonzero(self.alive[:len(self.ids)])
+        if len(keep) == len(self.ids):
+            return
+        self.generation += 1
+        self.ids         = [self.ids[i] for i in keep]
+        self.file_ids    = [self.file_ids[i] for i in keep]
+        self.contents    = [self.contents[i] for i in keep]
+        self.vectors     = self.vectors[keep]
+        self.alive       = np.ones(len(keep), dtype=bool)
+        self.assignments = self.assignments[keep]
+        self.positions   = {chunk_id: n for n, chunk_id in enumerate(self.ids)}
+
+    def _filter_mask(self, file_filter: FileFilter) -> np.ndarray:
+        """Boolean mask of the rows whose file_id matches a filter, cached per filter"""
+        cached = self.filter_masks.get(file_filter.key())
+        if cached is not None and cached[0] == self.generation:
+            return cached[1]
+        if len(self.filter_masks) >= 64:
+            self.filter_masks.clear()
+        mask = np.fromiter((file_filter.matches(file_id) for file_id in self.file_ids), dtype=bool, count=len(self.file_ids))
+        self.filter_masks[file_filter.key()] = (self.generation, mask)
+        return mask
+
+    @staticmethod
+    def _kmeans(vectors: np.ndarray, iterations: int = 10, points_per_list: int = 64) -> np.ndarray:
+        """Spherical k-means on a sample of `points_per_list` rows per list, with about sqrt(n) lists"""
+        rng = np.random.default_rng(0)
+        size = len(vectors)
+        n_lists = max(1, min(1024, int(np.sqrt(size))))
+        sample = vectors[rng.choice(size, min(points_per_list * n_lists, size), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            # Sum the members of every list, empty lists keep their previous centroid
+            order = np.argsort(labels, kind="stable")
+            filled, starts = np.unique(labels[order], return_index=True)
+            centroids[filled] = np.add.reduceat(sample[order], starts, axis=0)
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+
+        return centroids.astype(np.float32)
+
+    def search(
+        self,
+        query_embedding : List[float],
+        match_threshold : float,
+        match_count     : int,
+        after           : Optional[Tuple[float, str]] = None,
+        file_filter     : Optional[FileFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the rows most similar to a query, like `match_file_embeddings`
+
+        Args:
+            query_embedding: Query vector
+            match_threshold: Minimum similarity (exclusive)
+            match_count: Maximum number of results
+            after: (similarity, id) of the last row of the previous page, like `match_file_embeddings_page`
+            file_filter: Only search rows whose file_id matches. Scopes of up to `ivf_min_rows`
+                rows are searched exactly, larger ones through the IVF lists
+
+        Returns:
+            Rows with id, file_id, content and similarity, best first
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        limit = min(match_count, self.max_count)
+
+        with self.lock:
+            if not self.positions or limit <= 0:
+                return []
+
+            allowed = self.alive[:len(self.ids)]
+            if file_filter is not None:
+                allowed = allowed & self._filter_mask(file_filter)
+
+            if self.centroids is not None and (file_filter is None or allowed.sum() > self.ivf_min_rows):
+                probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+                # The extra last slot is False and catches rows without a list (-1)
+                probed = np.zeros(len(self.centroids) + 1, dtype=bool)
+                probed[probes] = True
+                candidates = np.flatnonzero(probed[self.assignments[:len(self.ids)]] & allowed)
+            else:
+                candidates = np.flatnonzero(allowed)
+
+            similarities = self.vectors[candidates] @ query
+            keep = similarities > match_threshold
+            if after is not None:
+                # Only rows after the cursor: lower similarity, or the same similarity and a greater ID
+                after_similarity = np.float32(after[0])
+                keep &= similarities <= after_similarity
+                for i in np.flatnonzero(keep & (similarities == after_similarity)):
+                    keep[i] = self.ids[candidates[i]] > after[1]
+            candidates, similarities = candidates[keep], similarities[keep]
+
+            if len(candidates) > limit:
+                # Keep every row tied with the last one, the IDs decide between them below
+                cutoff = np.partition(-similarities, limit - 1)[limit - 1]
+                top = np.flatnonzero(-similarities <= cutoff)
+                candidates, similarities = candidates[top], similarities[top]
+            order = sorted(range(len(candidates)), key=lambda i: (-similarities[i], self.ids[candidates[i]]))[:limit]
+
+            return [
+                {
+                    "id"        : self.ids[candidates[i]],
+                    "file_id"   : self.file_ids[candidates[i]],
+                    "content"   : self.contents[candidates[i]],
+                    "similarity": float(similarities[i]),
+                }
+                for i in order
+            ]
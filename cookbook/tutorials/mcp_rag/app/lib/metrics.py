@@ -0,0 +1,173 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Prometheus' default buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Counter:
+    """Monotonic counter, one series per label combination"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """
+        Args:
+            name: Metric name, ending in `_total` by convention
+            documentation: HELP text
+            labelnames: Names of the labels passed to `inc`
+        """
+        self.name          = name
+        self.documentation = documentation
+        self.labelnames    = tuple(labelnames)
+        self.lock          = threading.Lock()
+        self.values: Dict[Tuple[str, ...], float] = {}
+        if not self.labelnames:
+            # Unlabelled metrics are exported as 0 before the first increment
+            self.values[()] = 0.0
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Add `amount` to the series of the given labels"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, one series per label combination"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Args:
+            name: Metric name, ending in the unit (`_seconds`) by convention
+            documentation: HELP text
+            labelnames: Names of the labels passed to `observe`
+            buckets: Upper bounds of the buckets, `+Inf` is added
+        """
+        self.name          = name
+        self.documentation = documentation
+        self.labelnames    = tuple(labelnames)
+        self.buckets       = tuple(sorted(buckets)) + (float("inf"),)
+        self.lock          = threading.Lock()
+        self.series: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts, sum, count]
+        if not self.labelnames:
+            self.series[()] = [[0] * len(self.buckets), 0.0, 0]
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record one observation in the series of the given labels"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.series.items()):
+                labels = dict(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    """Set of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: List = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format (version 0.0.4)"""
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+# Search API metrics
+REQUEST_SECONDS       = registry.histogram("search_api_request_seconds", "Time to answer an API request", ["endpoint"])
+REQUESTS              = registry.counter("search_api_requests_total", "API requests by endpoint and status code", ["endpoint", "status"])
+STAGE_SECONDS         = registry.histogram("search_stage_seconds", "Time spent in each stage of a search", ["stage"])
+STAGE_ERRORS          = registry.counter("search_stage_errors_total", "Exceptions raised by each stage of a search", ["stage"])
+CACHE_LOOKUPS         = registry.counter("search_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+EMPTY_EMBEDDINGS      = registry.counter("search_empty_embeddings_total", "Queries whose embedding failed or came back empty")
+EMBED_REQUEST_SECONDS = registry.histogram("gemini_embed_request_seconds", "Duration of Gemini embed_content calls")
+EMBED_REQUEST_ERRORS  = registry.counter("gemini_embed_request_errors_total", "Failed Gemini embed_content calls")
+EMBED_QUERY_OUTCOMES  = registry.counter(
+    "gemini_embed_query_outcomes_total",
+    "Query embedding calls by outcome: first or hedge (which attempt answered), deadline, error or rejected (circuit open)",
+    ["outcome"],
+)
+
+# Stage durations of the current request, in seconds, for the Server-Timing header
+request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Time a block as one stage of a search
+
+    The duration is recorded in `search_stage_seconds` and added to the timings
+    of the current request. Exceptions are counted in `search_stage_errors_total`
+    and re-raised.
+
+    Args:
+        stage: Stage name, e.g. "embed" or "match"
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Format stage durations as a Server-Timing header value, in milliseconds"""
+    return ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings.items())
@@ -0,0 +1,94 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a query so trivially different spellings share a cache entry
+
+    Surrounding and repeated whitespace is collapsed. Case is kept, since
+    embeddings are case-sensitive.
+
+    Args:
+        text: Raw query text
+
+    Returns:
+        Normalized query text
+    """
+    return " ".join(text.split())
+
+
+class QueryCache:
+    """Thread-safe in-process LRU cache with a per-entry time to live"""
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 3600.0):
+        """
+        Args:
+            max_entries: Number of entries to keep before evicting the least recently used
+            ttl: Seconds an entry stays valid, 0 to keep entries until evicted
+        """
+        self.max_entries = max_entries
+        self.ttl         = ttl
+        self.lock        = threading.Lock()
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Look up an entry, counting a hit or a miss
+
+        Args:
+            key: Cache key
+
+        Returns:
+            The cached value, or None if missing or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl and entry[0] < time.monotonic():
+                # Expired, drop it and count a miss
+                del self.entries[key]
+                self.stats["expired"] += 1
+                entry = None
+
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Store an entry, evicting the least recently used ones when full
+
+        Args:
+            key: Cache key
+            value: Value to cache
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl else float("inf")
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def info(self) -> Dict[str, Any]:
+        """Return the counters, current size and hit rate"""
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "size"    : len(self.entries),
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        with self.lock:
+            self.entries.clear()
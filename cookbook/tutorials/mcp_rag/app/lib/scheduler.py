@@ -0,0 +1,260 @@
+"""
+Rate-limit-aware embedding scheduler
+
+Keeps up to N embedding requests in flight on a thread pool. Each request first
+takes one unit from a requests-per-minute bucket and its estimated token count
+from a tokens-per-minute bucket, so throughput is capped by the quota rather
+than by fixed sleeps. On 429 / quota errors all workers pause, the allowed rate
+is halved and then recovers gradually as requests succeed (AIMD).
+
+Used by the indexers (mcp_rag/indexer and tsne_viz) for document embeddings.
+"""
+
+import time
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+Embedding = List[float]
+EmbedFn   = Callable[[List[str]], List[Embedding]]
+
+CHARS_PER_TOKEN = 4  # Rough local estimate, good enough for pacing
+
+
+def estimate_tokens(texts: List[str]) -> int:
+    """
+    Estimate the number of tokens in a list of texts
+
+    Args:
+        texts: Texts that will be sent in one request
+
+    Returns:
+        Approximate token count
+    """
+    return sum(len(text) // CHARS_PER_TOKEN + 1 for text in texts)
+
+
+def pack_batches(texts: List[str], max_items: int, max_tokens: int) -> List[List[int]]:
+    """
+    Pack texts into as few embedding requests as possible
+
+    Texts are placed largest first into the first request that still has room
+    (first-fit decreasing), so every request stays under both the item limit
+    and the token budget and requests come out evenly filled. A text larger
+    than the budget on its own gets a request to itself.
+
+    Args:
+        texts: Texts to embed
+        max_items: Maximum number of texts per request
+        max_tokens: Estimated token budget per request
+
+    Returns:
+        Batches of indices into `texts`, each in ascending order
+    """
+    sizes = [estimate_tokens([text]) for text in texts]
+    batches: List[List[int]] = []
+    batch_tokens: List[int] = []
+
+    for i in sorted(range(len(texts)), key=lambda i: sizes[i], reverse=True):
+        for n, batch in enumerate(batches):
+            if len(batch) < max_items and batch_tokens[n] + sizes[i] <= max_tokens:
+                batch.append(i)
+                batch_tokens[n] += sizes[i]
+                break
+        else:
+            batches.append([i])
+            batch_tokens.append(sizes[i])
+
+    return [sorted(batch) for batch in batches]
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Return True if an embedding error means we are over quota"""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code == 429:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in ("429", "resource_exhausted", "quota", "rate limit"))
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Return True if an embedding error is worth retrying"""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code == 429 or code >= 500
+    return isinstance(error, (TimeoutError, ConnectionError)) or is_rate_limit_error(error)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `per_minute` units per minute"""
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.per_minute = per_minute
+        self.capacity   = per_minute
+        self.tokens     = per_minute
+        self.scale      = 1.0
+        self.clock      = clock
+        self.sleep      = sleep
+        self.updated_at = clock()
+        self.lock       = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        rate = self.per_minute * self.scale / 60.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+
+    def acquire(self, amount: float = 1.0) -> None:
+        """Block until `amount` units are available and take them"""
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                rate = self.per_minute * self.scale / 60.0
+                wait = (amount - self.tokens) / rate
+            self.sleep(min(wait, 1.0))
+
+    def set_scale(self, scale: float) -> None:
+        """Scale the refill rate, used to back off after quota errors"""
+        with self.lock:
+            self._refill()
+            self.scale = scale
+
+
+class EmbeddingScheduler:
+    """Run embedding requests concurrently, paced by RPM/TPM buckets with adaptive backoff"""
+
+    def __init__(
+        self,
+        embed_fn            : EmbedFn,
+        max_in_flight       : int   = 4,
+        requests_per_minute : float = 1500,
+        tokens_per_minute   : float = 1_000_000,
+        max_retries         : int   = 6,
+        base_delay          : float = 1.0,
+        max_delay           : float = 60.0,
+        min_scale           : float = 0.05,
+        clock               : Callable[[], float] = time.monotonic,
+        sleep               : Callable[[float], None] = time.sleep,
+    ):
+        """
+        Args:
+            embed_fn: Function that embeds a list of texts and returns one vector per text
+            max_in_flight: Maximum number of concurrent requests
+            requests_per_minute: Request quota
+            tokens_per_minute: Token quota
+            max_retries: Retries for rate-limit and transient errors before giving up
+            base_delay: First backoff delay in seconds, doubled on every retry
+            max_delay: Upper bound for a single backoff delay
+            min_scale: Lowest fraction of the configured rate to back off to
+            clock: Monotonic time in seconds, replaceable in tests
+            sleep: Blocking sleep in seconds, replaceable in tests
+        """
+        self.embed_fn      = embed_fn
+        self.max_in_flight = max_in_flight
+        self.max_retries   = max_retries
+        self.base_delay    = base_delay
+        self.max_delay     = max_delay
+        self.min_scale     = min_scale
+        self.clock         = clock
+        self.sleep         = sleep
+
+        self.request_bucket = TokenBucket(requests_per_minute, clock, sleep)
+        self.token_bucket   = TokenBucket(tokens_per_minute, clock, sleep)
+        self.executor       = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed")
+
+        self.lock      = threading.Lock()
+        self.scale     = 1.0
+        self.resume_at = 0.0  # Shared pause after a quota error
+
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+
+    def _set_scale(self, scale: float) -> None:
+        self.scale = scale
+        self.request_bucket.set_scale(scale)
+        self.token_bucket.set_scale(scale)
+
+    def _on_rate_limited(self, delay: float) -> None:
+        with self.lock:
+            self.stats["rate_limited"] += 1
+            self._set_scale(max(self.min_scale, self.scale / 2))
+            self.resume_at = max(self.resume_at, self.clock() + delay)
+
+    def _on_success(self) -> None:
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.scale < 1.0:
+                self._set_scale(min(1.0, self.scale + 0.05))
+
+    def _wait_for_resume(self) -> None:
+        while True:
+            with self.lock:
+                wait = self.resume_at - self.clock()
+            if wait <= 0:
+                return
+            self.sleep(wait)
+
+    def _run(self, texts: List[str]) -> Optional[List[Embedding]]:
+        tokens = estimate_tokens(texts)
+
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_resume()
+            self.request_bucket.acquire(1)
+            self.token_bucket.acquire(tokens)
+
+            try:
+                embeddings = self.embed_fn(texts)
+                self._on_success()
+                return embeddings
+            except Exception as e:
+                if attempt == self.max_retries or not is_transient_error(e):
+                    print(f"Error generating embeddings for {len(texts)} texts: {e}")
+                    break
+
+                # Exponential backoff with full jitter
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                with self.lock:
+                    self.stats["retries"] += 1
+                if is_rate_limit_error(e):
+                    self._on_rate_limited(delay)
+                    print(f"Rate limited, backing off {delay:.1f}s at {self.scale:.0%} of configured rate")
+                else:
+                    self.sleep(delay)
+
+        with self.lock:
+            self.stats["failed"] += 1
+        return None
+
+    def submit(self, texts: List[str]) -> "Future[Optional[List[Embedding]]]":
+        """
+        Queue one embedding request
+
+        Args:
+            texts: Texts to embed in a single API call
+
+        Returns:
+            Future resolving to one vector per text, or None if the request failed
+        """
+        return self.executor.submit(self._run, texts)
+
+    def embed_batches(self, batches: List[List[str]]) -> List[Optional[List[Embedding]]]:
+        """
+        Embed several request batches concurrently
+
+        Args:
+            batches: List of text lists, one per API call
+
+        Returns:
+            Results in the same order as `batches`, None for failed batches
+        """
+        futures = [self.submit(texts) for texts in batches]
+        return [future.result() for future in futures]
+
+    def shutdown(self) -> None:
+        """Wait for in-flight requests and stop the worker threads"""
+        self.executor.shutdown(wait=True)
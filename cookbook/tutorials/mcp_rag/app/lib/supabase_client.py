@@ -1,12 +1,45 @@
-
+import httpx
+from typing import Optional
 from supabase import create_client, Client
 from supabase.lib.client_options import ClientOptions
 from config import settings
+from lib.http_pool import client_args
+
+# Supabase client, created by `open_pool` on app startup rather than on import
+supabase: Optional[Client] = None
+
+def open_pool() -> None:
+    """
+    Create the Supabase client, its PostgREST session using the configured connection pool
 
-supabase: Client = create_client(
+    supabase-py builds its httpx session with default pool limits, so the session
+    is replaced with a pooled one. Modules read `supabase_client.supabase` at call
+    time, so a client created on a later startup is picked up everywhere.
+    """
+    global supabase
+    client = create_client(
         settings.SUPABASE_URL,
         settings.SUPABASE_KEY,
         options=ClientOptions(
-            postgrest_client_timeout=20
+            postgrest_client_timeout=settings.SUPABASE_TIMEOUT
         ),
     )
+    session = client.postgrest.session
+    client.postgrest.session = httpx.Client(
+        base_url         = session.base_url,
+        headers          = session.headers,
+        timeout          = settings.SUPABASE_TIMEOUT,
+        follow_redirects = True,
+        **client_args(),
+    )
+    session.close()
+    supabase = client
+
+def warmup() -> None:
+    """Open a connection to PostgREST with a one-row read"""
+    supabase.table("file_embeddings").select("id").limit(1).execute()
+
+def close() -> None:
+    """Close the PostgREST session and its pooled connections"""
+    if supabase is not None:
+        supabase.postgrest.session.close()
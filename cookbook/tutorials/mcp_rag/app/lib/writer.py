@@ -0,0 +1,230 @@
+"""
+Adaptive bulk writer for Supabase upserts
+
+Rows are packed into batches by estimated JSON payload size instead of a fixed
+row count. The size target adapts: it shrinks when PostgREST times out and
+grows back slowly while writes succeed. Transient errors are retried with
+jittered exponential backoff. A batch rejected because of its rows (bad data,
+constraint violations) is split in half until the bad rows are isolated, so one
+bad row no longer drops its neighbours. Auth and schema errors fail every
+request the same way, so they abort the write with `WriteAbortedError` instead.
+
+The writer is thread-safe; run several `write` calls concurrently to keep more
+than one upsert in flight.
+"""
+
+import time
+import random
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+Row     = Dict[str, Any]
+WriteFn = Callable[[List[Row]], Any]
+
+FLOAT_JSON_BYTES = 20  # A float like -0.012345678 plus the comma
+
+# Errors no smaller batch can avoid: permission denied, bad credentials or JWT,
+# and a missing table, column or function
+AUTH_CODES   = {"42501", "28000", "28P01", "PGRST301", "PGRST302"}
+SCHEMA_CODES = {"42P01", "42703", "42883", "PGRST200", "PGRST202", "PGRST204", "PGRST205"}
+# SQLSTATE classes of errors caused by some rows of the payload: data exceptions
+# (e.g. a vector of the wrong dimension) and integrity constraint violations
+ROW_ERROR_CLASSES = ("22", "23")
+
+
+class WriteAbortedError(Exception):
+    """Raised when a write fails for a reason that no retry or smaller batch can fix"""
+
+
+def estimate_row_bytes(row: Row) -> int:
+    """
+    Estimate the JSON size of a row without serializing it
+
+    Args:
+        row: Row to be upserted
+
+    Returns:
+        Approximate payload size in bytes
+    """
+    size = 64  # Keys, quotes and braces
+    for value in row.values():
+        if isinstance(value, list):
+            size += len(value) * FLOAT_JSON_BYTES
+        else:
+            size += len(str(value).encode("utf-8"))
+    return size
+
+
+def _error_code(error: Exception) -> str:
+    return str(getattr(error, "code", "") or "")
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_fatal_error(error: Exception) -> bool:
+    """Return True if every write would fail the same way (auth or schema errors)"""
+    code = _error_code(error)
+    if code in AUTH_CODES or code in SCHEMA_CODES or _status_code(error) in (401, 403):
+        return True
+    # Without a code only the message tells, e.g. from an auth proxy in front of PostgREST
+    message = str(error).lower()
+    return not code and ("permission denied" in message or "invalid jwt" in message or "jwt expired" in message)
+
+
+def is_row_error(error: Exception) -> bool:
+    """Return True if the payload was rejected because of some of its rows"""
+    code = _error_code(error)
+    return code[:2] in ROW_ERROR_CLASSES or code == "PGRST102" or _status_code(error) in (400, 409, 422)
+
+
+def is_timeout_error(error: Exception) -> bool:
+    """Return True if the write failed because the payload took too long"""
+    code = _error_code(error)
+    message = str(error).lower()
+    return code == "57014" or "timeout" in message or "timed out" in message or "413" in message
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Return True if retrying the same write may succeed"""
+    code = _error_code(error)
+    if code in ("40001", "40P01", "53300", "08006", "08003"):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in ("502", "503", "504", "connection", "temporarily", "reset by peer"))
+
+
+class BulkWriter:
+    """Write rows in adaptively sized batches with retries and split-on-failure"""
+
+    def __init__(
+        self,
+        write_fn     : WriteFn,
+        target_bytes : int   = 2_000_000,
+        min_bytes    : int   = 100_000,
+        max_bytes    : int   = 8_000_000,
+        max_rows     : int   = 1000,
+        max_retries  : int   = 4,
+        base_delay   : float = 0.5,
+        max_delay    : float = 20.0,
+        sleep        : Callable[[float], None] = time.sleep,
+    ):
+        """
+        Args:
+            write_fn: Function writing one batch of rows, raising on failure
+            target_bytes: Initial payload size per request
+            min_bytes: Smallest payload target after timeouts
+            max_bytes: Largest payload target after successes
+            max_rows: Upper bound on rows per request regardless of size
+            max_retries: Retries for transient errors before giving up on the batch
+            base_delay: First backoff delay in seconds, doubled on every retry
+            max_delay: Upper bound for a single backoff delay
+            sleep: Blocking sleep in seconds, replaceable in tests
+        """
+        self.write_fn     = write_fn
+        self.target_bytes = target_bytes
+        self.min_bytes    = min_bytes
+        self.max_bytes    = max_bytes
+        self.max_rows     = max_rows
+        self.max_retries  = max_retries
+        self.base_delay   = base_delay
+        self.max_delay    = max_delay
+        self.sleep        = sleep
+
+        self.lock  = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "splits": 0, "rows_written": 0, "rows_failed": 0}
+
+    def _count(self, key: str, value: int = 1) -> None:
+        with self.lock:
+            self.stats[key] += value
+
+    def _on_success(self) -> None:
+        with self.lock:
+            self.target_bytes = min(self.max_bytes, int(self.target_bytes * 1.1))
+
+    def _on_timeout(self) -> None:
+        with self.lock:
+            self.target_bytes = max(self.min_bytes, self.target_bytes // 2)
+
+    def pack(self, rows: List[Row]) -> List[List[Row]]:
+        """
+        Group rows into batches close to the current payload target
+
+        Args:
+            rows: Rows to group
+
+        Returns:
+            List of batches
+        """
+        batches: List[List[Row]] = []
+        batch: List[Row] = []
+        batch_bytes = 0
+
+        for row in rows:
+            row_bytes = estimate_row_bytes(row)
+            if batch and (batch_bytes + row_bytes > self.target_bytes or len(batch) >= self.max_rows):
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(row)
+            batch_bytes += row_bytes
+
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _write_batch(self, batch: List[Row]) -> List[str]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._count("requests")
+                self.write_fn(batch)
+                self._on_success()
+                self._count("rows_written", len(batch))
+                return [row["id"] for row in batch]
+            except Exception as e:
+                if is_fatal_error(e):
+                    raise WriteAbortedError(f"Upsert of {len(batch)} rows failed, aborting the write: {e}") from e
+                if is_timeout_error(e):
+                    # Retrying the same payload would time out again, split it instead
+                    self._on_timeout()
+                    print(f"Upsert of {len(batch)} rows timed out, lowering target to {self.target_bytes:,} bytes")
+                    split = True
+                    break
+                if attempt == self.max_retries or not is_transient_error(e):
+                    # Only the rows of the payload can explain a rejection that smaller batches avoid
+                    split = is_row_error(e)
+                    if len(batch) == 1 or not split:
+                        print(f"Error upserting {len(batch)} rows starting with {batch[0]['id']}: {e}")
+                    break
+
+                # Exponential backoff with full jitter
+                self._count("retries")
+                self.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+        if len(batch) == 1 or not split:
+            self._count("rows_failed", len(batch))
+            return []
+
+        # Halve the batch to isolate the rows that fail
+        self._count("splits")
+        middle = len(batch) // 2
+        return self._write_batch(batch[:middle]) + self._write_batch(batch[middle:])
+
+    def write(self, rows: List[Row]) -> List[str]:
+        """
+        Write rows, packing, retrying and splitting as needed
+
+        Args:
+            rows: Rows to upsert, each with an "id"
+
+        Returns:
+            IDs of the rows that were written
+
+        Raises:
+            WriteAbortedError: If a request failed with an auth or schema error
+        """
+        written = []
+        for batch in self.pack(rows):
+            written.extend(self._write_batch(batch))
+        return written
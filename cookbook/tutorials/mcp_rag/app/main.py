@@ -1,5 +1,65 @@
-from fastapi import FastAPI
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
 from api.routes import router as vector_search
+from config import settings
+from lib import gemini_client, supabase_client
+from lib.metrics import REQUEST_SECONDS, REQUESTS, registry, request_timings, server_timing
+from services import local_search
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+
+async def warmup() -> None:
+    """
+    Open connections to Supabase and Gemini before the first request
+
+    Each client gets `WARMUP_REQUESTS` concurrent probes, so the first searches
+    after a deploy reuse warm connections instead of paying for TCP and TLS
+    setup. With the local search backend the replica is loaded as well.
+    Failures are logged and do not stop the app from starting.
+    """
+    probes: Dict[str, Callable[[], None]] = {
+        "supabase": supabase_client.warmup,
+        "gemini"  : gemini_client.warmup,
+    }
+    if settings.RAG_SEARCH_BACKEND == "local":
+        probes["local_index"] = local_search.ensure_synced
+
+    async def run(name: str, probe: Callable[[], None], count: int) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(asyncio.to_thread(probe) for _ in range(count))),
+                timeout=settings.WARMUP_TIMEOUT,
+            )
+            logger.info(f"Warmed up {name} in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            logger.warning(f"Warmup of {name} failed, continuing without it: {e!r}")
+
+    await asyncio.gather(*(
+        run(name, probe, 1 if name == "local_index" else settings.WARMUP_REQUESTS)
+        for name, probe in probes.items()
+    ))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Open the pooled HTTP clients and warm them up on startup, close them on shutdown"""
+    supabase_client.open_pool()
+    gemini_client.open_pool()
+    if settings.WARMUP_ENABLED:
+        await warmup()
+
+    yield
+
+    supabase_client.close()
+    gemini_client.close()
 
 
 def create_app() -> FastAPI:
@@ -13,12 +73,41 @@ def create_app() -> FastAPI:
         title="Vector Search API",
         description="API for vector search using Supabase's pgvector.",
         version="1.0.0",
+        lifespan=lifespan,
     )
 
     # Include the router for the vector search API
     app.include_router(vector_search, prefix="/api/v1", tags=["vector-search"])
 
+    @app.middleware("http")
+    async def record_timings(request: Request, call_next) -> Response:
+        """Time every request, collecting stage durations for the metrics and the Server-Timing header"""
+        timings = {}
+        token = request_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            request_timings.reset(token)
+
+        # Label by route template rather than raw path, so unknown paths share one series
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        elapsed = time.perf_counter() - start
+        REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+        REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+
+        if settings.SERVER_TIMING_ENABLED:
+            response.headers["Server-Timing"] = server_timing({**timings, "total": elapsed})
+        return response
+
+    if settings.METRICS_ENABLED:
+        @app.get("/metrics", include_in_schema=False)
+        async def metrics() -> Response:
+            """Prometheus metrics in the text exposition format"""
+            return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
     return app
 
 
-app = create_app()
\ No newline at end of file
+app = create_app()
@@ -0,0 +1,42 @@
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional
+
+# Define request models
+class IndexDocument(BaseModel):
+    file_id    : str = Field(..., min_length=1, description="Document ID, stored as file_id (e.g. its path)")
+    content    : str = Field(..., description="Full document text, split into chunks by the server")
+
+class IndexRequest(BaseModel):
+    documents  : List[IndexDocument] = Field(..., min_length=1, max_length=1000, description="Documents to index")
+    replace    : bool                = Field(True, description="Delete chunks of these documents that are no longer in their content")
+
+    @field_validator("documents")
+    @classmethod
+    def reject_duplicate_file_ids(cls, documents: List[IndexDocument]) -> List[IndexDocument]:
+        # With replace, each copy would delete the chunks of the others
+        seen, duplicates = set(), set()
+        for document in documents:
+            (duplicates if document.file_id in seen else seen).add(document.file_id)
+        if duplicates:
+            raise ValueError(f"Duplicate file_ids: {', '.join(sorted(duplicates))}")
+        return documents
+
+# Define response models
+class IndexJobResponse(BaseModel):
+    job_id              : str
+    status              : str             = Field(..., description="queued, running, completed or failed")
+    documents           : int
+    chunks_total        : int             = Field(0, description="Chunks after splitting")
+    chunks_unchanged    : int             = Field(0, description="Chunks already stored with the same content, skipped")
+    chunks_deduplicated : int             = Field(0, description="Chunks sharing their text with another chunk of the job")
+    chunks_embedded     : int             = Field(0, description="Distinct texts embedded")
+    chunks_written      : int             = Field(0, description="Rows upserted")
+    chunks_deleted      : int             = Field(0, description="Stale rows deleted")
+    chunks_failed       : int             = Field(0, description="Chunks not written because embedding or upsert failed")
+    progress            : float           = Field(0.0, description="Fraction of the chunks to write that are done")
+    elapsed_seconds     : float           = 0.0
+    chunks_per_sec      : float           = 0.0
+    created_at          : float
+    started_at          : Optional[float] = None
+    finished_at         : Optional[float] = None
+    error               : Optional[str]   = None
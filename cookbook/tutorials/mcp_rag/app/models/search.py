@@ -1,11 +1,31 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from typing import Any, List, Literal, Optional
 
-# Define request model
-class SearchRequest(BaseModel):
+# Define request models
+class SearchQuery(BaseModel):
     query           : str
     match_threshold : Optional[float] = Field(0.5, description="Similarity threshold")
-    match_count     : Optional[int]   = Field(20, description="Maximum number of results")
+    match_count     : Optional[int]   = Field(20, description="Maximum number of results (page size, at most 50)")
+    file_prefix     : Optional[str]   = Field(None, description="Only search files whose file_id starts with this, e.g. 'docs/'")
+    file_glob       : Optional[str]   = Field(None, description="Only search files whose file_id matches this glob, e.g. 'docs/**/*.md'")
+    ef_search       : Optional[int]   = Field(None, ge=1, le=1000, description="HNSW candidate list size, higher for better recall and slower searches")
+
+class SearchRequest(SearchQuery):
+    cursor          : Optional[str]   = Field(None, description="next_cursor of the previous page, to fetch the page after it")
+
+    @model_validator(mode="before")
+    @classmethod
+    def reject_iterative_scan(cls, data: Any) -> Any:
+        # Pages are always scanned in strict order, which their cursors rely on
+        if isinstance(data, dict) and data.get("iterative_scan") is not None:
+            raise ValueError("iterative_scan is not supported by /search, pages always use strict order")
+        return data
+
+class BatchSearchQuery(SearchQuery):
+    iterative_scan  : Optional[Literal["off", "relaxed_order", "strict_order"]] = Field(None, description="HNSW iterative scan mode (pgvector 0.8+)")
+
+    # Batch queries return a single page, a cursor is rejected rather than ignored
+    model_config = ConfigDict(extra="forbid")
 
 # Define response model
 class SearchResult(BaseModel):
@@ -15,4 +35,26 @@ class SearchResult(BaseModel):
     similarity : float
 
 class SearchResponse(BaseModel):
-    results    : List[SearchResult]
\ No newline at end of file
+    results     : List[SearchResult]
+    next_cursor : Optional[str] = Field(None, description="Pass as cursor to fetch the next page, null after the last page")
+
+# Define streaming request model
+class StreamSearchRequest(BaseModel):
+    query           : str
+    match_threshold : Optional[float] = Field(0.5, description="Similarity threshold")
+    max_results     : int             = Field(200, ge=1, le=10_000, description="Maximum number of results to stream")
+    page_size       : int             = Field(50, ge=1, le=50, description="Results fetched per database round trip")
+    file_prefix     : Optional[str]   = Field(None, description="Only search files whose file_id starts with this, e.g. 'docs/'")
+    file_glob       : Optional[str]   = Field(None, description="Only search files whose file_id matches this glob, e.g. 'docs/**/*.md'")
+
+# Define batch request and response models
+class BatchSearchRequest(BaseModel):
+    queries    : List[BatchSearchQuery] = Field(..., min_length=1, max_length=100, description="Queries to run, embedded in one Gemini call")
+    merge      : bool                   = Field(False, description="Also return the union of all results, deduplicated by chunk ID")
+
+class BatchQueryResults(BaseModel):
+    results    : List[SearchResult]
+
+class BatchSearchResponse(BaseModel):
+    results    : List[BatchQueryResults]
+    merged     : Optional[List[SearchResult]] = None
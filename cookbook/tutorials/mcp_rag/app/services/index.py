@@ -1,11 +1,248 @@
-
 # Indexing service
-from typing import List
-from xml.dom.minidom import Document
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+from lib import supabase_client
+from lib.gemini_client import embed_content
+from lib.chunker import split_document
+from lib.writer import BulkWriter
+from services.search import index_generation
+from models.embedding import EmbeddingTaskTypeEnum
+from config import settings
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE          = 1000  # Rows per select, the PostgREST default maximum
+FILE_ID_BATCH      = 50    # file_ids per lookup of existing chunks (sent in the URL)
+DELETE_BATCH_LIMIT = 100   # IDs per delete (sent in the URL)
+
+
+class QueueFullError(Exception):
+    """Raised when the indexing queue has no room for another job"""
+
+
+class IndexJob:
+    """One submitted batch of documents and its progress counters"""
+
+    def __init__(self, documents: List[Dict[str, str]], replace: bool):
+        self.id          = uuid.uuid4().hex
+        self.documents   = documents
+        self.replace     = replace
+        self.status      = "queued"
+        self.error: Optional[str] = None
+        self.created_at  = time.time()
+        self.started_at: Optional[float]  = None
+        self.finished_at: Optional[float] = None
+        self.lock        = threading.Lock()
+
+        self.stats = {
+            "chunks_total"        : 0,
+            "chunks_unchanged"    : 0,
+            "chunks_deduplicated" : 0,
+            "chunks_embedded"     : 0,
+            "chunks_written"      : 0,
+            "chunks_deleted"      : 0,
+            "chunks_failed"       : 0,
+        }
+        self.to_write = 0  # Chunks that need an upsert, the denominator of the progress
 
+    def count(self, key: str, value: int = 1) -> None:
+        with self.lock:
+            self.stats[key] += value
 
-def index_documents(documents: List[Document]):
+    def info(self) -> Dict[str, Any]:
+        """Return the job status, counters, progress and throughput"""
+        with self.lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            done = self.stats["chunks_written"] + self.stats["chunks_failed"]
+            if self.status == "completed":
+                progress = 1.0
+            else:
+                progress = done / self.to_write if self.to_write else 0.0
+            return {
+                "job_id"          : self.id,
+                "status"          : self.status,
+                "documents"       : len(self.documents),
+                **self.stats,
+                "progress"        : round(progress, 4),
+                "elapsed_seconds" : round(elapsed, 3),
+                "chunks_per_sec"  : round(self.stats["chunks_written"] / elapsed, 1) if elapsed else 0.0,
+                "created_at"      : self.created_at,
+                "started_at"      : self.started_at,
+                "finished_at"     : self.finished_at,
+                "error"           : self.error,
+            }
+
+
+def _write_rows(rows: List[Dict[str, Any]]) -> None:
+    supabase_client.supabase.table("file_embeddings").upsert(rows).execute()
+    # Cached search responses may not include these rows
+    index_generation.invalidate()
+
+# Batches are sized by payload, failing batches are retried and split (shared by all jobs)
+writer = BulkWriter(_write_rows)
+
+job_queue: "queue.Queue[IndexJob]" = queue.Queue(maxsize=settings.RAG_INDEX_QUEUE_SIZE)
+jobs: "OrderedDict[str, IndexJob]" = OrderedDict()
+jobs_lock = threading.Lock()
+workers: List[threading.Thread] = []
+
+def submit_job(documents: List[Dict[str, str]], replace: bool = True) -> IndexJob:
     """
-    Index documents to the vector database
+    Queue documents for background indexing
+
+    Args:
+        documents: Dictionaries with file_id and content
+        replace: Delete stored chunks of these documents that are no longer in their content
+
+    Returns:
+        The queued job
+
+    Raises:
+        QueueFullError: If RAG_INDEX_QUEUE_SIZE jobs are already waiting
     """
-    pass
+    _start_workers()
+    job = IndexJob(documents, replace)
+    try:
+        job_queue.put_nowait(job)
+    except queue.Full:
+        raise QueueFullError(f"{job_queue.qsize()} indexing jobs are already queued")
+
+    with jobs_lock:
+        jobs[job.id] = job
+        # Forget the oldest finished jobs
+        while len(jobs) > settings.RAG_INDEX_JOB_HISTORY:
+            oldest = next((key for key, old in jobs.items() if old.finished_at is not None), None)
+            if oldest is None:
+                break
+            del jobs[oldest]
+
+    logger.info(f"Queued indexing job {job.id} with {len(documents)} documents")
+    return job
+
+def get_job(job_id: str) -> Optional[IndexJob]:
+    """Return a queued, running or recently finished job"""
+    with jobs_lock:
+        return jobs.get(job_id)
+
+def _start_workers() -> None:
+    with jobs_lock:
+        while len(workers) < settings.RAG_INDEX_WORKERS:
+            worker = threading.Thread(target=_work, name=f"index-worker-{len(workers)}", daemon=True)
+            worker.start()
+            workers.append(worker)
+
+def _work() -> None:
+    while True:
+        job = job_queue.get()
+        job.status, job.started_at = "running", time.time()
+        try:
+            index_documents(job)
+            job.status = "completed"
+        except Exception as e:
+            logger.error(f"Indexing job {job.id} failed: {e}")
+            job.status, job.error = "failed", str(e)
+        finally:
+            job.finished_at = time.time()
+            job_queue.task_done()
+
+        info = job.info()
+        logger.info(
+            f"Indexing job {job.id} {job.status}: {info['chunks_written']} written, {info['chunks_unchanged']} unchanged, "
+            f"{info['chunks_deleted']} deleted, {info['chunks_failed']} failed in {info['elapsed_seconds']}s"
+        )
+
+def _existing_ids(file_ids: List[str]) -> Dict[str, str]:
+    """IDs of the rows already stored for these documents, mapped to their file_id"""
+    ids: Dict[str, str] = {}
+    for i in range(0, len(file_ids), FILE_ID_BATCH):
+        last_id = None
+        while True:
+            query = supabase_client.supabase.table("file_embeddings").select("id, file_id").in_("file_id", file_ids[i:i + FILE_ID_BATCH])
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            rows = query.order("id").limit(PAGE_SIZE).execute().data or []
+            ids.update((row["id"], row["file_id"]) for row in rows)
+            if len(rows) < PAGE_SIZE:
+                break
+            last_id = rows[-1]["id"]
+    return ids
+
+def index_documents(job: IndexJob) -> None:
+    """
+    Index the documents of a job to the vector database
+
+    Documents are split like the CLI indexer does, so chunk IDs are content
+    addressed. Chunks whose ID is already stored are unchanged and skipped,
+    identical texts are embedded once, and the rest is embedded in batches of
+    RAG_INDEX_EMBED_BATCH and upserted by the bulk writer. With `replace`, stored
+    chunks that are no longer produced by their document are deleted, but only
+    for documents whose new chunks were all written, so a failed embedding or
+    upsert never leaves a document with fewer chunks than before.
+
+    Args:
+        job: The job to run, its counters are updated as it progresses
+    """
+    chunks = []
+    for document in job.documents:
+        chunks.extend(split_document(document["content"], document["file_id"]))
+    job.count("chunks_total", len(chunks))
+
+    # Skip chunks already stored with the same content
+    existing = _existing_ids(sorted({document["file_id"] for document in job.documents}))
+    pending = [chunk for chunk in chunks if chunk["id"] not in existing]
+    job.count("chunks_unchanged", len(chunks) - len(pending))
+    with job.lock:
+        job.to_write = len(pending)
+
+    # Group identical texts (license headers, boilerplate, ...) across documents
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for chunk in pending:
+        groups.setdefault(chunk["hash"], []).append(chunk)
+    job.count("chunks_deduplicated", len(pending) - len(groups))
+
+    # Documents with a chunk that was not written keep their stale chunks
+    failed_files: Set[str] = set()
+
+    texts = list(groups)
+    batch_size = settings.RAG_INDEX_EMBED_BATCH
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        embeds = embed_content([groups[key][0]["content"] for key in batch], task_type=EmbeddingTaskTypeEnum.RETRIEVAL_DOCUMENT)
+        if len(embeds) != len(batch) or not all(embed.values for embed in embeds):
+            logger.warning(f"Indexing job {job.id}: failed to embed {len(batch)} texts")
+            job.count("chunks_failed", sum(len(groups[key]) for key in batch))
+            failed_files.update(chunk["file_id"] for key in batch for chunk in groups[key])
+            continue
+        job.count("chunks_embedded", len(batch))
+
+        # Fan each vector out to every chunk with that text and write them
+        rows = [
+            {"id": chunk["id"], "file_id": chunk["file_id"], "content": chunk["content"], "embedding": embed.values}
+            for key, embed in zip(batch, embeds)
+            for chunk in groups[key]
+        ]
+        written = set(writer.write(rows))
+        job.count("chunks_written", len(written))
+        job.count("chunks_failed", len(rows) - len(written))
+        failed_files.update(row["file_id"] for row in rows if row["id"] not in written)
+
+    if job.replace:
+        if failed_files:
+            logger.warning(f"Indexing job {job.id}: kept the stale chunks of {len(failed_files)} documents with failed chunks")
+        current = {chunk["id"] for chunk in chunks}
+        stale = sorted(
+            chunk_id for chunk_id, file_id in existing.items()
+            if chunk_id not in current and file_id not in failed_files
+        )
+        for i in range(0, len(stale), DELETE_BATCH_LIMIT):
+            sub_batch = stale[i:i + DELETE_BATCH_LIMIT]
+            supabase_client.supabase.table("file_embeddings").delete().in_("id", sub_batch).execute()
+            index_generation.invalidate()
+            job.count("chunks_deleted", len(sub_batch))
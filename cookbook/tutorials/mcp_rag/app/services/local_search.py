@@ -0,0 +1,167 @@
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from lib import supabase_client
+from lib.local_index import LocalIndex
+from lib.file_filter import FileFilter
+from config import settings
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000  # Rows per select, the PostgREST default maximum
+
+# In-process replica of file_embeddings, used when RAG_SEARCH_BACKEND=local
+local_index = LocalIndex(
+    settings.RAG_EMBEDDING_SIZE,
+    nprobe       = settings.RAG_LOCAL_NPROBE,
+    ivf_min_rows = settings.RAG_LOCAL_IVF_MIN_ROWS,
+)
+
+sync_lock  = threading.Lock()
+start_lock = threading.Lock()
+sync_state: Dict[str, Any] = {
+    "watermark"     : None,  # Latest updated_at seen
+    "synced_at"     : None,  # time.time() of the last successful sync
+    "reconciled_at" : 0.0,   # time.monotonic() of the last full ID scan
+    "syncs"         : 0,
+    "rows_synced"   : 0,
+    "rows_removed"  : 0,
+    "errors"        : 0,
+}
+sync_thread: Optional[threading.Thread] = None
+
+def _parse_embedding(value: Any) -> List[float]:
+    # PostgREST returns pgvector columns as text, e.g. "[0.1,0.2]"
+    return json.loads(value) if isinstance(value, str) else value
+
+def _fetch_changed(since: Optional[datetime]) -> int:
+    """Copy the rows updated at or after `since` (every row if None) into the local index"""
+    synced, last_id, watermark = 0, None, sync_state["watermark"]
+    while True:
+        # Keyset pagination on the primary key, so rows updated mid-scan cannot shift pages
+        query = supabase_client.supabase.table("file_embeddings").select("id, file_id, content, embedding, updated_at")
+        if since is not None:
+            query = query.gte("updated_at", since.isoformat())
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.order("id").limit(PAGE_SIZE).execute().data or []
+        if not rows:
+            break
+
+        local_index.upsert(
+            {**row, "embedding": _parse_embedding(row["embedding"])} for row in rows if row.get("embedding")
+        )
+        for row in rows:
+            updated_at = datetime.fromisoformat(row["updated_at"])
+            if watermark is None or updated_at > watermark:
+                watermark = updated_at
+        synced += len(rows)
+        last_id = rows[-1]["id"]
+        if len(rows) < PAGE_SIZE:
+            break
+
+    sync_state["watermark"] = watermark
+    return synced
+
+def _remote_count() -> int:
+    """Count the remote rows the local index can hold, rows without an embedding are not loaded"""
+    result = supabase_client.supabase.table("file_embeddings").select("id", count="exact").not_.is_("embedding", "null").limit(1).execute()
+    return result.count
+
+def _reconcile() -> int:
+    """Scan every remote ID and drop the local rows deleted upstream (or whose embedding was cleared)"""
+    ids: List[str] = []
+    last_id = None
+    while True:
+        query = supabase_client.supabase.table("file_embeddings").select("id").not_.is_("embedding", "null")
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.order("id").limit(PAGE_SIZE).execute().data or []
+        ids.extend(row["id"] for row in rows)
+        if len(rows) < PAGE_SIZE:
+            break
+        last_id = rows[-1]["id"]
+
+    sync_state["reconciled_at"] = time.monotonic()
+    return local_index.retain(ids)
+
+def sync() -> Dict[str, Any]:
+    """
+    Bring the local index up to date with file_embeddings
+
+    Rows updated since the last sync are fetched by `updated_at`, re-reading the
+    last `RAG_LOCAL_SYNC_OVERLAP` seconds to catch transactions that committed
+    late. Deletes leave no trace in `updated_at`, so the IDs are re-scanned when
+    the row counts disagree or every `RAG_LOCAL_RECONCILE_EVERY` seconds.
+
+    Returns:
+        The sync counters
+    """
+    with sync_lock:
+        watermark = sync_state["watermark"]
+        since = watermark - timedelta(seconds=settings.RAG_LOCAL_SYNC_OVERLAP) if watermark else None
+        synced = _fetch_changed(since)
+
+        removed = 0
+        reconcile_due = time.monotonic() - sync_state["reconciled_at"] > settings.RAG_LOCAL_RECONCILE_EVERY
+        if since is not None and (reconcile_due or _remote_count() != len(local_index)):
+            removed = _reconcile()
+        elif since is None:
+            # A full copy needs no reconciling
+            sync_state["reconciled_at"] = time.monotonic()
+
+        local_index.optimize()
+        sync_state["syncs"]        += 1
+        sync_state["rows_synced"]  += synced
+        sync_state["rows_removed"] += removed
+        sync_state["synced_at"]     = time.time()
+
+    if synced or removed:
+        logger.info(f"Local index synced: {synced} rows fetched, {removed} removed, {len(local_index)} total")
+    return info()
+
+def _sync_forever() -> None:
+    while True:
+        time.sleep(settings.RAG_LOCAL_SYNC_INTERVAL)
+        try:
+            sync()
+        except Exception as e:
+            sync_state["errors"] += 1
+            logger.error(f"Local index sync failed: {e}")
+
+def ensure_synced() -> None:
+    """Load the table on first use and start the background sync thread"""
+    global sync_thread
+    if sync_thread is not None:
+        return
+    with start_lock:
+        # Searches arriving during the first load wait for it instead of loading again
+        if sync_thread is None:
+            sync()
+            sync_thread = threading.Thread(target=_sync_forever, name="local-index-sync", daemon=True)
+            sync_thread.start()
+
+def match(
+    embedding   : List[float],
+    threshold   : float,
+    count       : int,
+    after       : Optional[Tuple[float, str]] = None,
+    file_filter : Optional[FileFilter] = None,
+) -> List[Dict[str, Any]]:
+    """Match one query embedding against the local index, like `match_file_embeddings[_page]`"""
+    ensure_synced()
+    return local_index.search(embedding, threshold, count, after, file_filter)
+
+def info() -> Dict[str, Any]:
+    """Return the sync counters and the index size"""
+    watermark = sync_state["watermark"]
+    return {
+        **sync_state,
+        "watermark" : watermark.isoformat() if watermark else None,
+        "rows"      : len(local_index),
+        "ivf_lists" : len(local_index.centroids) if local_index.centroids is not None else 0,
+    }
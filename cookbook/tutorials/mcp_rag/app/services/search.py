@@ -1,6 +1,17 @@
-from typing import Dict, List, Any
-from lib.supabase_client import supabase
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
+from lib import supabase_client
 from lib.gemini_client import embed_content
+from lib.query_cache import QueryCache, normalize_query
+from lib.index_generation import IndexGeneration
+from lib.cursor import encode_cursor, decode_cursor
+from lib.file_filter import FileFilter
+from lib.hnsw import HnswParams
+from lib.metrics import CACHE_LOOKUPS, EMPTY_EMBEDDINGS, timed
+from services import local_search
 from models.embedding import EmbeddingTaskTypeEnum
 from config import settings
 import pandas as pd
@@ -9,55 +20,426 @@ import logging
 # Configure logger
 logger = logging.getLogger(__name__)
 
-async def search_documents(query: str, match_threshold: float = None, match_count: int = None) -> List[Dict[str, Any]]:
+# Rows per page, like `least(p_match_count, 50)` in the match functions
+MAX_PAGE_SIZE = 50
+
+# The Gemini and Supabase clients are blocking, so searches run on a bounded
+# thread pool instead of the event loop
+executor = ThreadPoolExecutor(max_workers=settings.RAG_SEARCH_WORKERS, thread_name_prefix="search")
+
+def _fetch_generation() -> int:
+    """Read the index generation, bumped by the database on every write to file_embeddings"""
+    result = supabase_client.supabase.table("index_generation").select("generation").eq("id", 1).execute()
+    return result.data[0]["generation"]
+
+# Search responses cached per index generation, so re-indexing invalidates them
+response_cache: Optional[QueryCache] = (
+    QueryCache(settings.RAG_RESPONSE_CACHE_SIZE, settings.RAG_RESPONSE_CACHE_TTL)
+    if settings.RAG_RESPONSE_CACHE_SIZE else None
+)
+index_generation = IndexGeneration(_fetch_generation, settings.RAG_INDEX_GENERATION_POLL)
+
+def _run_in_executor(fn, *args, **kwargs) -> asyncio.Future:
+    """Run a blocking call on the search thread pool, keeping the request's context (stage timings)"""
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(executor, partial(context.run, fn, *args, **kwargs))
+
+async def search_documents_page(
+    query           : str,
+    match_threshold : float = None,
+    match_count     : int = None,
+    cursor          : Optional[str] = None,
+    file_filter     : Optional[FileFilter] = None,
+    ef_search       : int = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
     """
-    Search documents using semantic search with Gemini embeddings and Supabase pgvector
+    Search documents one page at a time
+
+    Pages hold up to 50 results in (similarity desc, id) order, all of them from
+    `match_file_embeddings_page`. A full page comes with a cursor, and passing
+    it back returns the page after it: the index scan continues after the
+    cursor instead of re-running a larger search.
 
     Args:
         query: The search query text
         match_threshold: Similarity threshold (optional, uses config default if not provided)
-        match_count: Maximum number of results to return (optional, uses config default if not provided)
+        match_count: Page size (optional, uses config default if not provided)
+        cursor: `next_cursor` of the previous page, None for the first page
+        file_filter: Only search chunks whose file_id matches (optional)
+        ef_search: HNSW candidate list size (optional, uses config default if not provided)
 
     Returns:
-        List of matching documents with id, file_id, content, and similarity score
+        Tuple of (results of the page, cursor of the next page or None when there are no more results)
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed or belongs to another query, threshold or filter
     """
-    logger.info(f"Searching documents with query: '{query}'")
+    logger.info(f"Searching documents with query: '{query}'{' after a cursor' if cursor else ''}")
 
-    # Use provided values or fall back to config defaults
     threshold = match_threshold if match_threshold is not None else settings.RAG_MATCH_THRESHOLD
     count     = match_count if match_count is not None else settings.RAG_MATCH_COUNT
+    after     = decode_cursor(cursor, _search_identity(query, file_filter), threshold)
+    # Pages always scan in strict order, which their cursors rely on
+    hnsw      = _hnsw_params(ef_search, None)
+
+    return await _run_in_executor(_search, query, threshold, count, after, file_filter, hnsw)
+
+def _hnsw_params(ef_search: Optional[int], iterative_scan: Optional[str]) -> Optional[HnswParams]:
+    """HNSW parameters of a search, each one falling back to its config default"""
+    return HnswParams.create(
+        ef_search if ef_search is not None else (settings.RAG_HNSW_EF_SEARCH or None),
+        iterative_scan if iterative_scan is not None else (settings.RAG_HNSW_ITERATIVE_SCAN or None),
+    )
+
+def _search_identity(query: str, file_filter: Optional[FileFilter]) -> str:
+    """What a cursor is bound to besides the threshold: the normalized query and the file filter"""
+    identity = normalize_query(query)
+    if file_filter is not None:
+        identity += "\x00" + repr(file_filter.key())
+    return identity
+
+def _search(
+    query       : str,
+    threshold   : float,
+    count       : int,
+    after       : Optional[Tuple[float, str]] = None,
+    file_filter : Optional[FileFilter] = None,
+    hnsw        : Optional[HnswParams] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Blocking part of `search_documents_page`: embed the query and run the match RPC
+
+    The first page comes from `match_file_embeddings_page` like the pages after
+    it, and a full page gets a cursor.
+    """
+    # Identical searches against the same index generation are answered from memory
+    generation = index_generation.get() if response_cache and after is None else None
+    cache_key  = (
+        generation, normalize_query(query), threshold, count,
+        file_filter.key() if file_filter else None, hnsw.key() if hnsw else None
+    )
+    if generation is not None:
+        cached = response_cache.get(cache_key)
+        CACHE_LOOKUPS.inc(cache="response", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            logger.info(f"Returning {len(cached[0])} cached results for query: '{query}'")
+            return list(cached[0]), cached[1]
 
     # Generate embeddings for the query
-    embeds = embed_content(query, task_type=EmbeddingTaskTypeEnum.RETRIEVAL_QUERY)
+    with timed("embed"):
+        embeds = embed_content(query, task_type=EmbeddingTaskTypeEnum.RETRIEVAL_QUERY)
 
     # If embedding failed or returned empty, return empty result
     if not embeds or not embeds[0].values:
+        EMPTY_EMBEDDINGS.inc()
         logger.warning(f"Failed to generate embeddings for query: '{query}'")
-        return []
+        return [], None
+
+    if after is not None:
+        rows, pageable = _match_page(embeds[0].values, threshold, count, after, file_filter, hnsw), True
+    else:
+        rows, pageable = _match_first_page(embeds[0].values, threshold, count, file_filter, hnsw)
+
+    # A full page may have more results after it, the cursor keeps the unrounded similarity
+    next_cursor = None
+    if pageable and rows and len(rows) >= min(count, MAX_PAGE_SIZE):
+        next_cursor = encode_cursor(_search_identity(query, file_filter), threshold, rows[-1]["similarity"], rows[-1]["id"])
 
-    # Search for matches using Supabase RPC function
-    result = supabase.rpc(
-        "match_file_embeddings",
-        params={
-            "p_query_embedding": embeds[0].values,
+    with timed("format"):
+        results = [_format_result(item) for item in rows]
+    if generation is not None:
+        response_cache.put(cache_key, (results, next_cursor))
+
+    if results:
+        logger.info(f"Found {len(results)} results for query: '{query}'")
+    else:
+        logger.info(f"No results found for query: '{query}'")
+    return results, next_cursor
+
+def _match(
+    embedding   : List[float],
+    threshold   : float,
+    count       : int,
+    file_filter : Optional[FileFilter] = None,
+    hnsw        : Optional[HnswParams] = None
+) -> List[Dict[str, Any]]:
+    """Run the match RPC for one query embedding and format the results"""
+    rows = _match_rows(embedding, threshold, count, file_filter, hnsw)
+    with timed("format"):
+        return [_format_result(item) for item in rows]
+
+def _match_rows(
+    embedding   : List[float],
+    threshold   : float,
+    count       : int,
+    file_filter : Optional[FileFilter] = None,
+    hnsw        : Optional[HnswParams] = None
+) -> List[Dict[str, Any]]:
+    """
+    Run the match RPC for one query embedding, or match locally with RAG_SEARCH_BACKEND=local
+
+    The HNSW parameters only apply to the RPC: the local backend has no HNSW
+    index, and the two-stage search sizes ef_search to its candidate pool.
+    """
+    with timed("match"):
+        if settings.RAG_SEARCH_BACKEND == "local":
+            rows = local_search.match(embedding, threshold, count, file_filter=file_filter)
+        else:
+            params = {
+                "p_query_embedding": embedding,
+                "p_match_threshold": threshold,
+                "p_match_count": count,
+                # The filters are applied inside the index scan, of the truncated index with the two-stage search
+                **(file_filter.params() if file_filter else {}),
+            }
+            if settings.RAG_RERANK_CANDIDATES:
+                # Candidates from the truncated-embedding index, reranked with the full vector
+                params["p_candidates"] = settings.RAG_RERANK_CANDIDATES
+            elif hnsw is not None:
+                params.update(hnsw.params())
+            rows = supabase_client.supabase.rpc(_rpc_name("match_file_embeddings"), params=params).execute().data or []
+    return rows
+
+# Set once the database turns out not to have match_file_embeddings_page
+page_rpc_missing = False
+
+def _match_first_page(
+    embedding   : List[float],
+    threshold   : float,
+    count       : int,
+    file_filter : Optional[FileFilter] = None,
+    hnsw        : Optional[HnswParams] = None
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Return the unformatted first page of matches, and whether pages can follow it
+
+    The first page comes from the same function as the pages after it. With
+    `match_file_embeddings`, a group of rows at the same distance (identical
+    chunks share one embedding) could be cut by its limit in any order, and
+    the rows of the group left out with a smaller ID than the last row would
+    never be returned by the (similarity, id) keyset of the later pages.
+    Without `match_file_embeddings_page` a single page is returned.
+    """
+    global page_rpc_missing
+    if not page_rpc_missing:
+        try:
+            return _match_page(embedding, threshold, count, None, file_filter, hnsw), True
+        except Exception as e:
+            # PGRST202: the function does not exist in the schema cache
+            if getattr(e, "code", None) != "PGRST202":
+                raise
+            page_rpc_missing = True
+            logger.warning(f"match_file_embeddings_page is not installed, returning single pages: {e}")
+
+    rows = _match_rows(embedding, threshold, count, file_filter, hnsw)
+    return sorted(rows, key=lambda item: (-item["similarity"], item["id"])), False
+
+def _match_page(
+    embedding   : List[float],
+    threshold   : float,
+    count       : int,
+    after       : Optional[Tuple[float, str]],
+    file_filter : Optional[FileFilter] = None,
+    hnsw        : Optional[HnswParams] = None
+) -> List[Dict[str, Any]]:
+    """Return the unformatted page of matches after a (similarity, id) cursor, None for the first page"""
+    with timed("match"):
+        if settings.RAG_SEARCH_BACKEND == "local":
+            return local_search.match(embedding, threshold, count, after, file_filter)
+
+        params = {
+            "p_query_embedding": embedding,
             "p_match_threshold": threshold,
-            "p_match_count": count,
+            "p_page_size": min(count, MAX_PAGE_SIZE),
+            "p_after_similarity": after[0] if after else None,
+            "p_after_id": after[1] if after else None,
         }
-    ).execute()
+        if file_filter is not None:
+            params.update(file_filter.params())
+        if settings.RAG_RERANK_CANDIDATES:
+            # Pages of the two-stage search, which sizes ef_search to its candidate pool
+            params["p_candidates"] = settings.RAG_RERANK_CANDIDATES
+        elif hnsw is not None and hnsw.ef_search is not None:
+            # The keyset needs strict order, only the candidate list size can be tuned
+            params["p_ef_search"] = hnsw.ef_search
+        return supabase_client.supabase.rpc("match_file_embeddings_page", params=params).execute().data or []
+
+async def stream_documents(
+    query           : str,
+    match_threshold : float = None,
+    max_results     : int = 200,
+    page_size       : int = MAX_PAGE_SIZE,
+    file_filter     : Optional[FileFilter] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield search results best first, fetching pages only as they are consumed
+
+    The query is embedded once, then `match_file_embeddings_page` is called for
+    one page at a time. A consumer that stops iterating (e.g. a client that
+    closes the connection) stops the search, no further pages are fetched.
+
+    Args:
+        query: The search query text
+        match_threshold: Similarity threshold (optional, uses config default if not provided)
+        max_results: Results to yield at most
+        page_size: Results per database round trip, at most 50
+        file_filter: Only search chunks whose file_id matches (optional)
+
+    Yields:
+        Matching documents with id, file_id, content, and similarity score
+    """
+    global page_rpc_missing
+    logger.info(f"Streaming up to {max_results} results for query: '{query}'")
+
+    threshold = match_threshold if match_threshold is not None else settings.RAG_MATCH_THRESHOLD
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+
+    with timed("embed"):
+        embeds = await _run_in_executor(embed_content, query, task_type=EmbeddingTaskTypeEnum.RETRIEVAL_QUERY)
+    if not embeds or not embeds[0].values:
+        EMPTY_EMBEDDINGS.inc()
+        logger.warning(f"Failed to generate embeddings for query: '{query}'")
+        return
+
+    after, sent = None, 0
+    while sent < max_results:
+        size = min(page_size, max_results - sent)
+        if page_rpc_missing:
+            # Without the page function only the first page can be read
+            rows = await _run_in_executor(_match_rows, embeds[0].values, threshold, size, file_filter)
+        else:
+            try:
+                rows = await _run_in_executor(_match_page, embeds[0].values, threshold, size, after, file_filter)
+            except Exception as e:
+                # PGRST202: the function does not exist in the schema cache
+                if after is not None or getattr(e, "code", None) != "PGRST202":
+                    raise
+                page_rpc_missing = True
+                logger.warning(f"match_file_embeddings_page is not installed, streaming a single page: {e}")
+                rows = await _run_in_executor(_match_rows, embeds[0].values, threshold, size, file_filter)
+
+        if not rows:
+            return
+        after = (rows[-1]["similarity"], rows[-1]["id"])
+        for item in rows:
+            yield _format_result(item)
+        sent += len(rows)
+
+        if len(rows) < size or page_rpc_missing:
+            return
+
+def _rpc_name(name: str) -> str:
+    """Name of the match function to call, the two-stage variant if RAG_RERANK_CANDIDATES is set"""
+    if settings.RAG_RERANK_CANDIDATES:
+        return name.replace("match_file_embeddings", "match_file_embeddings_mrl")
+    return name
+
+def _format_result(item: Dict[str, Any]) -> Dict[str, Any]:
+    # Format similarity score to 3 decimal places
+    if 'similarity' in item:
+        item['similarity'] = float(f"{item['similarity']:.3f}")
+    return item
+
+# Set once the database turns out not to have match_file_embeddings_batch
+batch_rpc_missing = False
+
+async def search_documents_batch(queries: List[Dict[str, Any]], merge: bool = False) -> Tuple[List[List[Dict[str, Any]]], Optional[List[Dict[str, Any]]]]:
+    """
+    Run several searches with one Gemini call and one database round trip
+
+    All queries are embedded together, then matched with the
+    `match_file_embeddings_batch` RPC. If that function is not installed,
+    the queries are matched with concurrent `match_file_embeddings` calls,
+    as are queries with file filters or their own HNSW parameters.
+
+    Args:
+        queries: Dictionaries with query, match_threshold, match_count, file_prefix, file_glob,
+            ef_search and iterative_scan (all but query optional)
+        merge: Also return the union of all results, deduplicated by chunk ID
+
+    Returns:
+        Tuple of (results per query in request order, merged results or None)
+    """
+    global batch_rpc_missing
+    logger.info(f"Searching documents with {len(queries)} queries")
+
+    # Use provided values or fall back to config defaults
+    texts      = [query["query"] for query in queries]
+    thresholds = [query.get("match_threshold") if query.get("match_threshold") is not None else settings.RAG_MATCH_THRESHOLD for query in queries]
+    counts     = [query.get("match_count") if query.get("match_count") is not None else settings.RAG_MATCH_COUNT for query in queries]
+    filters    = [FileFilter.create(query.get("file_prefix"), query.get("file_glob")) for query in queries]
+    hnsws      = [_hnsw_params(query.get("ef_search"), query.get("iterative_scan")) for query in queries]
+    default    = _hnsw_params(None, None)
+
+    # Generate embeddings for all queries in one call
+    with timed("embed"):
+        embeds = await _run_in_executor(embed_content, texts, task_type=EmbeddingTaskTypeEnum.RETRIEVAL_QUERY)
+    embeddings = [embed.values for embed in embeds] if len(embeds) == len(texts) else [[] for _ in texts]
+
+    # Queries whose embedding failed get no results
+    runnable = [i for i, embedding in enumerate(embeddings) if embedding]
+    if len(runnable) < len(texts):
+        EMPTY_EMBEDDINGS.inc(len(texts) - len(runnable))
+        logger.warning(f"Failed to generate embeddings for {len(texts) - len(runnable)} of {len(texts)} queries")
+
+    results: List[List[Dict[str, Any]]] = [[] for _ in texts]
+
+    # The batch RPC takes the unfiltered queries that use the default HNSW parameters
+    default_key = default.key() if default else None
+    own = [filters[i] is not None or (hnsws[i].key() if hnsws[i] else None) != default_key for i in range(len(texts))]
+    batched = [i for i in runnable if not own[i]]
+    if batched and not batch_rpc_missing and settings.RAG_SEARCH_BACKEND != "local":
+        try:
+            matches = await _run_in_executor(
+                _match_batch, [(embeddings[i], thresholds[i], counts[i]) for i in batched], default
+            )
+            for i, match in zip(batched, matches):
+                results[i] = match
+            runnable = [i for i in runnable if own[i]]
+        except Exception as e:
+            # PGRST202: the function does not exist in the schema cache
+            if getattr(e, "code", None) == "PGRST202":
+                batch_rpc_missing = True
+            logger.warning(f"{_rpc_name('match_file_embeddings_batch')} failed, matching queries one by one: {e}")
+
+    if runnable:
+        matches = await asyncio.gather(*(
+            _run_in_executor(_match, embeddings[i], thresholds[i], counts[i], filters[i], hnsws[i])
+            for i in runnable
+        ))
+        for i, match in zip(runnable, matches):
+            results[i] = match
+
+    merged = _merge_results(results) if merge else None
+    return results, merged
 
-    # Return the matching documents
-    if result.data:
-        # Process results directly without pandas
-        formatted_results = []
-        for item in result.data:
-            # Format similarity score to 3 decimal places
-            if 'similarity' in item:
-                item['similarity'] = float(f"{item['similarity']:.3f}")
+def _match_batch(queries: List[Tuple[List[float], float, int]], hnsw: Optional[HnswParams] = None) -> List[List[Dict[str, Any]]]:
+    """Run the multi-query match RPC, returning the results grouped per query"""
+    params: Dict[str, Any] = {
+        "p_queries": [
+            {"embedding": embedding, "match_threshold": threshold, "match_count": count}
+            for embedding, threshold, count in queries
+        ]
+    }
+    if settings.RAG_RERANK_CANDIDATES:
+        params["p_candidates"] = settings.RAG_RERANK_CANDIDATES
+    elif hnsw is not None:
+        params.update(hnsw.params())
 
-            formatted_results.append(item)
+    with timed("match"):
+        result = supabase_client.supabase.rpc(_rpc_name("match_file_embeddings_batch"), params=params).execute()
 
-        logger.info(f"Found {len(formatted_results)} results for query: '{query}'")
-        return formatted_results
+    with timed("format"):
+        grouped: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        for item in result.data or []:
+            grouped[item.pop("query_index")].append(_format_result(item))
+        return grouped
 
-    logger.info(f"No results found for query: '{query}'")
-    return []
+def _merge_results(results: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Union of the results of several queries, keeping each chunk once with its best similarity"""
+    best: Dict[str, Dict[str, Any]] = {}
+    for query_results in results:
+        for item in query_results:
+            if item["id"] not in best or item["similarity"] > best[item["id"]]["similarity"]:
+                best[item["id"]] = item
+    return sorted(best.values(), key=lambda item: item["similarity"], reverse=True)
@@ -0,0 +1,103 @@
+"""
+Search API Wired to the Offline Fakes
+
+Imports the FastAPI app from `../app` with fake credentials, and replaces Gemini
+and Supabase with `FakeGeminiClient` and `FakeSupabase`. The fake table is filled
+with synthetic rows, and `match_file_embeddings` is answered by an exact
+inner-product search over a NumPy matrix (cosine, since the vectors are unit length).
+
+Used in-process by the benchmarks through `load_app`, or served over HTTP:
+
+    LOADTEST_ROWS=5000 uvicorn fake_app:create_app --factory --port 8000
+
+`create_app` reads its settings from the LOADTEST_* environment variables.
+"""
+
+import os
+import sys
+from typing import Any, Tuple
+
+from fakes import FakeGeminiClient, FakeSupabase, fake_embedding
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app"))
+
+
+def load_app(
+    rows               : int   = 2000,
+    embed_latency      : float = 0.1,
+    db_latency         : float = 0.05,
+    seed               : int   = 0,
+    embed_tail_rate    : float = 0.0,
+    embed_tail_latency : float = 1.0,
+) -> Tuple[Any, str, FakeGeminiClient, FakeSupabase]:
+    """
+    Import the FastAPI app with fake credentials and fake backends
+
+    Settings already present in the environment (e.g. RAG_SEARCH_WORKERS) are
+    kept, so callers can tune the app before calling this.
+
+    Args:
+        rows: Synthetic rows in the fake file_embeddings table
+        embed_latency: Seconds per fake Gemini request
+        db_latency: Seconds per fake Supabase request
+        seed: Seed for the fake latency and errors
+        embed_tail_rate: Fraction of fake Gemini requests that are slow
+        embed_tail_latency: Extra seconds of the slow Gemini requests
+
+    Returns:
+        Tuple of (app, API key, fake Gemini client, fake Supabase client)
+    """
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_KEY", "e30.e30.benchmark")  # Must look like a JWT
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ.setdefault("GEMINI_MODEL_ID", "benchmark")
+    os.environ["RAG_EMBEDDING_CACHE_PATH"] = ""
+
+    # The app uses imports relative to its own directory
+    sys.path.insert(0, APP_DIR)
+    os.chdir(APP_DIR)
+    from main import app
+    from config import settings
+    import lib.gemini_client
+    import lib.supabase_client
+
+    gemini = FakeGeminiClient(
+        dimension    = settings.RAG_EMBEDDING_SIZE,
+        latency      = embed_latency,
+        tail_rate    = embed_tail_rate,
+        tail_latency = embed_tail_latency,
+        seed         = seed,
+    )
+    db = FakeSupabase(latency=0.0, seed=seed)
+    db.upsert([
+        {
+            "id": f"doc_{n}.md_{n}",
+            "file_id": f"doc_{n}.md",
+            "content": f"Synthetic row {n}",
+            "embedding": fake_embedding(f"row {n}", settings.RAG_EMBEDDING_SIZE),
+        }
+        for n in range(rows)
+    ])
+    db.latency = db_latency
+
+    lib.gemini_client.client = gemini
+    lib.supabase_client.supabase = db
+
+    # The app lifespan opens the real clients, keep the fakes instead
+    lib.gemini_client.create_client = lambda: gemini
+    lib.supabase_client.open_pool = lambda: None
+    lib.supabase_client.close = lambda: None
+    return app, settings.API_KEY, gemini, db
+
+
+def create_app():
+    """App factory for uvicorn, configured by the LOADTEST_* environment variables (see `load_app`)"""
+    app, _, _, _ = load_app(
+        rows               = int(os.getenv("LOADTEST_ROWS", 2000)),
+        embed_latency      = float(os.getenv("LOADTEST_EMBED_LATENCY", 0.1)),
+        db_latency         = float(os.getenv("LOADTEST_DB_LATENCY", 0.05)),
+        seed               = int(os.getenv("LOADTEST_SEED", 0)),
+        embed_tail_rate    = float(os.getenv("LOADTEST_EMBED_TAIL_RATE", 0.0)),
+        embed_tail_latency = float(os.getenv("LOADTEST_EMBED_TAIL_LATENCY", 1.0)),
+    )
+    return app
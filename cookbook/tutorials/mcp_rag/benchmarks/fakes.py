@@ -0,0 +1,574 @@
+"""
+Offline stand-ins for Gemini and Supabase
+
+Lets the indexers and the search API run without network access or API quota:
+
+- FakeGeminiClient answers `client.models.embed_content(...)` with deterministic
+  vectors derived from the text hash, after a configurable latency. It can also
+  raise rate-limit and server errors at a configurable rate.
+- FakeSupabase implements the subset of the supabase-py query builder that the
+  indexer and the search API use (`table().upsert().execute()`,
+  `table().delete().in_().execute()`, `rpc("match_file_embeddings[_batch|_page]", ...).execute()`,
+  and the `select().in_().gte().gt().not_.is_().order().limit()` reads of the local search
+  backend and the indexing API)
+  on top of an in-memory (or on-disk) SQLite `file_embeddings` table.
+- generate_corpus writes a synthetic markdown corpus of a given size.
+"""
+
+import os
+import re
+import time
+import json
+import random
+import hashlib
+import sqlite3
+import threading
+from array import array
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+WORDS = (
+    "vector index query embedding latency throughput chunk table search model "
+    "cluster shard replica cache batch token request response schema column row "
+    "pipeline stage worker queue retry backoff quota budget memory disk network "
+    "postgres supabase gemini markdown document section heading paragraph example"
+).split()
+
+BOILERPLATE = (
+    "<!-- Copyright (c) Example Corp. Licensed under the Apache License, Version 2.0. "
+    "You may not use this file except in compliance with the License. -->\n\n"
+)
+
+
+def fake_embedding(text: str, dimension: int) -> List[float]:
+    """
+    Return a deterministic unit vector for a text
+
+    Args:
+        text: Text to embed
+        dimension: Vector length
+
+    Returns:
+        The same vector every time for the same text and dimension
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.uniform(-1.0, 1.0) for _ in range(dimension)]
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+def _file_matches(file_id: str, prefix: Optional[str], pattern: Optional[str]) -> bool:
+    """The file filters of the match functions (`file_filter_condition` in file_scope.sql)"""
+    if prefix is not None and not file_id.startswith(prefix):
+        return False
+    return pattern is None or re.match(pattern, file_id) is not None
+
+
+class FakeAPIError(Exception):
+    """Error raised by the fakes, shaped like the errors of the real clients"""
+
+    def __init__(self, message: str, code: Any = None):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeModels:
+    """The `client.models` namespace of the fake Gemini client"""
+
+    def __init__(self, client: "FakeGeminiClient"):
+        self.client = client
+
+    def embed_content(self, model: str, contents: Any, config: Any = None) -> SimpleNamespace:
+        return self.client.embed(contents, config)
+
+
+class FakeGeminiClient:
+    """Deterministic local embedder with configurable latency and errors"""
+
+    def __init__(
+        self,
+        dimension       : int   = 768,
+        latency         : float = 0.1,
+        latency_per_text: float = 0.0,
+        jitter          : float = 0.2,
+        error_rate      : float = 0.0,
+        rate_limit_rate : float = 0.0,
+        tail_rate       : float = 0.0,
+        tail_latency    : float = 1.0,
+        seed            : int   = 0,
+    ):
+        """
+        Args:
+            dimension: Vector length when the request does not set output_dimensionality
+            latency: Seconds per request
+            latency_per_text: Extra seconds per text in the request
+            jitter: Random +/- fraction applied to the latency
+            error_rate: Fraction of requests failing with a 503
+            rate_limit_rate: Fraction of requests failing with a 429
+            tail_rate: Fraction of requests taking `tail_latency` extra seconds (slow provider tail)
+            tail_latency: Extra seconds of the slow requests
+            seed: Seed for latency jitter and error injection
+        """
+        self.dimension        = dimension
+        self.latency          = latency
+        self.latency_per_text = latency_per_text
+        self.jitter           = jitter
+        self.error_rate       = error_rate
+        self.rate_limit_rate  = rate_limit_rate
+        self.tail_rate        = tail_rate
+        self.tail_latency     = tail_latency
+
+        self.models = FakeModels(self)
+        self.rng    = random.Random(seed)
+        self.lock   = threading.Lock()
+        self.stats  = {"requests": 0, "texts": 0, "errors": 0, "rate_limited": 0}
+
+    def embed(self, contents: Any, config: Any = None) -> SimpleNamespace:
+        texts = [contents] if isinstance(contents, str) else list(contents)
+        dimension = getattr(config, "output_dimensionality", None) or self.dimension
+
+        with self.lock:
+            self.stats["requests"] += 1
+            roll = self.rng.random()
+            scale = 1.0 + self.rng.uniform(-self.jitter, self.jitter)
+            tail = self.tail_latency if self.rng.random() < self.tail_rate else 0.0
+
+        time.sleep(max(0.0, (self.latency + self.latency_per_text * len(texts)) * scale) + tail)
+
+        if roll < self.rate_limit_rate:
+            with self.lock:
+                self.stats["rate_limited"] += 1
+            raise FakeAPIError("429 RESOURCE_EXHAUSTED: Resource has been exhausted (e.g. check quota).", code=429)
+        if roll < self.rate_limit_rate + self.error_rate:
+            with self.lock:
+                self.stats["errors"] += 1
+            raise FakeAPIError("503 UNAVAILABLE: The service is currently unavailable.", code=503)
+
+        with self.lock:
+            self.stats["texts"] += len(texts)
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=fake_embedding(text, dimension)) for text in texts])
+
+
+class FakeQuery:
+    """Chainable query builder for one table"""
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db    = db
+        self.table = table
+        self.op    = None
+        self.rows: List[Dict[str, Any]] = []
+        self.ids: List[str] = []
+        self.params: Dict[str, Any] = {}
+        self.columns = "*"
+        self.filters: List[tuple] = []
+        self.order_by: List[str] = []
+        self.limit_n: Optional[int] = None
+        self.count_rows = False
+        self.negate     = False
+
+    def upsert(self, rows: List[Dict[str, Any]]) -> "FakeQuery":
+        self.op, self.rows = "upsert", rows
+        return self
+
+    def delete(self) -> "FakeQuery":
+        self.op = "delete"
+        return self
+
+    def in_(self, column: str, values: List[str]) -> "FakeQuery":
+        self.ids = list(values)
+        self.filters.append((column, "in", self.ids))
+        return self
+
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "FakeQuery":
+        self.op, self.columns, self.count_rows = "select", columns, count is not None
+        return self
+
+    def eq(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append((column, "=", value))
+        return self
+
+    def gt(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append((column, ">", value))
+        return self
+
+    def gte(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append((column, ">=", value))
+        return self
+
+    @property
+    def not_(self) -> "FakeQuery":
+        """Negate the next filter, only supported for `is_`"""
+        self.negate = True
+        return self
+
+    def is_(self, column: str, value: Optional[str]) -> "FakeQuery":
+        self.filters.append((column, "is not" if self.negate else "is", None))
+        self.negate = False
+        return self
+
+    def order(self, column: str) -> "FakeQuery":
+        self.order_by.append(column)
+        return self
+
+    def limit(self, size: int) -> "FakeQuery":
+        self.limit_n = size
+        return self
+
+    def execute(self) -> SimpleNamespace:
+        if self.op == "upsert":
+            self.db.upsert(self.rows)
+            return SimpleNamespace(data=self.rows)
+        if self.op == "delete":
+            self.db.delete(self.ids)
+            return SimpleNamespace(data=[])
+        if self.op == "select" and self.table == "index_generation":
+            # Bumped on every write, like the trigger in supabase/index_generation.sql
+            return SimpleNamespace(data=[{"id": 1, "generation": self.db.version}])
+        if self.op == "select" and self.table == "file_embeddings":
+            return self.db.select(self.columns, self.filters, self.order_by, self.limit_n, self.count_rows)
+        if self.op == "rpc" and self.table in ("match_file_embeddings", "match_file_embeddings_mrl"):
+            return SimpleNamespace(data=self.db.match(**self.params))
+        if self.op == "rpc" and self.table in ("match_file_embeddings_batch", "match_file_embeddings_mrl_batch"):
+            return SimpleNamespace(data=self.db.match_batch(**self.params))
+        if self.op == "rpc" and self.table == "match_file_embeddings_page":
+            return SimpleNamespace(data=self.db.match_page(**self.params))
+        raise FakeAPIError(f"Unsupported fake query {self.op!r}")
+
+
+class FakeSupabase:
+    """SQLite-backed stand-in for the Supabase client"""
+
+    def __init__(
+        self,
+        path            : str   = ":memory:",
+        latency         : float = 0.02,
+        bytes_per_sec   : float = 50_000_000,
+        timeout_bytes   : Optional[int] = None,
+        error_rate      : float = 0.0,
+        seed            : int   = 0,
+        short_dimension : int   = 256,
+    ):
+        """
+        Args:
+            path: SQLite file for the table, in memory by default
+            latency: Seconds per request
+            bytes_per_sec: Payload throughput, added on top of the latency
+            timeout_bytes: Payloads larger than this fail with a statement timeout (57014)
+            error_rate: Fraction of requests failing with a 503
+            seed: Seed for error injection
+            short_dimension: Dimensions of the truncated embedding used by the `_mrl` match functions
+        """
+        self.latency         = latency
+        self.bytes_per_sec   = bytes_per_sec
+        self.timeout_bytes   = timeout_bytes
+        self.error_rate      = error_rate
+        self.short_dimension = short_dimension
+
+        self.rng   = random.Random(seed)
+        self.lock  = threading.Lock()
+        self.stats = {"requests": 0, "rows_upserted": 0, "rows_deleted": 0, "bytes": 0, "errors": 0, "timeouts": 0, "matches": 0}
+
+        # Embedding matrix for `match`, rebuilt after writes
+        self.version = 0
+        self.matrix  = None
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "create table if not exists file_embeddings ("
+            "id text primary key, file_id text not null, content text, embedding blob, updated_at real)"
+        )
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Dict[str, Any]) -> FakeQuery:
+        query = FakeQuery(self, name)
+        query.op, query.params = "rpc", params
+        return query
+
+    def _request(self, payload_bytes: int) -> None:
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += payload_bytes
+            roll = self.rng.random()
+
+        time.sleep(self.latency + payload_bytes / self.bytes_per_sec)
+
+        if self.timeout_bytes is not None and payload_bytes > self.timeout_bytes:
+            with self.lock:
+                self.stats["timeouts"] += 1
+            raise FakeAPIError("canceling statement due to statement timeout", code="57014")
+        if roll < self.error_rate:
+            with self.lock:
+                self.stats["errors"] += 1
+            raise FakeAPIError("503 Service Unavailable", code="503")
+
+    def upsert(self, rows: List[Dict[str, Any]]) -> None:
+        self._request(len(json.dumps(rows)))
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "insert or replace into file_embeddings values (?, ?, ?, ?, ?)",
+                [
+                    (row["id"], row["file_id"], row["content"], array("f", row["embedding"]).tobytes() if row.get("embedding") else None, now)
+                    for row in rows
+                ]
+            )
+            self.conn.commit()
+            self.stats["rows_upserted"] += len(rows)
+            self.version += 1
+
+    def delete(self, ids: List[str]) -> None:
+        self._request(sum(len(i) for i in ids))
+        with self.lock:
+            self.conn.execute(f"delete from file_embeddings where id in ({','.join('?' * len(ids))})", ids)
+            self.conn.commit()
+            self.stats["rows_deleted"] += len(ids)
+            self.version += 1
+
+    def match(
+        self,
+        p_query_embedding : List[float],
+        p_match_threshold : float,
+        p_match_count     : int,
+        p_candidates      : Optional[int] = None,
+        p_file_prefix     : Optional[str] = None,
+        p_file_pattern    : Optional[str] = None,
+        p_ef_search       : Optional[int] = None,
+        p_iterative_scan  : Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Exact inner-product search, mirroring the `match_file_embeddings` SQL function
+
+        With `p_candidates` it mirrors `match_file_embeddings_mrl` instead: exact search over
+        the truncated embeddings, then the top `p_candidates` reranked with the full vectors.
+        The file filters are applied before the candidates and the 50-row limit, like the SQL functions.
+        The HNSW parameters are accepted and ignored, the search is always exact.
+        """
+        self._request(len(p_query_embedding) * 20)
+        return self._match(p_query_embedding, p_match_threshold, p_match_count, p_candidates, p_file_prefix, p_file_pattern)
+
+    def match_batch(
+        self,
+        p_queries        : List[Dict[str, Any]],
+        p_candidates     : Optional[int] = None,
+        p_ef_search      : Optional[int] = None,
+        p_iterative_scan : Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Multi-query search in one request, mirroring `match_file_embeddings[_mrl]_batch`"""
+        self._request(sum(len(query["embedding"]) * 20 for query in p_queries))
+        return [
+            {"query_index": n, **row}
+            for n, query in enumerate(p_queries)
+            for row in self._match(query["embedding"], query["match_threshold"], query["match_count"], p_candidates)
+        ]
+
+    def match_page(
+        self,
+        p_query_embedding  : List[float],
+        p_match_threshold  : float,
+        p_page_size        : int,
+        p_after_similarity : Optional[float] = None,
+        p_after_id         : Optional[str]   = None,
+        p_file_prefix      : Optional[str]   = None,
+        p_file_pattern     : Optional[str]   = None,
+        p_ef_search        : Optional[int]   = None,
+        p_candidates       : Optional[int]   = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Exact search for the page after a (similarity, id) cursor, mirroring `match_file_embeddings_page`
+
+        With `p_candidates`, the pages come from the pool of the `p_candidates` rows
+        nearest by truncated embedding that pass the filters, like the SQL function.
+        """
+        self._request(len(p_query_embedding) * 20)
+        pool = min(max(p_candidates, 1), 1000) if p_candidates else None
+        rows, similarities = self._similarities(p_query_embedding, pool, p_file_prefix, p_file_pattern)
+        matches = sorted(
+            (-float(similarity), row[0], row)
+            for row, similarity in zip(rows, similarities)
+            if similarity > p_match_threshold
+        )
+        if p_after_id is not None:
+            matches = [match for match in matches if match[:2] > (-p_after_similarity, p_after_id)]
+        return [
+            {"id": row[0], "file_id": row[1], "content": row[2], "similarity": -distance}
+            for distance, _, row in matches[:min(p_page_size, 50)]
+        ]
+
+    def _match(
+        self,
+        p_query_embedding : List[float],
+        p_match_threshold : float,
+        p_match_count     : int,
+        p_candidates      : Optional[int] = None,
+        p_file_prefix     : Optional[str] = None,
+        p_file_pattern    : Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        pool = min(max(p_candidates, min(p_match_count, 50)), 1000) if p_candidates else None
+        rows, similarities = self._similarities(p_query_embedding, pool, p_file_prefix, p_file_pattern)
+        # Rows at the same distance come back in no particular order from an HNSW
+        # scan, here in reverse row order so that callers cannot rely on their IDs
+        top = np.lexsort((-np.arange(len(rows)), -similarities))[:min(p_match_count, 50)]
+        return [
+            {"id": rows[i][0], "file_id": rows[i][1], "content": rows[i][2], "similarity": float(similarities[i])}
+            for i in top
+            if similarities[i] > p_match_threshold
+        ]
+
+    def _similarities(
+        self,
+        p_query_embedding : List[float],
+        pool              : Optional[int] = None,
+        p_file_prefix     : Optional[str] = None,
+        p_file_pattern    : Optional[str] = None,
+    ) -> Tuple[List[Tuple[Any, ...]], np.ndarray]:
+        """
+        Similarity of the query to every row, -inf for the rows that cannot match
+
+        Rows outside the file filters cannot match. With a `pool` size, neither
+        can the rows outside the `pool` nearest by truncated embedding among those
+        that pass the filters, like the candidates of the `_mrl` SQL functions.
+        """
+        with self.lock:
+            self.stats["matches"] += 1
+            if self.matrix is None or self.matrix[0] != self.version:
+                rows = self.conn.execute("select id, file_id, content, embedding from file_embeddings where embedding is not null").fetchall()
+                vectors = np.frombuffer(b"".join(row[3] for row in rows), dtype=np.float32).reshape(len(rows), -1 if rows else 0)
+                # Truncated, re-normalized copy, like the generated embedding_short column
+                short = vectors[:, :self.short_dimension]
+                short = short / (np.linalg.norm(short, axis=1, keepdims=True) + 1e-12)
+                self.matrix = (self.version, rows, vectors, short)
+            _, rows, vectors, short = self.matrix
+
+        if not rows:
+            return rows, np.zeros(0, dtype=np.float32)
+        query = np.asarray(p_query_embedding, dtype=np.float32)
+        keep = np.ones(len(rows), dtype=bool)
+        if p_file_prefix is not None or p_file_pattern is not None:
+            keep = np.array([_file_matches(row[1], p_file_prefix, p_file_pattern) for row in rows])
+        if pool:
+            query_short = query[:self.short_dimension] / (np.linalg.norm(query[:self.short_dimension]) + 1e-12)
+            candidates = np.argsort(-np.where(keep, short @ query_short, -np.inf))[:pool]
+            in_pool = np.zeros(len(rows), dtype=bool)
+            in_pool[candidates] = True
+            keep &= in_pool
+        return rows, np.where(keep, vectors @ query, -np.inf)
+
+    def select(
+        self,
+        columns  : str,
+        filters  : List[tuple],
+        order_by : List[str],
+        limit    : Optional[int],
+        count    : bool,
+    ) -> SimpleNamespace:
+        """
+        Read rows like PostgREST: `updated_at` as an ISO timestamp, `embedding` as pgvector text
+
+        Returns:
+            Response with `data` and, if `count` is set, the `count` of matching rows
+        """
+        names = ["id", "file_id", "content", "embedding", "updated_at"] if columns == "*" else [
+            name.strip() for name in columns.split(",")
+        ]
+        where, values = [], []
+        for column, operator, value in filters:
+            if column == "updated_at":
+                value = datetime.fromisoformat(value).timestamp()
+            if value is None:
+                where.append(f"{column} {operator} null")
+                continue
+            if operator == "in":
+                where.append(f"{column} in ({', '.join('?' * len(value)) or 'null'})")
+                values.extend(value)
+                continue
+            where.append(f"{column} {operator} ?")
+            values.append(value)
+        sql = f"from file_embeddings{' where ' + ' and '.join(where) if where else ''}"
+
+        with self.lock:
+            rows = self.conn.execute(
+                f"select {', '.join(names)} {sql}"
+                f"{' order by ' + ', '.join(order_by) if order_by else ''}"
+                f"{f' limit {limit}' if limit is not None else ''}",
+                values,
+            ).fetchall()
+            total = self.conn.execute(f"select count(*) {sql}", values).fetchone()[0] if count else None
+
+        data = []
+        for row in rows:
+            item = dict(zip(names, row))
+            if item.get("embedding") is not None:
+                item["embedding"] = json.dumps(np.frombuffer(item["embedding"], dtype=np.float32).tolist())
+            if "updated_at" in item:
+                item["updated_at"] = datetime.fromtimestamp(item["updated_at"], timezone.utc).isoformat()
+            data.append(item)
+
+        self._request(sum(len(str(value)) for item in data for value in item.values()))
+        return SimpleNamespace(data=data, count=total)
+
+    def count(self) -> int:
+        """Return the number of rows in the table"""
+        with self.lock:
+            return self.conn.execute("select count(*) from file_embeddings").fetchone()[0]
+
+
+def generate_corpus(
+    directory     : str,
+    files         : int   = 200,
+    file_bytes    : int   = 8000,
+    boilerplate   : float = 0.3,
+    subdirectories: int   = 8,
+    seed          : int   = 0,
+) -> Dict[str, int]:
+    """
+    Write a synthetic markdown corpus
+
+    Args:
+        directory: Directory to write into (created if missing)
+        files: Number of files
+        file_bytes: Approximate size of each file
+        boilerplate: Fraction of files starting with the same license header
+        subdirectories: Number of subdirectories the files are spread over
+        seed: Seed for the generated text, the same seed gives the same corpus
+
+    Returns:
+        Dictionary with the number of files and bytes written
+    """
+    rng = random.Random(seed)
+    total_bytes = 0
+
+    for n in range(files):
+        subdirectory = os.path.join(directory, f"section_{n % max(1, subdirectories)}")
+        os.makedirs(subdirectory, exist_ok=True)
+
+        parts = [BOILERPLATE] if rng.random() < boilerplate else []
+        parts.append(f"# Document {n}\n\n")
+        size = sum(len(part) for part in parts)
+        section = 0
+        while size < file_bytes:
+            if rng.random() < 0.15:
+                section += 1
+                part = f"## Section {section}\n\n"
+            elif rng.random() < 0.1:
+                part = "```python\n" + "\n".join(f"{rng.choice(WORDS)} = {rng.randint(0, 999)}" for _ in range(rng.randint(3, 10))) + "\n```\n\n"
+            else:
+                sentences = [
+                    " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize() + "."
+                    for _ in range(rng.randint(2, 6))
+                ]
+                part = " ".join(sentences) + "\n\n"
+            parts.append(part)
+            size += len(part)
+
+        text = "".join(parts)
+        with open(os.path.join(subdirectory, f"doc_{n}.md"), "w", encoding="utf-8") as f:
+            f.write(text)
+        total_bytes += len(text.encode("utf-8"))
+
+    return {"files": files, "bytes": total_bytes}
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Offline Indexer Benchmark
+
+Runs `mcp_rag/indexer/indexer.py` or `tsne_viz/indexer.py` against a synthetic
+markdown corpus, with Gemini and Supabase replaced by the local fakes in
+`fakes.py`, and reports:
+
+- files/sec and chunks/sec
+- peak RSS of the benchmark process and of its worker processes
+- time spent in each pipeline stage
+- requests, retries and errors seen by the fake backends
+
+Results can be saved as a JSON baseline and compared against later runs:
+
+    python indexer_bench.py --target mcp_rag --files 500 --save baseline.json
+    python indexer_bench.py --target mcp_rag --files 500 --baseline baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import statistics
+import subprocess
+import contextlib
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from fakes import FakeGeminiClient, FakeSupabase, generate_corpus
+
+TUTORIALS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+TARGETS = {
+    "mcp_rag": os.path.join(TUTORIALS_DIR, "mcp_rag", "indexer"),
+    "tsne"   : os.path.join(TUTORIALS_DIR, "tsne_viz"),
+}
+
+# Metrics compared against a baseline, and whether higher is better
+METRICS = {
+    "files_per_sec" : True,
+    "chunks_per_sec": True,
+    "wall_time"     : False,
+    "peak_rss_mb"   : False,
+}
+
+
+def peak_rss_mb() -> Dict[str, Optional[float]]:
+    """Return the peak resident set size of this process and of its finished children"""
+    if resource is None:
+        return {"self": None, "children": None}
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self"    : round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1),
+    }
+
+
+def load_indexer(target: str, workdir: str, cache: bool):
+    """
+    Import a target indexer with fake credentials
+
+    The indexers read their configuration and build their clients at import time,
+    so the environment is prepared first and the clients are replaced afterwards.
+    """
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_KEY", "e30.e30.benchmark")  # Must look like a JWT
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ["EMBEDDING_CACHE_FILE"] = os.path.join(workdir, "embedding_cache.db") if cache else ""
+
+    sys.path.insert(0, TARGETS[target])
+    import indexer
+    return indexer
+
+
+def run_once(indexer, target: str, args: argparse.Namespace, corpus_dir: str, workdir: str, run: int) -> Dict[str, Any]:
+    """Index the corpus once and collect the metrics"""
+    gemini = FakeGeminiClient(
+        latency=args.embed_latency,
+        latency_per_text=args.embed_latency_per_text,
+        error_rate=args.embed_error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed + run,
+    )
+    indexer.client = gemini
+    indexer.configure_scheduler(args.concurrency, args.rpm, args.tpm)
+
+    db = None
+    if target == "mcp_rag":
+        db = FakeSupabase(
+            latency=args.db_latency,
+            timeout_bytes=args.db_timeout_bytes,
+            error_rate=args.db_error_rate,
+            seed=args.seed + run,
+        )
+        indexer.supabase = db
+
+    # Time the embed step of the tsne indexer, which has no stage statistics
+    embed_time = [0.0]
+    embed_content = indexer.embed_content
+
+    def timed_embed_content(chunks):
+        start = time.perf_counter()
+        try:
+            return embed_content(chunks)
+        finally:
+            embed_time[0] += time.perf_counter() - start
+
+    indexer.embed_content = timed_embed_content
+
+    output = open(os.devnull, "w") if args.quiet else sys.stdout
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            if target == "mcp_rag":
+                result = indexer.index_markdown_files(
+                    corpus_dir,
+                    manifest_path=os.path.join(workdir, f"manifest_{run}.json"),
+                    journal_path=os.path.join(workdir, f"journal_{run}.jsonl"),
+                    processes=args.processes,
+                    upsert_workers=args.upsert_workers,
+                )
+            else:
+                indexer.OUTPUT_JSON_FILE = os.path.join(workdir, f"embeddings_{run}.json")
+                result = indexer.index_markdown_files(corpus_dir, [".md"], processes=args.processes)
+    finally:
+        wall_time = time.perf_counter() - start
+        indexer.embed_content = embed_content
+        if output is not sys.stdout:
+            output.close()
+
+    stats = result.get("stats", {})
+    if "stages" in result:
+        stages = {name: stage["busy_time"] for name, stage in result["stages"].items()}
+    else:
+        stages = {"embed": round(embed_time[0], 2)}
+
+    metrics = {
+        "status"        : result["status"],
+        "wall_time"     : round(wall_time, 3),
+        "files"         : stats.get("files_processed", 0),
+        "chunks"        : stats.get("chunks_created", 0),
+        "chunks_indexed": stats.get("chunks_indexed", 0),
+        "files_per_sec" : round(stats.get("files_processed", 0) / wall_time, 1),
+        "chunks_per_sec": round(stats.get("chunks_created", 0) / wall_time, 1),
+        "stage_time"    : stages,
+        "gemini"        : dict(gemini.stats),
+        "scheduler"     : dict(indexer.scheduler.stats),
+    }
+    if db is not None:
+        metrics["supabase"] = dict(db.stats)
+        metrics["rows_in_table"] = db.count()
+    return metrics
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Take the median of every metric over the runs"""
+    summary = dict(runs[-1])
+    for key in ("wall_time", "files_per_sec", "chunks_per_sec"):
+        summary[key] = round(statistics.median(run[key] for run in runs), 3)
+    rss = peak_rss_mb()
+    summary["peak_rss_mb"] = rss["self"]
+    summary["peak_rss_children_mb"] = rss["children"]
+    summary["runs"] = len(runs)
+    return summary
+
+
+def report(target: str, summary: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    """Print a summary, with the change against the baseline if one is given"""
+    print(f"\n== {target} ==")
+    for key in ("files", "chunks", "chunks_indexed", "wall_time", "files_per_sec", "chunks_per_sec", "peak_rss_mb", "peak_rss_children_mb"):
+        line = f"  {key:<22} {summary.get(key)}"
+        if baseline and key in METRICS and baseline.get(key) and summary.get(key) is not None:
+            change = (summary[key] - baseline[key]) / baseline[key] * 100
+            better = change > 0 if METRICS[key] else change < 0
+            line += f"  ({change:+.1f}% vs baseline, {'better' if better else 'worse'})"
+        print(line)
+    print(f"  stage time (s)         {summary['stage_time']}")
+    print(f"  gemini                 {summary['gemini']}")
+    print(f"  scheduler              {summary['scheduler']}")
+    if "supabase" in summary:
+        print(f"  supabase               {summary['supabase']}")
+        print(f"  rows_in_table          {summary['rows_in_table']}")
+
+
+def run_target(target: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Generate the corpus and benchmark one indexer in this process"""
+    workdir = tempfile.mkdtemp(prefix=f"indexer_bench_{target}_")
+    try:
+        corpus_dir = os.path.join(workdir, "corpus")
+        corpus = generate_corpus(corpus_dir, files=args.files, file_bytes=args.file_bytes, seed=args.seed)
+        print(f"Generated {corpus['files']} files ({corpus['bytes'] / 1e6:.1f} MB) in {corpus_dir}")
+
+        indexer = load_indexer(target, workdir, args.cache)
+        runs = []
+        for run in range(args.runs):
+            metrics = run_once(indexer, target, args, corpus_dir, workdir, run)
+            print(f"Run {run + 1}/{args.runs}: {metrics['files_per_sec']} files/s, {metrics['chunks_per_sec']} chunks/s in {metrics['wall_time']}s")
+            runs.append(metrics)
+        return summarize(runs)
+    finally:
+        if args.keep:
+            print(f"Kept benchmark files in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    """Main function to parse arguments and run the benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark the indexers offline with fake Gemini and Supabase backends")
+    parser.add_argument("--target", choices=[*TARGETS, "all"], default="all", help="Indexer to benchmark (default: all, each in its own process)")
+    parser.add_argument("--files", type=int, default=200, help="Number of synthetic markdown files (default: 200)")
+    parser.add_argument("--file-bytes", type=int, default=8000, help="Approximate size of each file (default: 8000)")
+    parser.add_argument("--runs", type=int, default=1, help="Repeat the run and report the median (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the corpus, latency jitter and errors (default: 0)")
+    parser.add_argument("--processes", type=int, default=0, help="Worker processes for reading and splitting (default: off)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Embedding requests in flight (default: 4)")
+    parser.add_argument("--rpm", type=float, default=1_000_000, help="Embedding requests per minute (default: effectively unlimited)")
+    parser.add_argument("--tpm", type=float, default=1e12, help="Embedding tokens per minute (default: effectively unlimited)")
+    parser.add_argument("--upsert-workers", type=int, default=2, help="Concurrent upserts, mcp_rag only (default: 2)")
+    parser.add_argument("--cache", action="store_true", help="Use a fresh embedding cache, so runs after the first hit it")
+    parser.add_argument("--embed-latency", type=float, default=0.1, help="Seconds per fake embedding request (default: 0.1)")
+    parser.add_argument("--embed-latency-per-text", type=float, default=0.001, help="Extra seconds per text in a request (default: 0.001)")
+    parser.add_argument("--embed-error-rate", type=float, default=0.0, help="Fraction of embedding requests failing with a 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of embedding requests failing with a 429")
+    parser.add_argument("--db-latency", type=float, default=0.02, help="Seconds per fake Supabase request (default: 0.02)")
+    parser.add_argument("--db-timeout-bytes", type=int, default=None, help="Fail upserts larger than this with a statement timeout")
+    parser.add_argument("--db-error-rate", type=float, default=0.0, help="Fraction of Supabase requests failing with a 503")
+    parser.add_argument("--save", help="Write the results to this JSON file as a baseline")
+    parser.add_argument("--baseline", help="Compare the results against this JSON baseline")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated corpus and outputs")
+    parser.add_argument("--verbose", dest="quiet", action="store_false", help="Show the indexer output")
+
+    args = parser.parse_args()
+
+    # The indexers share module names (chunker, indexer, ...), so each runs in its own process
+    if args.target == "all":
+        for target in TARGETS:
+            command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--target", target]
+            if subprocess.run(command).returncode != 0:
+                sys.exit(1)
+        return
+
+    summary = run_target(args.target, args)
+
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get(args.target)
+    report(args.target, summary, baseline)
+
+    if args.save:
+        # Targets run in separate processes, so merge into the existing file
+        results = {}
+        if os.path.exists(args.save):
+            with open(args.save, "r", encoding="utf-8") as f:
+                results = json.load(f)
+        results[args.target] = {**summary, "config": {k: v for k, v in vars(args).items() if k not in ("save", "baseline", "target")}}
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Search API Load Test
+
+Drives the search API at fixed concurrency levels and reports throughput,
+p50/p95/p99 latency, errors and the mean time per search stage (from
+`/metrics`). Gemini and Supabase are replaced by the fakes (see `fake_app.py`),
+so it runs offline and can gate CI:
+
+    # In-process app over an ASGI transport
+    python loadtest.py --concurrency 1 8 32
+
+    # The app under uvicorn in a subprocess, over real HTTP
+    python loadtest.py --server
+
+    # Fail (exit code 1) when a level is slower than these limits
+    python loadtest.py --max-p99-ms 1500 --min-rps 20
+
+    # Fail when throughput or p99 regress by more than 25% against a saved baseline
+    python loadtest.py --save baseline.json
+    python loadtest.py --baseline baseline.json --max-regression 0.25
+
+Scenarios:
+    search  distinct queries, every request embeds and matches
+    repeat  queries drawn from a small Zipf-distributed pool, exercising the caches
+    batch   /search/batch requests of `--batch-size` distinct queries
+    mixed   70% search, 20% repeat, 10% batch
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from fakes import WORDS
+
+BENCHMARK_DIR = os.path.abspath(os.path.dirname(__file__))
+
+# Metrics compared against a baseline, and whether higher is better
+METRICS = {"req_per_sec": True, "p50_ms": False, "p95_ms": False, "p99_ms": False}
+
+STAGE_PATTERN = re.compile(r'^search_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', re.MULTILINE)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Return the value below which `fraction` of the values fall"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Workload:
+    """Generates the requests of a scenario"""
+
+    def __init__(self, scenario: str, batch_size: int, seed: int):
+        self.scenario   = scenario
+        self.batch_size = batch_size
+        self.rng        = random.Random(seed)
+        self.sent       = 0
+        # Popular queries for the repeat scenario, the first ones far more often than the rest
+        self.pool    = [self._query() for _ in range(50)]
+        self.weights = [1 / (rank + 1) for rank in range(len(self.pool))]
+
+    def _query(self) -> str:
+        self.sent += 1
+        return f"{' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(3, 8)))} #{self.sent}"
+
+    def next(self) -> Tuple[str, Dict[str, Any]]:
+        """Return the path and JSON body of the next request"""
+        scenario = self.scenario
+        if scenario == "mixed":
+            scenario = self.rng.choices(["search", "repeat", "batch"], weights=[7, 2, 1])[0]
+
+        if scenario == "batch":
+            queries = [{"query": self._query(), "match_threshold": -1.0} for _ in range(self.batch_size)]
+            return "/api/v1/search/batch", {"queries": queries}
+        if scenario == "repeat":
+            query = self.rng.choices(self.pool, weights=self.weights)[0]
+            return "/api/v1/search", {"query": query, "match_threshold": -1.0}
+        return "/api/v1/search", {"query": self._query(), "match_threshold": -1.0}
+
+
+async def read_stages(client: httpx.AsyncClient) -> Dict[str, Tuple[float, int]]:
+    """Read the per-stage (total seconds, count) from /metrics, empty if metrics are disabled"""
+    try:
+        response = await client.get("/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return {}
+
+    stages: Dict[str, List[float]] = {}
+    for kind, stage, value in STAGE_PATTERN.findall(response.text):
+        stages.setdefault(stage, [0.0, 0])[0 if kind == "sum" else 1] = float(value)
+    return {stage: (total, int(count)) for stage, (total, count) in stages.items()}
+
+
+async def run_level(client: httpx.AsyncClient, api_key: str, workload: Workload, concurrency: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run one level: `concurrency` workers sending requests back to back
+
+    The level ends after `--requests` requests, or after `--duration` seconds if set.
+    """
+    latencies: List[float] = []
+    errors = 0
+    sent = 0
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    async def worker() -> None:
+        nonlocal errors, sent
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    return
+            elif sent >= args.requests:
+                return
+            sent += 1
+
+            path, body = workload.next()
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=body, headers={"X-API-Key": api_key})
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    stages_before = await read_stages(client)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stages_after = await read_stages(client)
+
+    # Mean time per stage during this level
+    stage_ms = {}
+    for stage, (total, count) in stages_after.items():
+        total_before, count_before = stages_before.get(stage, (0.0, 0))
+        if count > count_before:
+            stage_ms[stage] = round((total - total_before) / (count - count_before) * 1000, 2)
+
+    return {
+        "concurrency" : concurrency,
+        "requests"    : len(latencies),
+        "errors"      : errors,
+        "req_per_sec" : round(len(latencies) / elapsed, 1),
+        "p50_ms"      : round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms"      : round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms"      : round(percentile(latencies, 0.99) * 1000, 1),
+        "stage_ms"    : stage_ms,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args: argparse.Namespace, api_key: str) -> Tuple[subprocess.Popen, str]:
+    """Start `fake_app:create_app` under uvicorn and wait until it answers"""
+    port = free_port()
+    env = {
+        **os.environ,
+        "API_KEY"                     : api_key,
+        "LOADTEST_ROWS"               : str(args.rows),
+        "LOADTEST_EMBED_LATENCY"      : str(args.embed_latency),
+        "LOADTEST_DB_LATENCY"         : str(args.db_latency),
+        "LOADTEST_SEED"               : str(args.seed),
+        "LOADTEST_EMBED_TAIL_RATE"    : str(args.embed_tail_rate),
+        "LOADTEST_EMBED_TAIL_LATENCY" : str(args.embed_tail_latency),
+    }
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "fake_app:create_app", "--factory",
+            "--app-dir", BENCHMARK_DIR, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+        ],
+        env=env,
+    )
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+        try:
+            httpx.get(f"{base_url}/docs", timeout=1)
+            return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("uvicorn did not start within 60s")
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    process = None
+    if args.server:
+        api_key = os.getenv("API_KEY", "loadtest")
+        process, base_url = start_server(args, api_key)
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    else:
+        import fake_app
+        app, api_key, _, _ = fake_app.load_app(
+            args.rows, args.embed_latency, args.db_latency, args.seed,
+            embed_tail_rate=args.embed_tail_rate, embed_tail_latency=args.embed_tail_latency,
+        )
+        transport, base_url = httpx.ASGITransport(app=app), "http://loadtest"
+
+    try:
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits, timeout=60) as client:
+            results = []
+            for n, concurrency in enumerate(args.concurrency):
+                workload = Workload(args.scenario, args.batch_size, seed=args.seed + n)
+                result = await run_level(client, api_key, workload, concurrency, args)
+                stages = " ".join(f"{stage}={ms}" for stage, ms in sorted(result["stage_ms"].items()))
+                print(
+                    f"{result['concurrency']:>11} {result['requests']:>8} {result['req_per_sec']:>8} "
+                    f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8} {result['errors']:>6}  {stages}"
+                )
+                results.append(result)
+            return results
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def check(results: List[Dict[str, Any]], baseline: Optional[List[Dict[str, Any]]], args: argparse.Namespace) -> List[str]:
+    """Return the failed checks: errors, absolute limits and regressions against the baseline"""
+    failures = []
+    baseline_levels = {level["concurrency"]: level for level in baseline or []}
+
+    for result in results:
+        level = f"concurrency {result['concurrency']}"
+        if result["errors"] > args.max_errors:
+            failures.append(f"{level}: {result['errors']} errors (max {args.max_errors})")
+        if args.max_p99_ms is not None and result["p99_ms"] > args.max_p99_ms:
+            failures.append(f"{level}: p99 {result['p99_ms']} ms over {args.max_p99_ms} ms")
+        if args.min_rps is not None and result["req_per_sec"] < args.min_rps:
+            failures.append(f"{level}: {result['req_per_sec']} req/s under {args.min_rps} req/s")
+
+        previous = baseline_levels.get(result["concurrency"])
+        if previous is None:
+            continue
+        for key, higher_is_better in METRICS.items():
+            if not previous.get(key):
+                continue
+            change = (result[key] - previous[key]) / previous[key]
+            worse = -change if higher_is_better else change
+            if worse > args.max_regression:
+                failures.append(f"{level}: {key} {previous[key]} -> {result[key]} ({change * 100:+.1f}%)")
+    return failures
+
+
+def main():
+    """Main function to parse arguments and run the load test"""
+    parser = argparse.ArgumentParser(description="Load test the search API offline, with fake Gemini and Supabase backends")
+    parser.add_argument("--scenario", choices=["search", "repeat", "batch", "mixed"], default="search", help="Request mix (default: search)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Concurrent workers per level (default: 1 8 32)")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per level (default: 200)")
+    parser.add_argument("--duration", type=float, help="Seconds per level, instead of a request count")
+    parser.add_argument("--batch-size", type=int, default=8, help="Queries per batch request (default: 8)")
+    parser.add_argument("--server", action="store_true", help="Serve the app with uvicorn in a subprocess instead of in-process")
+    parser.add_argument("--rows", type=int, default=2000, help="Rows in the fake file_embeddings table (default: 2000)")
+    parser.add_argument("--embed-latency", type=float, default=0.1, help="Seconds per fake embedding request (default: 0.1)")
+    parser.add_argument("--db-latency", type=float, default=0.05, help="Seconds per fake Supabase request (default: 0.05)")
+    parser.add_argument("--embed-tail-rate", type=float, default=0.0, help="Fraction of fake embedding requests that are slow (default: 0)")
+    parser.add_argument("--embed-tail-latency", type=float, default=1.0, help="Extra seconds of the slow embedding requests (default: 1.0)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for queries and fake latency (default: 0)")
+    parser.add_argument("--max-errors", type=int, default=0, help="Failed requests allowed per level (default: 0)")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if a level's p99 latency is above this")
+    parser.add_argument("--min-rps", type=float, help="Fail if a level's throughput is below this")
+    parser.add_argument("--save", help="Write the results to this JSON file as a baseline")
+    parser.add_argument("--baseline", help="Compare the results against this JSON baseline")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed relative regression against the baseline (default: 0.25)")
+
+    args = parser.parse_args()
+
+    print(f"{'concurrency':>11} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}  mean ms per stage")
+    results = asyncio.run(run(args))
+
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get(args.scenario)
+
+    if args.save:
+        saved = {}
+        if os.path.exists(args.save):
+            with open(args.save, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        saved[args.scenario] = results
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(saved, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+    failures = check(results, baseline, args)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Two-Stage (Matryoshka) Search Recall Benchmark
+
+Measures what `match_file_embeddings_mrl` trades away: for each truncated
+dimension and candidate pool size, the recall@k of "search the truncated,
+re-normalized vectors, then rerank the candidates with the full vectors"
+against an exact full-dimension search, along with the time per query of both
+(brute force in NumPy) and the size of the truncated vectors.
+
+Synthetic vectors mimic Matryoshka embeddings (clustered, with most of the
+variance in the leading dimensions). For numbers that carry over to production,
+export real embeddings from file_embeddings to a .npy file (n x 768) and pass
+them with --embeddings:
+
+    python mrl_bench.py
+    python mrl_bench.py --embeddings embeddings.npy --dims 128 256 --candidates 100 200 400
+
+Pick the smallest dimension and pool whose recall is acceptable, then set the
+dimension in `supabase/match_file_embeddings_mrl.sql` and the pool with
+`RAG_RERANK_CANDIDATES`.
+"""
+
+import time
+import argparse
+from typing import Tuple
+
+import numpy as np
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12)
+
+
+def synthetic_embeddings(rows: int, dimension: int, clusters: int, seed: int) -> np.ndarray:
+    """Clustered unit vectors whose per-dimension scale decays like 1/sqrt(rank)"""
+    rng = np.random.default_rng(seed)
+    scale = 1 / np.sqrt(np.arange(1, dimension + 1, dtype=np.float32))
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    points = centers[rng.integers(0, clusters, rows)] + 0.6 * rng.standard_normal((rows, dimension)).astype(np.float32)
+    return normalize(points * scale).astype(np.float32)
+
+
+def make_queries(vectors: np.ndarray, count: int, seed: int) -> np.ndarray:
+    """Perturbed copies of random rows, so every query has close neighbours"""
+    rng = np.random.default_rng(seed + 1)
+    picked = vectors[rng.integers(0, len(vectors), count)]
+    noise = 0.3 * rng.standard_normal(picked.shape).astype(np.float32) / np.sqrt(vectors.shape[1])
+    return normalize(picked + noise).astype(np.float32)
+
+
+def exact(vectors: np.ndarray, queries: np.ndarray, k: int) -> Tuple[np.ndarray, float]:
+    """Top k rows per query by full inner product, and seconds per query"""
+    start = time.perf_counter()
+    top = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    return top, (time.perf_counter() - start) / len(queries)
+
+
+def two_stage(vectors: np.ndarray, short: np.ndarray, queries: np.ndarray, k: int, candidates: int) -> Tuple[np.ndarray, float]:
+    """Top k rows per query after a truncated pass and a full rerank, and seconds per query"""
+    dimension = short.shape[1]
+    start = time.perf_counter()
+    queries_short = normalize(queries[:, :dimension])
+    pool = np.argpartition(-(queries_short @ short.T), min(candidates, len(short) - 1), axis=1)[:, :candidates]
+    reranked = np.einsum("qcd,qd->qc", vectors[pool], queries)
+    top = np.take_along_axis(pool, np.argsort(-reranked, axis=1)[:, :k], axis=1)
+    return top, (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    """Main function to parse arguments and run the benchmark"""
+    parser = argparse.ArgumentParser(description="Recall and speed of two-stage Matryoshka search against exact search")
+    parser.add_argument("--embeddings", help="Real embeddings as a .npy file (n x dimension), instead of synthetic ones")
+    parser.add_argument("--rows", type=int, default=50_000, help="Synthetic rows (default: 50000)")
+    parser.add_argument("--dimension", type=int, default=768, help="Synthetic dimension (default: 768)")
+    parser.add_argument("--clusters", type=int, default=500, help="Synthetic clusters (default: 500)")
+    parser.add_argument("--queries", type=int, default=200, help="Queries (default: 200)")
+    parser.add_argument("--k", type=int, default=10, help="Results per query, recall@k (default: 10)")
+    parser.add_argument("--dims", type=int, nargs="+", default=[64, 128, 256], help="Truncated dimensions (default: 64 128 256)")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[50, 100, 200, 400], help="Candidate pool sizes (default: 50 100 200 400)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed (default: 0)")
+
+    args = parser.parse_args()
+
+    if args.embeddings:
+        vectors = normalize(np.load(args.embeddings).astype(np.float32))
+    else:
+        vectors = synthetic_embeddings(args.rows, args.dimension, args.clusters, args.seed)
+    queries = make_queries(vectors, args.queries, args.seed)
+
+    truth, exact_seconds = exact(vectors, queries, args.k)
+    print(f"{len(vectors)} rows x {vectors.shape[1]} dims, exact search {exact_seconds * 1000:.2f} ms/query")
+    print(f"{'dims':>5} {'size':>6} {'candidates':>10} {f'recall@{args.k}':>10} {'ms/query':>9} {'speedup':>8}")
+
+    for dimension in args.dims:
+        short = normalize(vectors[:, :dimension]).astype(np.float32)
+        for candidates in args.candidates:
+            found, seconds = two_stage(vectors, short, queries, args.k, candidates)
+            recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(found, truth)])
+            print(
+                f"{dimension:>5} {dimension / vectors.shape[1]:>6.0%} {candidates:>10} {recall:>10.3f} "
+                f"{seconds * 1000:>9.2f} {exact_seconds / seconds:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
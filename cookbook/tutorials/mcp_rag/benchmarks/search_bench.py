@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Search API Concurrency Benchmark
+
+Sends `/api/v1/search` requests at increasing numbers of requests in flight and
+reports requests/sec and latency percentiles for each level. With a
+non-blocking search path, requests/sec should grow with the number in flight
+until the search thread pool (`RAG_SEARCH_WORKERS`) is saturated.
+
+By default the app runs in-process with Gemini and Supabase replaced by the
+fakes in `fakes.py`, so no network access or API quota is needed:
+
+    python search_bench.py --levels 1 2 4 8 16 32 64
+
+Use `--url` to benchmark a running server instead:
+
+    python search_bench.py --url http://localhost:8000 --api-key $API_KEY
+"""
+
+import os
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+import fake_app
+from fakes import WORDS
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Return the value below which `fraction` of the values fall"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def make_queries(count: int, seed: int) -> List[str]:
+    """Generate distinct queries, so no request is answered from a cache"""
+    rng = random.Random(seed)
+    return [f"{' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 8)))} #{n}" for n in range(count)]
+
+
+def load_app(args: argparse.Namespace):
+    """Import the app with fake backends, see `fake_app.load_app`"""
+    os.environ["RAG_SEARCH_BACKEND"] = args.backend
+    if args.workers:
+        os.environ["RAG_SEARCH_WORKERS"] = str(args.workers)
+    return fake_app.load_app(args.rows, args.embed_latency, args.db_latency, args.seed)
+
+
+async def run_level(client: httpx.AsyncClient, api_key: str, queries: List[str], in_flight: int) -> Dict[str, Any]:
+    """Send every query with at most `in_flight` requests outstanding"""
+    semaphore = asyncio.Semaphore(in_flight)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(query: str) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    "/api/v1/search",
+                    json={"query": query, "match_threshold": -1.0, "match_count": 4},
+                    headers={"X-API-Key": api_key},
+                )
+                response.raise_for_status()
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "in_flight"   : in_flight,
+        "requests"    : len(queries),
+        "errors"      : errors,
+        "req_per_sec" : round(len(queries) / elapsed, 1),
+        "p50_ms"      : round(statistics.median(latencies) * 1000, 1),
+        "p95_ms"      : round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms"      : round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    gemini = None
+    if args.url:
+        transport: Optional[httpx.AsyncBaseTransport] = None
+        base_url, api_key = args.url, args.api_key
+    else:
+        app, api_key, gemini, db = load_app(args)
+        transport, base_url = httpx.ASGITransport(app=app), "http://benchmark"
+
+    limits = httpx.Limits(max_connections=max(args.levels), max_keepalive_connections=max(args.levels))
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits, timeout=60) as client:
+        results = []
+        for n, in_flight in enumerate(args.levels):
+            queries = make_queries(max(args.requests, in_flight * 4), seed=args.seed + n)
+            calls_before = gemini.stats["requests"] if gemini else 0
+            result = await run_level(client, api_key, queries, in_flight)
+            result["embed_calls"] = gemini.stats["requests"] - calls_before if gemini else None
+            print(
+                f"{result['in_flight']:>9} {result['req_per_sec']:>10} {result['p50_ms']:>9} "
+                f"{result['p95_ms']:>9} {result['p99_ms']:>9} {result['errors']:>7} {str(result['embed_calls']):>12}"
+            )
+            results.append(result)
+    return results
+
+
+def main():
+    """Main function to parse arguments and run the benchmark"""
+    parser = argparse.ArgumentParser(description="Measure search requests/sec at increasing concurrency")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="Requests in flight to test (default: 1 2 4 8 16 32)")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per level, at least 4x the level (default: 64)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for queries and fake latency (default: 0)")
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app with fakes")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY", ""), help="X-API-Key for --url (default: $API_KEY)")
+    parser.add_argument("--backend", choices=["supabase", "local"], default="supabase", help="RAG_SEARCH_BACKEND of the in-process app (default: supabase)")
+    parser.add_argument("--workers", type=int, help="Override RAG_SEARCH_WORKERS for the in-process app")
+    parser.add_argument("--rows", type=int, default=2000, help="Rows in the fake file_embeddings table (default: 2000)")
+    parser.add_argument("--embed-latency", type=float, default=0.1, help="Seconds per fake embedding request (default: 0.1)")
+    parser.add_argument("--db-latency", type=float, default=0.05, help="Seconds per fake Supabase request (default: 0.05)")
+
+    args = parser.parse_args()
+
+    print(f"{'in_flight':>9} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'embed calls':>12}")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
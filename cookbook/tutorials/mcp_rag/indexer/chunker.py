@@ -0,0 +1,80 @@
+"""
+Reading and splitting of markdown files
+
+Kept free of API clients and other import-time side effects so the functions
+can run in worker processes (see `init_worker` and `read_and_split`).
+"""
+
+import os
+from typing import List, Dict, Any, Optional
+
+from lib.chunker import content_hash, get_text_splitter, split_document
+
+def init_worker() -> None:
+    """Process pool initializer, builds the splitter before the first file arrives"""
+    get_text_splitter()
+
+def read_markdown_file(file_path: str) -> str:
+    """
+    Read a markdown file and return its contents
+
+    Args:
+        file_path: Path to the markdown file
+
+    Returns:
+        String content of the markdown file
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except Exception as e:
+        print(f"Error reading file {file_path}: {e}")
+        return ""
+
+def get_file_id(file_path: str) -> str:
+    """
+    Get the file_id stored in Supabase for a file path
+
+    Args:
+        file_path: Path to the file
+
+    Returns:
+        Relative path with forward slashes
+    """
+    return os.path.relpath(file_path).replace("\\", "/")
+
+def split_text(text: str, file_path: str) -> List[Dict[str, Any]]:
+    """
+    Split text into chunks and prepare for embedding
+
+    Args:
+        text: Text content to split
+        file_path: Original file path for tracking
+
+    Returns:
+        List of dictionaries with chunk information
+    """
+    # Same chunks and IDs as the indexing API (app/lib/chunker.py)
+    return split_document(text, get_file_id(file_path))
+
+def read_and_split(file_path: str, skip_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Read, hash and split one file, suitable for running in a process pool
+
+    Args:
+        file_path: Path to the markdown file
+        skip_hash: Content hash from the previous run; if it matches, the file is not split
+
+    Returns:
+        Dictionary with the file path, content hash and chunks
+        (chunks is None if the file was unreadable or unchanged)
+    """
+    content = read_markdown_file(file_path)
+    if not content:
+        return {"file_path": file_path, "hash": None, "chunks": None}
+
+    file_hash = content_hash(content)
+    if file_hash == skip_hash:
+        return {"file_path": file_path, "hash": file_hash, "chunks": None}
+
+    return {"file_path": file_path, "hash": file_hash, "chunks": split_text(content, file_path)}
@@ -7,6 +7,12 @@ This script:
 2. Splits them into chunks using RecursiveCharacterTextSplitter
 3. Generates embeddings using Gemini
 4. Uploads the embeddings to Supabase for vector search
+
+The steps run as overlapping pipeline stages connected by bounded queues.
+
+With --incremental, a local manifest of file and chunk content hashes is used
+to skip unchanged files, embed only new or changed chunks and delete rows for
+chunks that disappeared.
 """
 
 import os
@@ -14,7 +20,10 @@ import sys
 import glob
 import time
 import argparse
-from typing import List, Dict, Any
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import List, Dict, Any, Optional
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -22,17 +31,48 @@ from google import genai
 from google.genai.types import ContentEmbedding, EmbedContentConfig
 from supabase import create_client, Client
 from supabase.lib.client_options import ClientOptions
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Modules shared with the search API live in its `lib` package
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from manifest import Manifest
+from chunker import get_file_id, init_worker, read_and_split
+from lib.chunker import CHUNK_SIZE, CHUNK_OVERLAP
+from lib.scheduler import EmbeddingScheduler, estimate_tokens, pack_batches
+from lib.embedding_cache import EmbeddingCache
+from pipeline import Pipeline, Stage
+from lib.writer import BulkWriter, estimate_row_bytes
+from journal import Journal
 
 # Load environment variables
 load_dotenv()
 
 # Configuration
-CHUNK_SIZE         = 600
-CHUNK_OVERLAP      = 200
 EMBEDDING_SIZE     = 768
-BATCH_SIZE         = 20   # Process files in batches to avoid rate limits
 GEMINI_BATCH_LIMIT = 100  # Maximum batch size for Gemini embedding API
+GEMINI_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", 20_000))  # Estimated token budget per embedding request
+TASK_TYPE          = "RETRIEVAL_DOCUMENT"
+UPSERT_TARGET_BYTES = int(os.getenv("UPSERT_TARGET_BYTES", 2_000_000))  # Initial payload size per Supabase upsert
+DELETE_BATCH_LIMIT = 100  # Maximum number of IDs per Supabase delete (sent in the URL)
+MANIFEST_FILE      = ".index_manifest.json"
+JOURNAL_FILE       = ".index_journal.jsonl"
+EMBED_RETRY_ROUNDS = 3    # Extra passes over chunks whose embedding failed
+EMBED_RETRY_DELAY  = 10   # Seconds to wait before the first retry pass (grows each pass)
+
+# Embedding request pacing (override with env vars or CLI flags)
+EMBED_CONCURRENCY  = int(os.getenv("EMBED_CONCURRENCY", 4))              # Requests in flight
+EMBED_RPM          = float(os.getenv("EMBED_RPM", 1500))                 # Requests per minute
+EMBED_TPM          = float(os.getenv("EMBED_TPM", 1_000_000))            # Tokens per minute
+
+# Embedding cache, shared with the other indexers and the search API if they point to the same file
+EMBEDDING_CACHE_FILE = os.getenv("EMBEDDING_CACHE_FILE", ".embedding_cache.db")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 1_000_000))  # Max cached embeddings
+
+# Pipeline stage settings (the embed stage uses the scheduler's concurrency)
+SPLIT_WORKERS      = int(os.getenv("PIPELINE_SPLIT_WORKERS", 4))         # Threads reading and splitting files
+SPLIT_PROCESSES    = int(os.getenv("PIPELINE_SPLIT_PROCESSES", 0))       # Worker processes instead of threads (0 = off)
+UPSERT_WORKERS     = int(os.getenv("PIPELINE_UPSERT_WORKERS", 2))        # Concurrent Supabase upserts
+QUEUE_SIZE         = int(os.getenv("PIPELINE_QUEUE_SIZE", 32))           # Items buffered between stages
 
 # Initialize Supabase client
 supabase: Client = create_client(
@@ -45,219 +85,504 @@ supabase: Client = create_client(
 model_id = os.getenv("GEMINI_EMBEDDING_ID", "text-embedding-004")
 client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 
-def read_markdown_file(file_path: str) -> str:
+def embed_texts(texts: List[str]) -> List[List[float]]:
     """
-    Read a markdown file and return its contents
+    Embed one batch of texts with a single Gemini call
 
     Args:
-        file_path: Path to the markdown file
+        texts: Texts to embed (at most GEMINI_BATCH_LIMIT)
 
     Returns:
-        String content of the markdown file
+        One embedding vector per text
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except Exception as e:
-        print(f"Error reading file {file_path}: {e}")
-        return ""
+    response = client.models.embed_content(
+        model=model_id,
+        contents=texts,
+        config=EmbedContentConfig(
+            task_type=TASK_TYPE,
+            output_dimensionality=EMBEDDING_SIZE
+        )
+    )
+    return [embedding.values for embedding in response.embeddings]
+
+# Initialize the embedding cache (set EMBEDDING_CACHE_FILE="" to disable)
+cache: Optional[EmbeddingCache] = EmbeddingCache(EMBEDDING_CACHE_FILE, EMBEDDING_CACHE_SIZE) if EMBEDDING_CACHE_FILE else None
+
+# Initialize the embedding scheduler
+scheduler = EmbeddingScheduler(
+    embed_texts,
+    max_in_flight=EMBED_CONCURRENCY,
+    requests_per_minute=EMBED_RPM,
+    tokens_per_minute=EMBED_TPM
+)
 
-def split_text(text: str, file_path: str) -> List[Dict[str, Any]]:
+def configure_scheduler(concurrency: int, rpm: float, tpm: float) -> None:
     """
-    Split text into chunks and prepare for embedding
+    Replace the embedding scheduler with new pacing settings
 
     Args:
-        text: Text content to split
-        file_path: Original file path for tracking
-
-    Returns:
-        List of dictionaries with chunk information
+        concurrency: Maximum number of embedding requests in flight
+        rpm: Requests per minute quota
+        tpm: Tokens per minute quota
     """
-    # Initialize the text splitter
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP
+    global scheduler
+    scheduler.shutdown()
+    scheduler = EmbeddingScheduler(
+        embed_texts,
+        max_in_flight=concurrency,
+        requests_per_minute=rpm,
+        tokens_per_minute=tpm
     )
 
-    # Split the text into chunks
-    chunks = text_splitter.split_text(text)
+def embed_content(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Generate embeddings for a list of text chunks
 
-    # Get the relative file path for the file_id
-    file_id = os.path.relpath(file_path).replace("\\", "/")
+    Each distinct text is embedded once and its vector is shared by every chunk
+    with that text. Embeddings found in the local cache are reused, only the
+    misses are sent to Gemini.
 
-    # Create a list of chunk dictionaries
-    chunk_dicts = []
-    for i, chunk_text in enumerate(chunks):
-        # Get start position (approximate)
-        start_pos = i * (CHUNK_SIZE - CHUNK_OVERLAP) if i > 0 else 0
-        end_pos = start_pos + len(chunk_text)
+    Args:
+        chunks: List of chunk dictionaries with content and hash
 
-        chunk_id = f"{file_id}_{start_pos}-{end_pos}"
+    Returns:
+        Chunks with embeddings added
+    """
+    # Group identical texts (license headers, boilerplate, ...) across files
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for chunk in chunks:
+        groups.setdefault(chunk["hash"], []).append(chunk)
+    texts = [group[0]["content"] for group in groups.values()]
+    if len(texts) < len(chunks):
+        print(f"Deduplicated {len(chunks)} chunks to {len(texts)} distinct texts")
+
+    # Reuse cached embeddings
+    vectors = cache.get_many(model_id, EMBEDDING_SIZE, TASK_TYPE, texts) if cache else [None] * len(texts)
+    misses = [i for i, vector in enumerate(vectors) if vector is None]
+    if len(misses) < len(texts):
+        print(f"Reused {len(texts) - len(misses)} cached embeddings")
+
+    # Pack into as few requests as fit both the item limit and the token budget
+    packed = pack_batches([texts[i] for i in misses], GEMINI_BATCH_LIMIT, GEMINI_BATCH_TOKENS)
+    batches = [[misses[j] for j in batch] for batch in packed]
+    if batches:
+        print(f"Processing {len(batches)} embedding batches ({len(misses)} texts)...")
+
+    # Run the batches concurrently, paced by the scheduler's rate limits
+    results = scheduler.embed_batches([[texts[i] for i in batch] for batch in batches])
+
+    for n, (batch, embeddings) in enumerate(zip(batches, results), 1):
+        if embeddings is None or len(embeddings) != len(batch):
+            print(f"Error generating embeddings for batch {n}")
+            # Leave these chunks without embeddings
+            embeddings = [[] for _ in batch]
+        elif cache:
+            cache.put_many(model_id, EMBEDDING_SIZE, TASK_TYPE, [texts[i] for i in batch], embeddings)
+
+        for i, embedding in zip(batch, embeddings):
+            vectors[i] = embedding
+
+    # Fan each vector out to every chunk with that text
+    for group, vector in zip(groups.values(), vectors):
+        for chunk in group:
+            chunk["embedding"] = vector
+
+    return chunks
+
+def write_rows(rows: List[Dict[str, Any]]) -> None:
+    """
+    Upsert one batch of rows to the file_embeddings table
 
-        chunk_dicts.append({
-            "id"       : chunk_id,
-            "file_id"  : file_id,
-            "content"  : chunk_text,
-            "start_pos": start_pos,
-            "end_pos"  : end_pos
-        })
+    Args:
+        rows: Rows with id, file_id, content and embedding
+    """
+    supabase.table("file_embeddings").upsert(rows).execute()
+    print(f"Indexed {len(rows)} chunks to Supabase")
 
-    return chunk_dicts
+# Initialize the bulk writer
+writer = BulkWriter(write_rows, target_bytes=UPSERT_TARGET_BYTES)
 
-def embed_content(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def upsert_chunks(chunks: List[Dict[str, Any]]) -> List[str]:
     """
-    Generate embeddings for a list of text chunks
+    Upload embedded chunks to Supabase
 
     Args:
-        chunks: List of chunk dictionaries with content
+        chunks: Chunk dictionaries with embeddings
 
     Returns:
-        Chunks with embeddings added
+        IDs of the chunks that were written
     """
-    # Process in batches of GEMINI_BATCH_LIMIT to avoid API limitations
-    all_chunks_with_embeddings = []
-
-    for i in range(0, len(chunks), GEMINI_BATCH_LIMIT):
-        batch = chunks[i:i + GEMINI_BATCH_LIMIT]
-        print(f"Processing embedding batch {i//GEMINI_BATCH_LIMIT + 1} ({len(batch)} chunks)...")
-
-        # Extract text content from chunks
-        texts = [chunk["content"] for chunk in batch]
-
-        try:
-            # Generate embeddings
-            response = client.models.embed_content(
-                model=model_id,
-                contents=texts,
-                config=EmbedContentConfig(
-                    task_type="RETRIEVAL_DOCUMENT",
-                    output_dimensionality=EMBEDDING_SIZE
-                )
-            )
-
-            # Add embeddings to chunks
-            for j, embedding in enumerate(response.embeddings):
-                batch[j]["embedding"] = embedding.values
-
-            all_chunks_with_embeddings.extend(batch)
-
-        except Exception as e:
-            print(f"Error generating embeddings for batch {i//GEMINI_BATCH_LIMIT + 1}: {e}")
-            # Add chunks without embeddings
-            for chunk in batch:
-                chunk["embedding"] = []
-                all_chunks_with_embeddings.append(chunk)
+    # Prepare data for upsert
+    upsert_data = []
+    for chunk in chunks:
+        upsert_data.append({
+            "id": chunk["id"],
+            "file_id": chunk["file_id"],
+            "content": chunk["content"],
+            "embedding": chunk["embedding"]
+        })
+
+    # Batches are sized by payload, failing batches are retried and split
+    return writer.write(upsert_data)
 
-        # Add a small delay between batches to avoid rate limits
-        if i + GEMINI_BATCH_LIMIT < len(chunks):
-            time.sleep(0.5)
+def delete_chunks(chunk_ids: List[str]) -> bool:
+    """
+    Delete chunks from Supabase by ID
 
-    return all_chunks_with_embeddings
+    Args:
+        chunk_ids: IDs of the rows to delete
 
-def index_markdown_files(directory: str, dry_run: bool = False) -> Dict[str, Any]:
+    Returns:
+        True if every delete succeeded
+    """
+    try:
+        for i in range(0, len(chunk_ids), DELETE_BATCH_LIMIT):
+            sub_batch = chunk_ids[i:i + DELETE_BATCH_LIMIT]
+            supabase.table("file_embeddings").delete().in_("id", sub_batch).execute()
+            print(f"Deleted {len(sub_batch)} stale chunks from Supabase")
+        return True
+    except Exception as e:
+        print(f"Error deleting from Supabase: {e}")
+        return False
+
+def index_markdown_files(
+    directory     : str,
+    dry_run       : bool = False,
+    incremental   : bool = False,
+    manifest_path : str  = MANIFEST_FILE,
+    processes     : int  = SPLIT_PROCESSES,
+    upsert_workers: int  = UPSERT_WORKERS,
+    resume        : bool = False,
+    journal_path  : str  = JOURNAL_FILE
+) -> Dict[str, Any]:
     """
     Find all markdown files in a directory and index them
 
+    Files stream through a discover -> read/split -> batch -> embed -> pack -> upsert
+    pipeline, so reading, splitting, embedding and uploading overlap and only a
+    bounded number of chunks is held in memory at any time.
+
     Args:
         directory: Path to directory to scan for .md files
         dry_run: If True, don't actually upload to Supabase
+        incremental: If True, skip unchanged files and only embed new or changed chunks
+        manifest_path: Location of the content-hash manifest
+        processes: Worker processes for reading and splitting (0 or 1 to split in threads)
+        upsert_workers: Number of Supabase upserts to run concurrently
+        resume: If True, continue an interrupted run from its journal
+        journal_path: Location of the checkpoint journal
 
     Returns:
         Dictionary with statistics about the indexing process
     """
     start_time = time.time()
 
-    # Find all markdown files
-    md_files = glob.glob(f"{directory}/**/*.md", recursive=True)
-
-    if not md_files:
-        return {
-            "status": "error",
-            "message": f"No markdown files found in {directory}"
-        }
-
-    print(f"Found {len(md_files)} markdown files in {directory}")
-
     # Statistics
     stats = {
+        "files_found"    : 0,
         "files_processed": 0,
+        "files_skipped"  : 0,
         "files_failed"   : 0,
+        "files_removed"  : 0,
         "chunks_created" : 0,
         "chunks_indexed" : 0,
+        "chunks_deleted" : 0,
+        "chunks_failed"  : 0,
         "processing_time": 0
     }
 
-    # Process files in batches
-    for i in range(0, len(md_files), BATCH_SIZE):
-        batch = md_files[i:i + BATCH_SIZE]
-
-        all_chunks = []
-
-        # Process each file in the batch
-        for file_path in batch:
-            try:
-                # Read the markdown file
-                content = read_markdown_file(file_path)
-                if not content:
-                    stats["files_failed"] += 1
-                    continue
-
-                # Split the content into chunks
-                chunks = split_text(content, file_path)
-
-                # Add to the list of all chunks
-                all_chunks.extend(chunks)
-
-                # Update statistics
-                stats["files_processed"] += 1
-                stats["chunks_created"] += len(chunks)
-
-                print(f"Processed {file_path} - {len(chunks)} chunks")
-
-            except Exception as e:
-                print(f"Error processing file {file_path}: {e}")
-                stats["files_failed"] += 1
-
-        # Generate embeddings for all chunks in the batch
-        if all_chunks:
-            chunks_with_embeddings = embed_content(all_chunks)
-
-            # Filter out chunks without embeddings
-            valid_chunks = [chunk for chunk in chunks_with_embeddings if chunk.get("embedding")]
-
-            # If not a dry run, upload to Supabase
-            if not dry_run and valid_chunks:
-                try:
-                    # Prepare data for upsert
-                    upsert_data = []
-                    for chunk in valid_chunks:
-                        upsert_data.append({
-                            "id": chunk["id"],
-                            "file_id": chunk["file_id"],
-                            "content": chunk["content"],
-                            "embedding": chunk["embedding"]
-                        })
-
-                    # Upsert to Supabase in batches if needed
-                    max_batch = 500  # Maximum batch size for Supabase upsert
-                    for j in range(0, len(upsert_data), max_batch):
-                        sub_batch = upsert_data[j:j + max_batch]
-                        response = supabase.table("file_embeddings").upsert(sub_batch).execute()
-                        print(f"Indexed batch {j//max_batch + 1} ({len(sub_batch)} chunks) to Supabase")
-
-                    # Update statistics
-                    stats["chunks_indexed"] += len(upsert_data)
-
-                except Exception as e:
-                    print(f"Error upserting to Supabase: {e}")
+    # The manifest is always kept up to date, but only consulted in incremental mode
+    params = {
+        "chunk_size"    : CHUNK_SIZE,
+        "chunk_overlap" : CHUNK_OVERLAP,
+        "embedding_size": EMBEDDING_SIZE,
+        "model_id"      : model_id,
+        "chunk_ids"     : "content-hash",
+    }
+    manifest = Manifest(manifest_path, params=params)
+
+    # The journal checkpoints finished files and uploaded chunks while the run is in progress
+    journal = Journal(journal_path)
+    resumed = resume and journal.load(directory, params)
+    if resumed:
+        # Replay the files finished by the interrupted run into the manifest
+        for file_id, entry in journal.files.items():
+            manifest.update(file_id, entry["hash"], entry["chunks"])
+    elif journal.exists():
+        print("Found the journal of an unfinished run, starting over (use --resume to continue it)")
+    if not dry_run:
+        journal.open(directory, params, resume=resumed)
+
+    lock = threading.Lock()
+    found_ids = set()
+    # Files whose chunks are still moving through the pipeline
+    pending: Dict[str, Dict[str, Any]] = {}
+    batch_buffer: List[Dict[str, Any]] = []
+    batch_hashes = set()
+    batch_tokens = 0
+    pack_buffer: List[Dict[str, Any]] = []
+    pack_bytes = 0
+    # Chunks whose embedding request failed, retried after the pipeline drains
+    retry_queue: List[Dict[str, Any]] = []
+
+    def add_stat(key: str, value: int = 1) -> None:
+        with lock:
+            stats[key] += value
+
+    def finish_file(file_id: str, state: Dict[str, Any]) -> None:
+        """Delete stale chunks and record the file once all its chunks are handled"""
+        if dry_run:
+            if state["removed"]:
+                print(f"Dry run: Would have deleted {len(state['removed'])} stale chunks of {file_id}")
+            return
+
+        # Record what is now in the table so failed chunks are retried next run
+        previous = manifest.chunk_hashes(file_id)
+        recorded = {
+            chunk_id: chunk_hash
+            for chunk_id, chunk_hash in state["chunks"].items()
+            if chunk_id in state["indexed"]
+            or (chunk_id not in state["changed"] and previous.get(chunk_id) == chunk_hash)
+        }
+        complete = len(recorded) == len(state["chunks"])
+
+        if state["removed"]:
+            if delete_chunks(state["removed"]):
+                add_stat("chunks_deleted", len(state["removed"]))
             else:
-                # In dry run mode, just count valid chunks
-                stats["chunks_indexed"] += len(valid_chunks)
-                print(f"Dry run: Would have indexed {len(valid_chunks)} chunks to Supabase")
+                # Keep the stale IDs so the delete is retried next run
+                recorded.update({chunk_id: previous[chunk_id] for chunk_id in state["removed"]})
+                complete = False
+
+        file_hash = state["hash"] if complete else None
+        with lock:
+            manifest.update(file_id, file_hash, recorded)
+        journal.record_file(file_id, file_hash, recorded)
+
+    # Stage: discover, starting with the files whose chunks failed in the interrupted run
+    def discover():
+        retried = {file_id for file_id in journal.failed if os.path.isfile(file_id)}
+        for file_path in chain(sorted(retried), glob.iglob(f"{directory}/**/*.md", recursive=True)):
+            file_id = get_file_id(file_path)
+            if file_id in found_ids:
+                continue
+            found_ids.add(file_id)
+            add_stat("files_found")
+            yield file_path
+
+    # Stage: read and split, in worker processes when a pool is given
+    def split_stage(file_path: str):
+        file_id = get_file_id(file_path)
+        if file_id in journal.files:
+            # Finished by the interrupted run
+            skip_hash = journal.files[file_id]["hash"]
+        else:
+            skip_hash = manifest.file_hash(file_id) if incremental else None
+        if pool is not None:
+            result = pool.submit(read_and_split, file_path, skip_hash).result()
+        else:
+            result = read_and_split(file_path, skip_hash)
+
+        chunks = result["chunks"]
+        if chunks is None:
+            add_stat("files_failed" if result["hash"] is None else "files_skipped")
+            return []
+
+        # Only embed new or changed chunks in incremental mode
+        changed, removed = manifest.diff_chunks(file_id, chunks)
+        if not incremental:
+            changed = chunks
+
+        # Chunks upserted by the interrupted run don't need to be embedded again
+        uploaded = {chunk["id"] for chunk in changed if chunk["id"] in journal.uploaded}
+        changed = [chunk for chunk in changed if chunk["id"] not in uploaded]
+
+        state = {
+            "hash"     : result["hash"],
+            "chunks"   : {chunk["id"]: chunk["hash"] for chunk in chunks},
+            "changed"  : {chunk["id"] for chunk in changed} | uploaded,
+            "removed"  : removed,
+            "indexed"  : uploaded,
+            "remaining": len(changed),
+        }
+        with lock:
+            if changed:
+                pending[file_id] = state
+            stats["files_processed"] += 1
+            stats["chunks_created"] += len(chunks)
+
+        print(f"Processed {file_path} - {len(chunks)} chunks ({len(changed)} to embed, {len(removed)} removed)")
+
+        if not changed:
+            finish_file(file_id, state)
+        return changed
+
+    # Stage: batch chunks from many files into full embedding requests.
+    # Batches are sized by the item limit and token budget of the distinct texts,
+    # since duplicates are embedded once.
+    def batch_stage(chunk: Dict[str, Any]):
+        nonlocal batch_tokens
+        if chunk["hash"] in batch_hashes:
+            batch_buffer.append(chunk)
+            return []
+
+        tokens = estimate_tokens([chunk["content"]])
+        batches = []
+        if batch_buffer and (len(batch_hashes) >= GEMINI_BATCH_LIMIT or batch_tokens + tokens > GEMINI_BATCH_TOKENS):
+            # The request is full, send it before adding this chunk
+            batches.append(batch_buffer[:])
+            batch_buffer.clear()
+            batch_hashes.clear()
+            batch_tokens = 0
+
+        batch_buffer.append(chunk)
+        batch_hashes.add(chunk["hash"])
+        batch_tokens += tokens
+        return batches
+
+    def flush_batch():
+        return [batch_buffer[:]] if batch_buffer else []
+
+    # Stage: embed, sending chunks that failed to the retry queue
+    def embed_stage(batch: List[Dict[str, Any]]):
+        embedded = embed_content(batch)
+        failed = [chunk for chunk in embedded if not chunk.get("embedding")]
+        if failed:
+            with lock:
+                retry_queue.extend(failed)
+            print(f"Queued {len(failed)} chunks to retry embedding")
+        valid_chunks = [chunk for chunk in embedded if chunk.get("embedding")]
+        return [valid_chunks] if valid_chunks else []
+
+    # Stage: pack embedded chunks into upserts close to the writer's payload target
+    def pack_stage(batch: List[Dict[str, Any]]):
+        nonlocal pack_bytes
+        pack_buffer.extend(batch)
+        pack_bytes += sum(estimate_row_bytes(chunk) for chunk in batch if chunk.get("embedding"))
+        if pack_bytes < writer.target_bytes:
+            return []
+        rows = pack_buffer[:]
+        pack_buffer.clear()
+        pack_bytes = 0
+        return [rows]
+
+    def flush_pack():
+        return [pack_buffer[:]] if pack_buffer else []
+
+    # Stage: upsert
+    def upsert_stage(batch: List[Dict[str, Any]]):
+        # Filter out chunks without embeddings
+        valid_chunks = [chunk for chunk in batch if chunk.get("embedding")]
+
+        if dry_run:
+            indexed_ids = {chunk["id"] for chunk in valid_chunks}
+            print(f"Dry run: Would have indexed {len(valid_chunks)} chunks to Supabase")
+        else:
+            indexed_ids = set(upsert_chunks(valid_chunks)) if valid_chunks else set()
+            journal.record_chunks(list(indexed_ids))
+        add_stat("chunks_indexed", len(indexed_ids))
+        release(batch, indexed_ids)
+        return []
+
+    def release(batch: List[Dict[str, Any]], indexed_ids: set) -> None:
+        """Mark chunks as handled, finishing the files that have no chunks left in the pipeline"""
+        finished = []
+        with lock:
+            for chunk in batch:
+                state = pending[chunk["file_id"]]
+                state["remaining"] -= 1
+                if chunk["id"] in indexed_ids:
+                    state["indexed"].add(chunk["id"])
+                if state["remaining"] == 0:
+                    finished.append((chunk["file_id"], pending.pop(chunk["file_id"])))
+
+        for file_id, state in finished:
+            finish_file(file_id, state)
+
+    # Items whose stage raised: files count as failed, chunks are retried or released as failed
+    def split_failed(file_path: str, error: Exception) -> None:
+        add_stat("files_failed")
+
+    def embed_failed(batch: List[Dict[str, Any]], error: Exception) -> None:
+        with lock:
+            retry_queue.extend(batch)
+        print(f"Queued {len(batch)} chunks to retry embedding")
+
+    def upsert_failed(batch: List[Dict[str, Any]], error: Exception) -> None:
+        give_up(batch)
+
+    def give_up(chunks: List[Dict[str, Any]]) -> None:
+        """Release chunks that could not be indexed, their files are recorded as incomplete"""
+        add_stat("chunks_failed", len(chunks))
+        failed_ids: Dict[str, List[str]] = {}
+        for chunk in chunks:
+            failed_ids.setdefault(chunk["file_id"], []).append(chunk["id"])
+        for file_id, chunk_ids in failed_ids.items():
+            journal.record_failed(file_id, chunk_ids)
+        release(chunks, set())
+
+    # Splitting is pure-Python CPU work, so large corpora benefit from worker processes
+    pool = ProcessPoolExecutor(max_workers=processes, initializer=init_worker) if processes > 1 else None
+    split_workers = processes * 2 if pool is not None else SPLIT_WORKERS
+    completed = False
 
-        # Add a small delay between batches to avoid rate limits
-        if i + BATCH_SIZE < len(md_files):
-            time.sleep(1)
+    try:
+        stage_stats = Pipeline(discover(), [
+            Stage("split",  split_stage,  workers=split_workers,           queue_size=QUEUE_SIZE, on_error=split_failed),
+            Stage("batch",  batch_stage,  workers=1,                       queue_size=GEMINI_BATCH_LIMIT, flush=flush_batch),
+            Stage("embed",  embed_stage,  workers=scheduler.max_in_flight, queue_size=QUEUE_SIZE, on_error=embed_failed),
+            Stage("pack",   pack_stage,   workers=1,                       queue_size=QUEUE_SIZE, flush=flush_pack),
+            Stage("upsert", upsert_stage, workers=upsert_workers,          queue_size=QUEUE_SIZE, on_error=upsert_failed),
+        ]).run()
+
+        # Retry failed embedding batches once the provider had time to recover
+        for attempt in range(1, EMBED_RETRY_ROUNDS + 1):
+            if not retry_queue:
+                break
+            retry = retry_queue[:]
+            retry_queue.clear()
+            print(f"Retrying embeddings for {len(retry)} chunks (round {attempt}/{EMBED_RETRY_ROUNDS})")
+            time.sleep(EMBED_RETRY_DELAY * attempt)
+            Pipeline([retry[i:i + GEMINI_BATCH_LIMIT] for i in range(0, len(retry), GEMINI_BATCH_LIMIT)], [
+                Stage("embed",  embed_stage,  workers=scheduler.max_in_flight, queue_size=QUEUE_SIZE, on_error=embed_failed),
+                Stage("upsert", upsert_stage, workers=upsert_workers,          queue_size=QUEUE_SIZE, on_error=upsert_failed),
+            ]).run()
+
+        if retry_queue:
+            # Release their files so the manifest records them as incomplete
+            print(f"Giving up on {len(retry_queue)} chunks after {EMBED_RETRY_ROUNDS} retries, they will be retried next run")
+            give_up(retry_queue)
+
+        if not found_ids:
+            completed = True
+            return {
+                "status": "error",
+                "message": f"No markdown files found in {directory}"
+            }
+
+        # Drop rows for files under this directory that no longer exist
+        prefix = get_file_id(directory)
+        for file_id in list(manifest.files):
+            in_directory = prefix == "." or file_id.startswith(f"{prefix}/")
+            if not in_directory or file_id in found_ids:
+                continue
+            stale_ids = manifest.chunk_hashes(file_id)
+            if dry_run:
+                print(f"Dry run: Would have deleted {len(stale_ids)} chunks of removed file {file_id}")
+            elif delete_chunks(list(stale_ids)):
+                manifest.remove(file_id)
+                stats["chunks_deleted"] += len(stale_ids)
+            stats["files_removed"] += 1
+
+        completed = True
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if cache is not None:
+            cache.flush()
+        if not dry_run:
+            manifest.save()
+            journal.close(completed)
 
     # Calculate total processing time
     stats["processing_time"] = round(time.time() - start_time, 2)
@@ -265,7 +590,8 @@ def index_markdown_files(directory: str, dry_run: bool = False) -> Dict[str, Any
     return {
         "status": "success",
         "message": f"Processed {stats['files_processed']} files and indexed {stats['chunks_indexed']} chunks in {stats['processing_time']} seconds",
-        "stats": stats
+        "stats": stats,
+        "stages": stage_stats
     }
 
 def main():
@@ -273,6 +599,16 @@ def main():
     parser = argparse.ArgumentParser(description="Index markdown files for vector search")
     parser.add_argument("--directory", nargs="?", default=".", help="Directory to scan for markdown files (default: current directory)")
     parser.add_argument("--dry-run", action="store_true", help="Perform a dry run without uploading to Supabase")
+    parser.add_argument("--incremental", action="store_true", help="Only embed new or changed chunks and delete removed ones, using the manifest")
+    parser.add_argument("--no-cache", action="store_true", help="Always call Gemini instead of reusing cached embeddings")
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY, help=f"Embedding requests in flight (default: {EMBED_CONCURRENCY})")
+    parser.add_argument("--rpm", type=float, default=EMBED_RPM, help=f"Embedding requests per minute quota (default: {EMBED_RPM:g})")
+    parser.add_argument("--tpm", type=float, default=EMBED_TPM, help=f"Embedding tokens per minute quota (default: {EMBED_TPM:g})")
+    parser.add_argument("--processes", type=int, default=SPLIT_PROCESSES, help="Read and split files in this many worker processes (default: off)")
+    parser.add_argument("--upsert-workers", type=int, default=UPSERT_WORKERS, help=f"Concurrent Supabase upserts (default: {UPSERT_WORKERS})")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run, skipping the work recorded in its journal")
+    parser.add_argument("--journal", default=JOURNAL_FILE, help=f"Path to the checkpoint journal (default: {JOURNAL_FILE})")
+    parser.add_argument("--manifest", default=MANIFEST_FILE, help=f"Path to the content-hash manifest (default: {MANIFEST_FILE})")
 
     args = parser.parse_args()
 
@@ -286,14 +622,22 @@ def main():
         sys.exit(1)
 
     # Run the indexer
-    result = index_markdown_files(args.directory, args.dry_run)
+    if args.no_cache:
+        global cache
+        cache = None
+    configure_scheduler(args.concurrency, args.rpm, args.tpm)
+    result = index_markdown_files(args.directory, args.dry_run, args.incremental, args.manifest, args.processes, args.upsert_workers, args.resume, args.journal)
 
     # Print the result
     if result["status"] == "success":
         print(f"\nSuccess: {result['message']}")
-        print(f"Statistics:")
+        print("Statistics:")
         for key, value in result["stats"].items():
             print(f"  {key}: {value}")
+        print(f"Writer: {writer.stats}")
+        print("Stages:")
+        for name, stage in result["stages"].items():
+            print(f"  {name}: {stage['items_in']} in, {stage['items_out']} out, {stage['errors']} errors, {stage['busy_time']}s busy")
     else:
         print(f"\nError: {result['message']}")
         sys.exit(1)
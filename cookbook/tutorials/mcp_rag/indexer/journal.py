@@ -0,0 +1,136 @@
+"""
+Checkpoint journal for resumable indexing runs
+
+An append-only JSON-lines file written while the indexer runs. Every line is
+flushed as soon as it is written, so after a crash or kill the journal tells
+the next run exactly which work was finished:
+
+    {"type": "run",    "directory": "docs", "params": {...}}
+    {"type": "chunks", "ids": ["docs/a.md_3f2a...", ...]}             # rows upserted
+    {"type": "file",   "file_id": "docs/a.md", "hash": "...", "chunks": {...}}  # file fully handled
+    {"type": "failed", "file_id": "docs/b.md", "ids": [...]}          # gave up after retries
+
+The journal is removed when a run completes and its results are in the manifest.
+A resumed run starts with the files that had failed chunks, so the chunks
+that need another attempt are retried before the rest of the corpus.
+"""
+
+import os
+import json
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+
+class Journal:
+    """Durable record of the work completed by the current indexing run"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Location of the journal file
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+        # State recovered by `load`
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.uploaded: Set[str] = set()
+        self.failed: Dict[str, Set[str]] = {}  # file_id -> chunk IDs that failed and were not upserted since
+
+    def exists(self) -> bool:
+        """Return True if an unfinished run left a journal behind"""
+        return os.path.exists(self.path)
+
+    def load(self, directory: str, params: Dict[str, Any]) -> bool:
+        """
+        Read the journal of an interrupted run
+
+        Args:
+            directory: Directory being indexed now
+            params: Indexing parameters of the current run
+
+        Returns:
+            True if the journal belongs to the same directory and parameters
+        """
+        if not self.exists():
+            return False
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be cut off by a crash
+                    continue
+
+                if record["type"] == "run":
+                    if record.get("directory") != directory or record.get("params") != params:
+                        print(f"Journal {self.path} belongs to a different run, not resuming")
+                        return False
+                elif record["type"] == "chunks":
+                    self.uploaded.update(record["ids"])
+                elif record["type"] == "file":
+                    self.files[record["file_id"]] = {"hash": record["hash"], "chunks": record["chunks"]}
+                elif record["type"] == "failed":
+                    self.failed.setdefault(record["file_id"], set()).update(record["ids"])
+
+        # A chunk that failed may have been upserted by a later attempt
+        for file_id in list(self.failed):
+            self.failed[file_id] -= self.uploaded
+            if not self.failed[file_id]:
+                del self.failed[file_id]
+
+        print(f"Resuming: {len(self.files)} files and {len(self.uploaded)} chunks already done")
+        if self.failed:
+            print(f"Retrying first: {sum(len(ids) for ids in self.failed.values())} failed chunks in {len(self.failed)} files")
+        return True
+
+    def open(self, directory: str, params: Dict[str, Any], resume: bool) -> None:
+        """
+        Start writing the journal
+
+        Args:
+            directory: Directory being indexed
+            params: Indexing parameters
+            resume: Append to the existing journal instead of starting a new one
+        """
+        self.file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        if not resume:
+            self._write({"type": "run", "directory": directory, "params": params})
+
+    def _write(self, record: Dict[str, Any], sync: bool = False) -> None:
+        if self.file is None:
+            return
+        with self.lock:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+
+    def record_chunks(self, chunk_ids: List[str]) -> None:
+        """Record chunk IDs that were upserted"""
+        if chunk_ids:
+            self._write({"type": "chunks", "ids": chunk_ids}, sync=True)
+
+    def record_file(self, file_id: str, file_hash: Optional[str], chunks: Dict[str, Optional[str]]) -> None:
+        """Record a file whose chunks were all handled, with the state stored in the manifest"""
+        self._write({"type": "file", "file_id": file_id, "hash": file_hash, "chunks": chunks})
+
+    def record_failed(self, file_id: str, chunk_ids: List[str]) -> None:
+        """Record chunk IDs of a file that could not be embedded or upserted even after retries"""
+        if chunk_ids:
+            self._write({"type": "failed", "file_id": file_id, "ids": chunk_ids}, sync=True)
+
+    def close(self, completed: bool) -> None:
+        """
+        Stop writing the journal
+
+        Args:
+            completed: If True the run finished and the journal is deleted
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if completed and self.exists():
+            os.remove(self.path)
@@ -0,0 +1,115 @@
+"""
+Content-hash manifest for incremental indexing
+
+The manifest remembers, for every indexed file, the hash of the file content and
+the hash of every chunk that made it into `file_embeddings`. On the next run the
+indexer only embeds chunks whose hash is new and deletes rows for chunks that
+disappeared.
+
+Layout of the JSON file:
+
+    {
+        "params": {"chunk_size": 600, "chunk_overlap": 200, ...},
+        "files": {
+            "docs/intro.md": {
+                "hash": "<sha256 of file content>",
+                "chunks": {"docs/intro.md_<hash[:16]>": "<sha256 of chunk content>", ...}
+            }
+        }
+    }
+"""
+
+import os
+import json
+from typing import List, Dict, Any, Optional, Tuple
+
+
+class Manifest:
+    """Per-file and per-chunk content hashes from the previous indexing run"""
+
+    def __init__(self, path: str, params: Dict[str, Any]):
+        """
+        Load the manifest from disk
+
+        Args:
+            path: Location of the manifest JSON file
+            params: Settings that affect chunk IDs or embeddings (chunk size, model, ...).
+                    If they differ from the stored ones every chunk is treated as changed.
+        """
+        self.path   = path
+        self.params = params
+        self.files: Dict[str, Dict[str, Any]] = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.files = data.get("files", {})
+                if data.get("params") != params:
+                    # Re-embed everything, but remember the old chunk IDs so their rows are deleted
+                    print(f"Indexing parameters changed since last run, re-indexing all files in manifest {path}")
+                    self.files = {
+                        file_id: {"hash": None, "chunks": {chunk_id: None for chunk_id in entry.get("chunks", {})}}
+                        for file_id, entry in self.files.items()
+                    }
+            except Exception as e:
+                print(f"Error reading manifest {path}: {e}")
+
+    def file_hash(self, file_id: str) -> Optional[str]:
+        """Return the content hash of a file if it was fully indexed last time"""
+        return self.files.get(file_id, {}).get("hash")
+
+    def diff_chunks(self, file_id: str, chunks: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Compare freshly split chunks of a file with the previous run
+
+        Args:
+            file_id: File the chunks belong to
+            chunks: Chunk dictionaries, each with a "hash" key
+
+        Returns:
+            Tuple of (chunks that are new or changed, IDs of chunks that disappeared)
+        """
+        previous = self.files.get(file_id, {}).get("chunks", {})
+        current_ids = {chunk["id"] for chunk in chunks}
+
+        changed = [chunk for chunk in chunks if previous.get(chunk["id"]) != chunk["hash"]]
+        removed = [chunk_id for chunk_id in previous if chunk_id not in current_ids]
+
+        return changed, removed
+
+    def update(self, file_id: str, file_hash: Optional[str], chunks: Dict[str, str]) -> None:
+        """
+        Record the indexed state of a file
+
+        Args:
+            file_id: File to record
+            file_hash: Hash of the file content, or None if some chunks failed
+                       so the file is not skipped on the next run
+            chunks: Mapping of chunk ID to chunk hash for every chunk now in the table
+        """
+        self.files[file_id] = {"hash": file_hash, "chunks": chunks}
+
+    def remove(self, file_id: str) -> List[str]:
+        """
+        Forget a file, returning the chunk IDs it had in the table
+
+        Args:
+            file_id: File to forget
+
+        Returns:
+            List of chunk IDs that were recorded for the file
+        """
+        entry = self.files.pop(file_id, {})
+        return list(entry.get("chunks", {}))
+
+    def chunk_hashes(self, file_id: str) -> Dict[str, str]:
+        """Return a copy of the recorded chunk hashes for a file"""
+        return dict(self.files.get(file_id, {}).get("chunks", {}))
+
+    def save(self) -> None:
+        """Write the manifest atomically so a crash never leaves a truncated file"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"params": self.params, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,178 @@
+"""
+Streaming staged pipeline
+
+Each stage runs on its own pool of worker threads and reads from a bounded
+queue filled by the previous stage. A full queue blocks the producer, so memory
+stays flat no matter how large the input is, while every stage keeps working
+on whatever is ready.
+
+A stage function takes one item and returns an iterable of output items, so a
+stage can drop items (return nothing), transform them or fan them out. Stages
+that group items (e.g. into API batches) can provide a `flush` function that is
+called once after all their input has been consumed.
+
+An item whose stage function raises is counted in the stage's `errors` and
+handed to the stage's `on_error` sink (e.g. a retry queue) with the exception,
+so that it is never lost silently. Without a sink it is kept in
+`Pipeline.failed`.
+"""
+
+import time
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+StageFn = Callable[[Any], Iterable[Any]]
+FlushFn = Callable[[], Iterable[Any]]
+ErrorFn = Callable[[Any, Exception], None]
+
+_DONE = object()  # Sentinel marking the end of a queue
+
+
+class Stage:
+    """One step of the pipeline"""
+
+    def __init__(
+        self,
+        name       : str,
+        fn         : StageFn,
+        workers    : int = 1,
+        queue_size : int = 64,
+        flush      : Optional[FlushFn] = None,
+        on_error   : Optional[ErrorFn] = None,
+    ):
+        """
+        Args:
+            name: Name used in logs and statistics
+            fn: Function mapping one input item to an iterable of output items
+            workers: Number of threads running `fn`
+            queue_size: Capacity of the queue feeding this stage
+            flush: Optional function emitting buffered items once input is exhausted
+            on_error: Optional function called with an item and the exception `fn` raised for it
+        """
+        self.name       = name
+        self.fn         = fn
+        self.workers    = workers
+        self.queue_size = queue_size
+        self.flush      = flush
+        self.on_error   = on_error
+
+        self.stats = {"items_in": 0, "items_out": 0, "errors": 0, "busy_time": 0.0}
+        self.lock  = threading.Lock()
+
+    def _record(self, items_out: int, busy_time: float, error: bool = False) -> None:
+        with self.lock:
+            self.stats["items_in"]  += 1
+            self.stats["items_out"] += items_out
+            self.stats["busy_time"] += busy_time
+            self.stats["errors"]    += int(error)
+
+
+class Pipeline:
+    """Chain of stages connected by bounded queues"""
+
+    def __init__(self, source: Iterable[Any], stages: List[Stage]):
+        """
+        Args:
+            source: Iterable producing the input items of the first stage (consumed lazily)
+            stages: Stages in processing order; outputs of the last stage are discarded
+        """
+        self.source = source
+        self.stages = stages
+        # (stage name, item, exception) of the failed items of stages without `on_error`
+        self.failed: List[Tuple[str, Any, Exception]] = []
+        self.lock   = threading.Lock()
+
+    def _feed(self, items: Iterable[Any], out: "queue.Queue[Any]") -> int:
+        count = 0
+        for item in items:
+            out.put(item)
+            count += 1
+        return count
+
+    def _worker(self, stage: Stage, inbox: "queue.Queue[Any]", outbox: Optional["queue.Queue[Any]"]) -> None:
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                # Let the other workers of this stage see the sentinel too
+                inbox.put(_DONE)
+                return
+
+            start = time.perf_counter()
+            try:
+                results = stage.fn(item)
+                count = self._feed(results, outbox) if outbox is not None else sum(1 for _ in results)
+                stage._record(count, time.perf_counter() - start)
+            except Exception as e:
+                print(f"Error in {stage.name} stage: {e!r}")
+                stage._record(0, time.perf_counter() - start, error=True)
+                self._fail(stage, item, e)
+
+    def _fail(self, stage: Stage, item: Any, error: Exception) -> None:
+        if stage.on_error is None:
+            with self.lock:
+                self.failed.append((stage.name, item, error))
+            return
+        try:
+            stage.on_error(item, error)
+        except Exception as e:
+            print(f"Error handler of {stage.name} stage failed: {e!r}")
+            with self.lock:
+                self.failed.append((stage.name, item, error))
+
+    def _run_stage(self, stage: Stage, inbox: "queue.Queue[Any]", outbox: Optional["queue.Queue[Any]"]) -> None:
+        threads = [
+            threading.Thread(target=self._worker, args=(stage, inbox, outbox), name=f"{stage.name}-{n}", daemon=True)
+            for n in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if stage.flush is not None:
+            start = time.perf_counter()
+            try:
+                results = stage.flush()
+                count = self._feed(results, outbox) if outbox is not None else sum(1 for _ in results)
+                with stage.lock:
+                    stage.stats["items_out"] += count
+                    stage.stats["busy_time"] += time.perf_counter() - start
+            except Exception as e:
+                print(f"Error flushing {stage.name} stage: {e!r}")
+                with stage.lock:
+                    stage.stats["errors"] += 1
+                with self.lock:
+                    self.failed.append((stage.name, None, e))
+
+        if outbox is not None:
+            outbox.put(_DONE)
+
+    def run(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Run all stages until the source is exhausted and every queue is drained
+
+        Returns:
+            Per-stage statistics (items in/out, errors, busy time in seconds)
+        """
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+
+        runners = []
+        for n, stage in enumerate(self.stages):
+            outbox = queues[n + 1] if n + 1 < len(self.stages) else None
+            runner = threading.Thread(target=self._run_stage, args=(stage, queues[n], outbox), daemon=True)
+            runner.start()
+            runners.append(runner)
+
+        try:
+            self._feed(self.source, queues[0])
+        finally:
+            queues[0].put(_DONE)
+
+        for runner in runners:
+            runner.join()
+
+        return {
+            stage.name: {**stage.stats, "busy_time": round(stage.stats["busy_time"], 2)}
+            for stage in self.stages
+        }
@@ -0,0 +1,23 @@
+-- Keep file_embeddings.updated_at current on every update.
+--
+-- The column default only applies to inserts, so an upsert that replaces an
+-- existing chunk would keep its old timestamp. The search API's local backend
+-- (RAG_SEARCH_BACKEND=local) syncs incrementally by updated_at and relies on
+-- this trigger to see re-embedded chunks. An index on the column keeps those
+-- incremental reads cheap.
+create or replace function set_file_embeddings_updated_at ()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.updated_at = now() AT TIME ZONE 'utc'::text;
+  return new;
+end;
+$$;
+
+create trigger file_embeddings_set_updated_at
+before update on file_embeddings
+for each row
+execute function set_file_embeddings_updated_at();
+
+create index on file_embeddings (updated_at);
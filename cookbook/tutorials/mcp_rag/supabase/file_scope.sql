@@ -0,0 +1,66 @@
+-- Scope searches to part of the corpus inside the vector index.
+--
+-- file_scope is the top-level directory of a chunk's file_id ("docs" for
+-- "docs/guide/setup.md"). match_file_embeddings[_page] add `file_scope = '<scope>'`
+-- to their query when a file_prefix (or the literal start of a file_glob)
+-- names a directory, so the planner can use:
+--
+-- * a partial HNSW index per scope that is searched often, built with
+--   `select create_file_scope_index('docs');`. A scoped query then only walks
+--   the graph of that scope's vectors, and never comes back short because
+--   the 50 nearest rows of the whole table belonged to other scopes.
+-- * the btree index on file_scope, for scopes without their own HNSW index.
+--   Small scopes are then scored exactly, large ones fall back to the full
+--   HNSW index with iterative scans (pgvector 0.8+) filtering inside the scan.
+--
+-- With many large scopes, list-partitioning file_embeddings by file_scope gives
+-- every partition its own HNSW index and lets the planner prune the others:
+--
+--   create table file_embeddings_partitioned (like file_embeddings including all)
+--   partition by list (file_scope);
+--   create table file_embeddings_docs partition of file_embeddings_partitioned for values in ('docs');
+--   create table file_embeddings_other partition of file_embeddings_partitioned default;
+--
+-- (the primary key then has to include file_scope).
+
+alter table file_embeddings
+add column if not exists file_scope text
+generated always as (split_part(file_id, '/', 1)) stored;
+
+create index if not exists file_embeddings_file_scope_idx on file_embeddings (file_scope);
+
+-- Build the partial HNSW index of one scope, returning its name
+create or replace function create_file_scope_index (
+  p_scope              text
+)
+returns text
+language plpgsql
+as $$
+declare
+  v_name text := 'file_embeddings_embedding_' || substr(md5(p_scope), 1, 12) || '_idx';
+begin
+  execute format(
+    'create index if not exists %I on file_embeddings using hnsw (embedding vector_ip_ops) where file_scope = %L',
+    v_name, p_scope
+  );
+  return v_name;
+end;
+$$;
+
+-- SQL condition (on the alias `e`) for the file filters of the match functions.
+-- The values are inlined as literals, so the planner can match partial indexes.
+create or replace function file_filter_condition (
+  p_file_prefix        text,
+  p_file_pattern       text
+)
+returns text
+language sql
+immutable
+as $$
+  select concat_ws(' and ',
+    case when strpos(p_file_prefix, '/') > 0 then format('e.file_scope = %L', split_part(p_file_prefix, '/', 1)) end,
+    case when p_file_prefix is not null then format('starts_with(e.file_id, %L)', p_file_prefix) end,
+    case when p_file_pattern is not null then format('e.file_id ~ %L', p_file_pattern) end,
+    'true'
+  );
+$$;
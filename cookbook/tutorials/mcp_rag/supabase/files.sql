@@ -16,6 +16,7 @@ create table file_embeddings (
 
   -- Metadata
   updated_at  timestamp with time zone not null default (now() AT TIME ZONE 'utc'::text),
+  file_scope  text generated always as (split_part(file_id, '/', 1)) stored  -- Top-level directory, see file_scope.sql
 );
 
 -- INDEXING
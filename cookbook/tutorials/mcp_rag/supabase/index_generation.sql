@@ -0,0 +1,32 @@
+-- Index generation counter, used by the search API to invalidate its response cache.
+--
+-- Every statement that writes to file_embeddings (the indexer's upserts and
+-- deletes included) bumps the generation, so cached search responses keyed on
+-- the old generation are never served once the API has seen the new one.
+create table index_generation (
+  id          int PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+  generation  bigint NOT NULL DEFAULT 0,
+  updated_at  timestamp with time zone not null default (now() AT TIME ZONE 'utc'::text)
+);
+
+insert into index_generation (id) values (1)
+on conflict (id) do nothing;
+
+create or replace function bump_index_generation ()
+returns trigger
+language plpgsql
+as $$
+begin
+  update index_generation
+  set generation = generation + 1,
+      updated_at = now() AT TIME ZONE 'utc'::text
+  where id = 1;
+  return null;
+end;
+$$;
+
+-- Statement-level, so a bulk upsert bumps the generation once
+create trigger file_embeddings_bump_generation
+after insert or update or delete or truncate on file_embeddings
+for each statement
+execute function bump_index_generation();
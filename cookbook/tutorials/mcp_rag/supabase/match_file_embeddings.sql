@@ -1,7 +1,29 @@
+-- Optional filters, see file_scope.sql (apply it first):
+--   p_file_prefix   only file_ids starting with this text, e.g. 'docs/'
+--   p_file_pattern  only file_ids matching this anchored regular expression
+-- Filtered searches run inside the index scan (a partial index of the scope,
+-- or iterative scans of the full index), not on the 50 nearest rows overall.
+--
+-- Optional HNSW search parameters, set for this call only:
+--   p_ef_search       candidate list size (hnsw.ef_search), raised to the match
+--                     count since a scan returns at most ef_search rows
+--   p_iterative_scan  'off', 'relaxed_order' or 'strict_order' (pgvector 0.8+),
+--                     'relaxed_order' by default for filtered searches
+-- Null keeps the database setting. benchmarks/hnsw_eval.py measures their
+-- effect on recall and latency.
+
+-- Replaced by the version with filters and search parameters below, a second overload would be ambiguous
+drop function if exists match_file_embeddings (vector, float, int);
+drop function if exists match_file_embeddings (vector, float, int, text, text);
+
 create or replace function match_file_embeddings (
   p_query_embedding    vector(768),
   p_match_threshold    float,
-  p_match_count        int
+  p_match_count        int,
+  p_file_prefix        text default null,
+  p_file_pattern       text default null,
+  p_ef_search          int default null,
+  p_iterative_scan     text default null
 )
 returns table (
   id text,
@@ -9,22 +31,61 @@ returns table (
   content text,
   similarity float
 )
-language sql
+language plpgsql
 as $$
-  with top_embeddings as (
+-- The output columns share names with file_embeddings columns
+#variable_conflict use_column
+declare
+  v_count int := least(p_match_count, 50);
+begin
+  -- set_config(..., true) only lasts until the end of the call's transaction
+  perform set_config(
+    'hnsw.ef_search',
+    greatest(coalesce(p_ef_search, current_setting('hnsw.ef_search', true)::int, 40), v_count)::text,
+    true
+  );
+  if p_iterative_scan is not null then
+    perform set_config('hnsw.iterative_scan', p_iterative_scan, true);
+  end if;
+
+  if p_file_prefix is null and p_file_pattern is null then
+    return query
+    with matches as materialized (
+      select e.id, e.file_id, e.content, e.embedding <#> p_query_embedding as distance
+      from file_embeddings e
+      where e.embedding <#> p_query_embedding < -p_match_threshold
+      order by e.embedding <#> p_query_embedding
+      limit v_count
+    )
     select
-      e.id,
-      e.file_id,
-      e.content,
+      m.id,
+      m.file_id,
+      m.content,
       -- Calculate similarity (negative inner product)
-      -(e.embedding <#> p_query_embedding) as similarity
-    from file_embeddings e
-    where e.embedding <#> p_query_embedding < -p_match_threshold
-    order by e.embedding <#> p_query_embedding
-    limit least(p_match_count, 50)
-  )
-  select *
-  from top_embeddings;
-$$;
+      -m.distance as similarity
+    from matches m
+    -- Relaxed iterative scans may return rows slightly out of order
+    order by m.distance;
+    return;
+  end if;
 
+  -- Keep scanning the graph until enough rows pass the filters (pgvector 0.8+)
+  perform set_config('hnsw.iterative_scan', coalesce(p_iterative_scan, 'relaxed_order'), true);
 
+  -- The filters are inlined in the query text, so the planner can pick the partial index of the scope
+  return query execute format($query$
+    with matches as materialized (
+      select e.id, e.file_id, e.content, e.embedding <#> $1 as distance
+      from file_embeddings e
+      where e.embedding <#> $1 < -$2 and %s
+      order by e.embedding <#> $1
+      limit $3
+    )
+    -- Relaxed iterative scans may return rows slightly out of order
+    select m.id, m.file_id, m.content, -m.distance as similarity
+    from matches m
+    order by m.distance
+  $query$, file_filter_condition(p_file_prefix, p_file_pattern))
+  using p_query_embedding, p_match_threshold, v_count;
+end;
+$$;
@@ -0,0 +1,60 @@
+-- Multi-query variant of match_file_embeddings, used by /api/v1/search/batch
+-- to answer several queries in one round trip.
+--
+-- p_queries is a JSON array with one object per query:
+--   [{"embedding": [...], "match_threshold": 0.36, "match_count": 4}, ...]
+-- Every returned row carries the 0-based position of its query in the array.
+-- p_ef_search and p_iterative_scan apply to every query, as in match_file_embeddings.
+
+-- Replaced by the version with search parameters below, a second overload would be ambiguous
+drop function if exists match_file_embeddings_batch (jsonb);
+
+create or replace function match_file_embeddings_batch (
+  p_queries            jsonb,
+  p_ef_search          int default null,
+  p_iterative_scan     text default null
+)
+returns table (
+  query_index int,
+  id text,
+  file_id text,
+  content text,
+  similarity float
+)
+language plpgsql
+as $$
+begin
+  -- A scan returns at most ef_search rows, keep it at least the largest match count
+  perform set_config(
+    'hnsw.ef_search',
+    greatest(
+      coalesce(p_ef_search, current_setting('hnsw.ef_search', true)::int, 40),
+      (select max(least((q->>'match_count')::int, 50)) from jsonb_array_elements(p_queries) q)
+    )::text,
+    true
+  );
+  if p_iterative_scan is not null then
+    perform set_config('hnsw.iterative_scan', p_iterative_scan, true);
+  end if;
+
+  return query
+  select
+    (q.ordinality - 1)::int as query_index,
+    m.*
+  from jsonb_array_elements(p_queries) with ordinality as q(query, ordinality)
+  cross join lateral (
+    select
+      e.id,
+      e.file_id,
+      e.content,
+      -- Calculate similarity (negative inner product)
+      -(e.embedding <#> (q.query->>'embedding')::vector(768)) as similarity
+    from file_embeddings e
+    where e.embedding <#> (q.query->>'embedding')::vector(768) < -(q.query->>'match_threshold')::float
+    order by e.embedding <#> (q.query->>'embedding')::vector(768)
+    limit least((q.query->>'match_count')::int, 50)
+  ) m
+  -- Relaxed iterative scans may return rows slightly out of order
+  order by 1, m.similarity desc;
+end;
+$$;
@@ -0,0 +1,124 @@
+-- Two-stage (Matryoshka) search over a truncated copy of the embedding.
+--
+-- Gemini embeddings are trained so that their leading dimensions carry most of
+-- the signal: the first 256 of the 768 dimensions, re-normalized, are a usable
+-- embedding on their own. A 256-dim HNSW index is a third of the size of the
+-- 768-dim one and faster to search. Candidates come from the small index, then
+-- the top p_candidates are reranked with the full vector, so recall stays close
+-- to a full-dimension search.
+--
+-- To use 128 dimensions instead, replace 256 everywhere below.
+
+-- Truncated, re-normalized embedding (needs pgvector 0.7+ for subvector and l2_normalize).
+-- Generated, so the indexer keeps writing only the full vector.
+alter table file_embeddings
+add column embedding_short vector(256)
+generated always as (l2_normalize(subvector(embedding, 1, 256))::vector(256)) stored;
+
+create index on file_embeddings using hnsw (embedding_short vector_ip_ops);
+
+-- Once RAG_RERANK_CANDIDATES is enabled in the API, the full-dimension HNSW index
+-- from files.sql is no longer used by searches and can be dropped to save memory:
+-- drop index file_embeddings_embedding_idx;
+
+-- Optional file filters like match_file_embeddings (apply file_scope.sql first):
+-- candidates are taken among the matching rows only, with an iterative scan of
+-- the small index (pgvector 0.8+) so that a narrow filter still fills the pool.
+
+-- Replaced by the version with file filters below, a second overload would be ambiguous
+drop function if exists match_file_embeddings_mrl (vector, float, int, int);
+
+create or replace function match_file_embeddings_mrl (
+  p_query_embedding    vector(768),
+  p_match_threshold    float,
+  p_match_count        int,
+  p_candidates         int default 200,
+  p_file_prefix        text default null,
+  p_file_pattern       text default null
+)
+returns table (
+  id text,
+  file_id text,
+  content text,
+  similarity float
+)
+language plpgsql
+as $$
+-- The output columns share names with file_embeddings columns
+#variable_conflict use_column
+begin
+  -- HNSW returns at most ef_search rows, so it must cover the candidate pool,
+  -- up to 1000, the largest ef_search pgvector accepts
+  perform set_config('hnsw.ef_search', least(greatest(p_candidates, 40), 1000)::text, true);
+  if p_file_prefix is not null or p_file_pattern is not null then
+    -- The pool is reranked afterwards, so the scan's order within it does not matter
+    perform set_config('hnsw.iterative_scan', 'relaxed_order', true);
+  end if;
+
+  -- The filters are inlined in the query text, like in match_file_embeddings
+  return query execute format($query$
+    with candidates as materialized (
+      select e.id
+      from file_embeddings e
+      where %s
+      order by e.embedding_short <#> l2_normalize(subvector($1, 1, 256))::vector(256)
+      limit least(greatest($4, least($3, 50)), 1000)
+    )
+    select
+      e.id,
+      e.file_id,
+      e.content,
+      -- Calculate similarity (negative inner product) with the full vector
+      -(e.embedding <#> $1) as similarity
+    from candidates c
+    join file_embeddings e on e.id = c.id
+    where e.embedding <#> $1 < -$2
+    order by e.embedding <#> $1
+    limit least($3, 50)
+  $query$, file_filter_condition(p_file_prefix, p_file_pattern))
+  using p_query_embedding, p_match_threshold, p_match_count, p_candidates;
+end;
+$$;
+
+-- Multi-query variant, like match_file_embeddings_batch
+create or replace function match_file_embeddings_mrl_batch (
+  p_queries            jsonb,
+  p_candidates         int default 200
+)
+returns table (
+  query_index int,
+  id text,
+  file_id text,
+  content text,
+  similarity float
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+  perform set_config('hnsw.ef_search', least(greatest(p_candidates, 40), 1000)::text, true);
+
+  return query
+  select
+    (q.ordinality - 1)::int as query_index,
+    m.*
+  from jsonb_array_elements(p_queries) with ordinality as q(query, ordinality)
+  cross join lateral (
+    select
+      e.id,
+      e.file_id,
+      e.content,
+      -(e.embedding <#> (q.query->>'embedding')::vector(768)) as similarity
+    from (
+      select s.id
+      from file_embeddings s
+      order by s.embedding_short <#> l2_normalize(subvector((q.query->>'embedding')::vector(768), 1, 256))::vector(256)
+      limit least(greatest(p_candidates, least((q.query->>'match_count')::int, 50)), 1000)
+    ) c
+    join file_embeddings e on e.id = c.id
+    where e.embedding <#> (q.query->>'embedding')::vector(768) < -(q.query->>'match_threshold')::float
+    order by e.embedding <#> (q.query->>'embedding')::vector(768)
+    limit least((q.query->>'match_count')::int, 50)
+  ) m;
+end;
+$$;
@@ -0,0 +1,175 @@
+-- Keyset (cursor) pagination over the matches of a query.
+--
+-- match_file_embeddings returns at most 50 rows. This function returns the page
+-- of matches that comes after a cursor, in (similarity desc, id) order, where
+-- the cursor is the similarity and id of the last row of the previous page
+-- (both null for the first page). The API reads every page of /search from it,
+-- the first one included: match_file_embeddings may cut a group of rows at the
+-- same distance anywhere, and the rows it left out could then never be reached
+-- from a (similarity, id) cursor. Every page is one index-ordered HNSW scan
+-- that starts from the query and stops as soon as the page is full. The rows of
+-- earlier pages are skipped by the scan's filter, so nothing is sorted or
+-- materialized beyond the page.
+--
+-- Rows at the same distance (duplicate vectors) come back from the scan in no
+-- particular order. When such a group straddles the end of the page, it is read
+-- again whole with index-ordered scans from its distance on, so that the page
+-- ends with the group's smallest IDs whatever order the scan returned them in.
+--
+-- Rows of earlier pages are still visited by the scan, so page N reads about
+-- N pages of index entries: fine for the few pages a client reads, but not for
+-- walking the whole table.
+--
+-- Needs pgvector 0.8+ for iterative index scans. Without them an HNSW scan
+-- returns at most hnsw.ef_search rows before the filter is applied, and
+-- deeper pages come back empty.
+--
+-- Takes the same optional file filters as match_file_embeddings (apply
+-- file_scope.sql first) and its p_ef_search. The iterative scan is always
+-- strict_order, which the keyset relies on, so there is no p_iterative_scan.
+--
+-- With p_candidates (RAG_RERANK_CANDIDATES, needs match_file_embeddings_mrl.sql),
+-- pages come from the two-stage search instead: the p_candidates nearest rows
+-- of the truncated-embedding index that pass the filters, reranked with the full
+-- vector, sorted by (distance, id) and paged with the same keyset. The pool is
+-- the same for every page of a query, so a query has at most p_candidates
+-- results, and ties are ordered exactly since the pool is sorted as a whole.
+
+-- Replaced by the version with filters, ef_search and candidates below, a second overload would be ambiguous
+drop function if exists match_file_embeddings_page (vector, float, int, float, text);
+drop function if exists match_file_embeddings_page (vector, float, int, float, text, text, text);
+drop function if exists match_file_embeddings_page (vector, float, int, float, text, text, text, int);
+
+create or replace function match_file_embeddings_page (
+  p_query_embedding    vector(768),
+  p_match_threshold    float,
+  p_page_size          int,
+  p_after_similarity   float default null,
+  p_after_id           text default null,
+  p_file_prefix        text default null,
+  p_file_pattern       text default null,
+  p_ef_search          int default null,
+  p_candidates         int default null
+)
+returns table (
+  id text,
+  file_id text,
+  content text,
+  similarity float
+)
+language plpgsql
+as $$
+declare
+  v_limit   int := least(p_page_size, 50);  -- MAX_PAGE_SIZE of the API
+  v_filter  text := file_filter_condition(p_file_prefix, p_file_pattern);
+  v_ids     text[];
+  v_dists   float[];
+  v_tie     float;
+  v_before  int;
+  v_read    int;
+  v_rows    int;
+  v_group   text[];
+begin
+  if p_candidates is not null then
+    -- The pool is sorted as a whole, so the scan's order within it does not matter
+    perform set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    perform set_config('hnsw.ef_search', least(greatest(p_candidates, 40), 1000)::text, true);
+
+    -- $1 query, $2 threshold, $3 rows, $4/$5 cursor, $6 candidates
+    return query execute format($query$
+      with candidates as materialized (
+        select e.id
+        from file_embeddings e
+        where %s
+        order by e.embedding_short <#> l2_normalize(subvector($1, 1, 256))::vector(256)
+        limit least(greatest($6, 1), 1000)
+      ),
+      ranked as (
+        select e.id, e.file_id, e.content, e.embedding <#> $1 as distance
+        from candidates c
+        join file_embeddings e on e.id = c.id
+      )
+      select r.id, r.file_id, r.content, -r.distance as similarity
+      from ranked r
+      where r.distance < -$2
+        and ($5 is null or (r.distance, r.id) > (-$4, $5))
+      order by r.distance, r.id
+      limit $3
+    $query$, v_filter)
+    using p_query_embedding, p_match_threshold, v_limit, p_after_similarity, p_after_id, p_candidates;
+    return;
+  end if;
+
+  -- Keep scanning the graph until the filtered page is full, in exact distance order
+  perform set_config('hnsw.iterative_scan', 'strict_order', true);
+  perform set_config('hnsw.ef_search', greatest(v_limit + 1, coalesce(p_ef_search, 40))::text, true);
+
+  -- The page plus one row, in index order, sorted by (distance, id).
+  -- $1 query, $2 threshold, $3 rows, $4/$5 cursor. The file filters are inlined
+  -- in the query text, so the planner can pick the partial index of the scope.
+  execute format($query$
+    select
+      array_agg(s.id order by s.distance, s.id),
+      array_agg(s.distance order by s.distance, s.id)
+    from (
+      select e.id, e.embedding <#> $1 as distance
+      from file_embeddings e
+      where e.embedding <#> $1 < -$2
+        and ($5 is null or (e.embedding <#> $1, e.id) > (-$4, $5))
+        and %s
+      order by e.embedding <#> $1
+      limit $3
+    ) s
+  $query$, v_filter)
+  into v_ids, v_dists
+  using p_query_embedding, p_match_threshold, v_limit + 1, p_after_similarity, p_after_id;
+
+  if cardinality(v_ids) > v_limit and v_dists[v_limit] = v_dists[v_limit + 1] then
+    -- The last row of the page and the next one are at the same distance, so the
+    -- scan may have cut that group anywhere. Rows before the group are kept.
+    v_tie    := v_dists[v_limit];
+    v_before := coalesce(array_position(v_dists, v_tie), 1) - 1;
+    v_read   := 2 * (v_limit + 1);
+    loop
+      -- The scan filters on `>=` rather than `=`: the first row after the group
+      -- ends it, where with `=` the iterative scan would keep looking for more
+      -- matches through the rest of the index. The limit bounds each scan, and
+      -- grows until a row past the group (or the end of the matches) is reached.
+      -- $6 tie distance, $7 rows.
+      execute format($query$
+        select
+          array_agg(s.id order by s.id) filter (where s.distance = $6),
+          count(*)
+        from (
+          select e.id, e.embedding <#> $1 as distance
+          from file_embeddings e
+          where e.embedding <#> $1 >= $6
+            and ($5 is null or (e.embedding <#> $1, e.id) > (-$4, $5))
+            and %s
+          order by e.embedding <#> $1
+          limit $7
+        ) s
+      $query$, v_filter)
+      into v_group, v_rows
+      using p_query_embedding, p_match_threshold, v_limit, p_after_similarity, p_after_id, v_tie, v_read;
+
+      exit when v_rows < v_read or cardinality(v_group) < v_rows;
+      v_read := v_read * 4;
+    end loop;
+    v_ids := v_ids[1:v_before] || v_group[1:v_limit - v_before];
+  else
+    v_ids := v_ids[1:v_limit];
+  end if;
+
+  return query
+  select
+    e.id,
+    e.file_id,
+    e.content,
+    -- Calculate similarity (negative inner product)
+    -(e.embedding <#> p_query_embedding) as similarity
+  from unnest(v_ids) with ordinality as p(id, n)
+  join file_embeddings e on e.id = p.id
+  order by p.n;
+end;
+$$;
@@ -0,0 +1,37 @@
+"""
+Shared fixtures: the search API wired to the fakes of `benchmarks/`
+
+The app, its settings and its module-level state (caches, circuit breaker,
+local index) are created once per test session, like in a running process.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for directory in ("app", "benchmarks", "indexer"):
+    sys.path.insert(0, os.path.join(ROOT_DIR, directory))
+
+os.environ.setdefault("WARMUP_ENABLED", "false")
+
+
+@pytest.fixture(scope="session")
+def fake_app():
+    """Tuple of (app, API key, fake Gemini client, fake Supabase client), without latency"""
+    from fake_app import load_app
+    cwd = os.getcwd()
+    try:
+        return load_app(rows=200, embed_latency=0.0, db_latency=0.0)
+    finally:
+        # load_app moves into the app directory for its relative imports
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope="session")
+def client(fake_app):
+    from fastapi.testclient import TestClient
+    app, key, _, _ = fake_app
+    with TestClient(app, headers={"X-API-Key": key}) as client:
+        yield client
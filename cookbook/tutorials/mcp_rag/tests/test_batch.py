@@ -0,0 +1,43 @@
+def test_batch_returns_one_page_per_query(client):
+    response = client.post("/api/v1/search/batch", json={"queries": [
+        {"query": "first query", "match_threshold": -1.0, "match_count": 3},
+        {"query": "second query", "match_threshold": -1.0, "match_count": 5},
+    ]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [len(query["results"]) for query in results] == [3, 5]
+    assert all("next_cursor" not in query for query in results)
+
+
+def test_batch_rejects_cursors(client):
+    page = client.post("/api/v1/search", json={"query": "first query", "match_threshold": -1.0, "match_count": 3}).json()
+    assert page["next_cursor"]
+
+    response = client.post("/api/v1/search/batch", json={"queries": [
+        {"query": "first query", "match_threshold": -1.0, "match_count": 3, "cursor": page["next_cursor"]},
+    ]})
+    assert response.status_code == 422
+
+
+def test_batch_two_stage_search(client, fake_app, monkeypatch):
+    from config import settings
+    _, _, _, db = fake_app
+    monkeypatch.setattr(settings, "RAG_RERANK_CANDIDATES", 20)
+    calls, rpc = [], db.rpc
+    monkeypatch.setattr(db, "rpc", lambda name, params: calls.append((name, params)) or rpc(name, params))
+
+    response = client.post("/api/v1/search/batch", json={"queries": [
+        {"query": "two-stage batch", "match_threshold": -1.0, "match_count": 5},
+        {"query": "two-stage filtered", "match_threshold": -1.0, "match_count": 5, "file_prefix": "doc_19"},
+    ]})
+    assert response.status_code == 200
+    unfiltered, filtered = [query["results"] for query in response.json()["results"]]
+    assert len(unfiltered) == 5
+    # The candidates are drawn from the filtered rows, not filtered after the pool
+    assert len(filtered) == 5 and all(item["file_id"].startswith("doc_19") for item in filtered)
+
+    names = {name: params for name, params in calls}
+    assert names.keys() == {"match_file_embeddings_mrl_batch", "match_file_embeddings_mrl"}
+    assert names["match_file_embeddings_mrl_batch"]["p_candidates"] == 20
+    assert names["match_file_embeddings_mrl"]["p_candidates"] == 20
+    assert names["match_file_embeddings_mrl"]["p_file_prefix"] == "doc_19"
@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+import lib.chunker
+from lib.chunker import split_document
+
+
+def test_positions_follow_the_text():
+    text = "\n\n".join(f"Paragraph {n}. " + " ".join(f"word{n}-{w}" for w in range(60)) for n in range(6))
+    chunks = split_document(text, "docs/a.md")
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert text[chunk["start_pos"]:chunk["end_pos"]] == chunk["content"]
+    assert [chunk["start_pos"] for chunk in chunks] == sorted(chunk["start_pos"] for chunk in chunks)
+
+
+def test_chunk_not_found_in_the_text_keeps_the_running_offset(monkeypatch):
+    text = "alpha beta\ngamma delta\nepsilon"
+    # A splitter that re-joins pieces with a different separator than the text's
+    splitter = SimpleNamespace(split_text=lambda _: ["alpha beta", "gamma  delta", "epsilon"])
+    monkeypatch.setattr(lib.chunker, "get_text_splitter", lambda: splitter)
+
+    chunks = split_document(text, "docs/a.md")
+    positions = [(chunk["start_pos"], chunk["end_pos"]) for chunk in chunks]
+    assert all(0 <= start <= end <= len(text) for start, end in positions)
+    assert positions[0] == (0, 10)
+    assert positions[2] == (text.index("epsilon"), len(text))
+
+
+def test_indexer_and_api_share_chunk_ids():
+    from chunker import split_text
+
+    text = "# Title\n\n" + "\n\n".join(f"Section {n} " + "text " * 100 for n in range(4)) + "\n\nSection 0 " + "text " * 100
+    chunks = split_text(text, "docs/a.md")
+    assert [chunk["id"] for chunk in chunks] == [chunk["id"] for chunk in split_document(text, "docs/a.md")]
+    # A repeated text gets an ordinal, so IDs stay unique
+    assert len({chunk["id"] for chunk in chunks}) == len(chunks)
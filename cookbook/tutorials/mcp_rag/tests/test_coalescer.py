@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from lib.coalescer import EmbeddingCoalescer
+
+
+class GatedEmbedder:
+    """Batch function that blocks until released, recording the texts of every call"""
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.error = error
+        self.lock = threading.Lock()
+        self.running = self.peak = 0
+
+    def __call__(self, texts):
+        with self.lock:
+            self.calls.append(list(texts))
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        self.started.set()
+        self.release.wait(5)
+        with self.lock:
+            self.running -= 1
+        if self.error is not None:
+            raise self.error
+        return [[float(len(text))] for text in texts]
+
+
+def test_identical_queries_share_one_call():
+    embedder = GatedEmbedder()
+    coalescer = EmbeddingCoalescer(embedder, max_wait=0.01)
+
+    with ThreadPoolExecutor(8) as pool:
+        # Queries arriving while the first call is collected or in flight join it
+        results = [pool.submit(coalescer.embed, ["same query"]) for _ in range(4)]
+        assert embedder.started.wait(5)
+        results += [pool.submit(coalescer.embed, ["same query"]) for _ in range(4)]
+        embedder.release.set()
+        vectors = [result.result(5) for result in results]
+
+    assert vectors == [[[10.0]]] * 8
+    assert embedder.calls == [["same query"]]
+    assert coalescer.stats["merged"] == 7
+
+
+def test_a_failed_call_reaches_every_waiter():
+    embedder = GatedEmbedder(error=RuntimeError("Gemini unavailable"))
+    coalescer = EmbeddingCoalescer(embedder, max_wait=0.05)
+
+    futures = [coalescer.submit(text) for text in ("first", "second", "first")]
+    embedder.release.set()
+    for future in futures:
+        with pytest.raises(RuntimeError, match="Gemini unavailable"):
+            future.result(5)
+    assert len(embedder.calls) == 1 and coalescer.stats["errors"] == 1
+
+    # The failed texts are not stuck in flight, the next request calls again
+    embedder.error = None
+    assert coalescer.embed(["first"]) == [[5.0]]
+    assert len(embedder.calls) == 2
+
+
+def test_calls_in_flight_are_bounded():
+    embedder = GatedEmbedder()
+    coalescer = EmbeddingCoalescer(embedder, max_batch=1, max_wait=0.0, max_in_flight=2)
+
+    futures = [coalescer.submit(f"query {n}") for n in range(6)]
+    assert embedder.started.wait(5)
+    # The other batches wait for a free slot while two calls are blocked
+    time.sleep(0.1)
+    assert len(embedder.calls) == 2
+    embedder.release.set()
+    assert [future.result(5) for future in futures] == [[7.0]] * 6
+    assert len(embedder.calls) == 6 and embedder.peak <= 2
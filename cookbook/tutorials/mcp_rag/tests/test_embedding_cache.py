@@ -0,0 +1,39 @@
+import sqlite3
+
+from lib.embedding_cache import EmbeddingCache
+
+KEY = ("model", 3, "RETRIEVAL_QUERY")
+
+
+def last_used(cache):
+    return dict(cache.conn.execute("select text_hash, last_used from embeddings").fetchall())
+
+
+def test_hits_are_touched_in_batches(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), touch_batch=3)
+    cache.put_many(*KEY, ["a", "b", "c"], [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+    stored = last_used(cache)
+
+    # A lookup only reads, the last use of its hits waits for a put or a full batch
+    assert cache.get_many(*KEY, ["a", "missing"]) == [[1.0, 0.0, 0.0], None]
+    assert last_used(cache) == stored and len(cache.touched) == 1
+
+    cache.get_many(*KEY, ["b", "c"])
+    touched = last_used(cache)
+    assert not cache.touched and all(touched[h] > stored[h] for h in touched)
+
+    cache.get_many(*KEY, ["a"])
+    cache.close()
+    reopened = EmbeddingCache(str(tmp_path / "cache.db"))
+    assert max(last_used(reopened).values()) > max(touched.values())
+
+
+def test_sqlite_errors_degrade_to_misses(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"))
+    cache.put_many(*KEY, ["a"], [[1.0, 0.0, 0.0]])
+    cache.conn.close()
+
+    assert cache.get_many(*KEY, ["a", "b"]) == [None, None]
+    cache.put_many(*KEY, ["b"], [[0.0, 1.0, 0.0]])
+    cache.flush()
+    assert cache.stats["errors"] == 3 and cache.stats["misses"] == 2
@@ -0,0 +1,50 @@
+import re
+
+import pytest
+
+from lib.file_filter import FileFilter, glob_to_regex, literal_prefix
+
+
+@pytest.mark.parametrize("glob, matching, other", [
+    ("docs/*.md",        ["docs/a.md", "docs/.md"],                            ["docs/sub/a.md", "docs/a.mdx", "xdocs/a.md"]),
+    ("docs/**/*.md",     ["docs/a.md", "docs/sub/a.md", "docs/a/b/c.md"],      ["docs.md", "other/docs/a.md"]),
+    ("**/README.md",     ["README.md", "a/README.md", "a/b/README.md"],        ["aREADME.md", "README.mdx"]),
+    ("docs/**",          ["docs/a.md", "docs/sub/a.md", "docs/"],              ["docs", "doc/a.md"]),
+    ("docs/?.md",        ["docs/a.md"],                                        ["docs/ab.md", "docs//.md"]),
+    ("api/v1.0 (old).md", ["api/v1.0 (old).md"],                               ["api/v1x0 (old).md", "api/v1.0 old.md"]),
+    ("a+b[1]/$x^.md",    ["a+b[1]/$x^.md"],                                    ["aab1/x.md", "a+b1/$x^.md"]),
+])
+def test_glob_to_regex(glob, matching, other):
+    pattern = glob_to_regex(glob)
+    assert pattern.startswith("^") and pattern.endswith("$")
+    for file_id in matching:
+        assert re.match(pattern, file_id), (glob, file_id)
+    for file_id in other:
+        assert not re.match(pattern, file_id), (glob, file_id)
+
+
+def test_literal_prefix():
+    assert literal_prefix("docs/**/*.md") == "docs/"
+    assert literal_prefix("docs/a?.md") == "docs/a"
+    assert literal_prefix("docs/a.md") == "docs/a.md"
+    assert literal_prefix("*.md") == ""
+
+
+def test_filter_uses_the_longer_prefix():
+    assert FileFilter("docs/", "docs/api/**/*.md").prefix == "docs/api/"
+    assert FileFilter("docs/api/v1", "docs/**").prefix == "docs/api/v1"
+    # Unrelated prefixes: the explicit one is kept, both still have to match
+    file_filter = FileFilter("docs/", "blog/*.md")
+    assert file_filter.prefix == "docs/"
+    assert not file_filter.matches("docs/a.md") and not file_filter.matches("blog/a.md")
+
+
+def test_filter_scope_and_matching():
+    file_filter = FileFilter(glob="docs/**/*.md")
+    assert file_filter.scope == "docs"
+    assert file_filter.matches("docs/sub/a.md")
+    assert not file_filter.matches("docs/sub/a.txt")
+    assert FileFilter(prefix="doc").scope is None
+    assert FileFilter(glob="**/*.md").scope is None
+    assert FileFilter.create() is None
+    assert FileFilter.create(glob="*.md").params() == {"p_file_prefix": None, "p_file_pattern": "^[^/]*\\.md$"}
@@ -0,0 +1,163 @@
+import threading
+import time
+
+import pytest
+
+from lib.hedging import CircuitBreaker, CircuitOpenError, DeadlineExceededError, HedgedCaller
+
+
+def fail():
+    raise ConnectionError("provider down")
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    breaker.record_success()  # A success resets the count
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.info()["opened"] == 1
+    assert breaker.info()["rejected"] == 1
+
+
+def test_breaker_half_open_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # Only one trial call at a time
+
+    # A failed trial opens the circuit for another reset_timeout
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_fast_call_is_not_hedged():
+    outcomes = []
+    caller = HedgedCaller(deadline=1.0, on_outcome=outcomes.append)
+
+    assert caller.call(lambda x: x * 2, 21) == 42
+    assert outcomes == ["first"]
+    assert caller.info()["hedged"] == 0
+
+
+def test_slow_call_is_hedged_and_the_second_attempt_wins():
+    outcomes = []
+    release = threading.Event()
+    calls = []
+
+    def first_attempt_stalls():
+        calls.append(None)
+        if len(calls) == 1:
+            release.wait(1.0)
+            return "first"
+        return "hedge"
+
+    caller = HedgedCaller(deadline=1.0, min_hedge_delay=0.02, on_outcome=outcomes.append)
+    try:
+        assert caller.call(first_attempt_stalls) == "hedge"
+    finally:
+        release.set()
+    assert outcomes == ["hedge"]
+    assert caller.info()["hedged"] == caller.info()["hedge_wins"] == 1
+
+
+def test_deadline_counts_as_failure_and_opens_the_circuit():
+    outcomes = []
+    release = threading.Event()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    caller = HedgedCaller(deadline=0.05, hedge_quantile=0, breaker=breaker, on_outcome=outcomes.append)
+    try:
+        with pytest.raises(DeadlineExceededError):
+            caller.call(release.wait, 1.0)
+    finally:
+        release.set()
+    assert breaker.state == "open"
+
+    # The open circuit rejects calls without sending them
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        caller.call(calls.append, None)
+    assert calls == []
+    assert outcomes == ["deadline", "rejected"]
+
+
+def test_errors_of_every_attempt_are_raised():
+    outcomes = []
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    caller = HedgedCaller(deadline=1.0, breaker=breaker, on_outcome=outcomes.append)
+
+    with pytest.raises(ConnectionError):
+        caller.call(fail)
+    assert breaker.state == "closed"
+    with pytest.raises(ConnectionError):
+        caller.call(fail)
+    assert breaker.state == "open"
+    assert outcomes == ["error", "error"]
+    assert caller.info()["errors"] == 2
+
+
+@pytest.fixture
+def failing_hedged(fake_app, monkeypatch):
+    """Replace the query embedding caller with one whose calls fail, like an unreachable Gemini"""
+    import lib.gemini_client
+
+    def use(deadline, breaker=None):
+        caller = HedgedCaller(deadline=deadline, hedge_quantile=0, breaker=breaker)
+        monkeypatch.setattr(lib.gemini_client, "hedged", caller)
+        return caller
+
+    return use
+
+
+@pytest.mark.parametrize("path", ["/api/v1/search", "/api/v1/search/stream", "/api/v1/search/batch"])
+def test_search_deadline_is_504(client, fake_app, failing_hedged, monkeypatch, path):
+    _, _, gemini, _ = fake_app
+    monkeypatch.setattr(gemini, "latency", 0.5)
+    failing_hedged(deadline=0.05)
+
+    query = {"query": f"deadline {path}", "match_threshold": -1.0}
+    body = {"queries": [query]} if path.endswith("batch") else query
+    response = client.post(path, json=body)
+    assert response.status_code == 504
+
+
+@pytest.mark.parametrize("path", ["/api/v1/search", "/api/v1/search/stream", "/api/v1/search/batch"])
+def test_search_open_circuit_is_503(client, failing_hedged, path):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    failing_hedged(deadline=1.0, breaker=breaker)
+
+    query = {"query": f"circuit {path}", "match_threshold": -1.0}
+    body = {"queries": [query]} if path.endswith("batch") else query
+    response = client.post(path, json=body)
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+def test_unexpected_embedding_error_is_empty_result(client, fake_app, monkeypatch):
+    _, _, gemini, _ = fake_app
+
+    def broken(*args, **kwargs):
+        raise ValueError("malformed response")
+
+    monkeypatch.setattr(gemini.models, "embed_content", broken)
+    response = client.post("/api/v1/search", json={"query": "unexpected error", "match_threshold": -1.0})
+    assert response.status_code == 200
+    assert response.json()["results"] == []
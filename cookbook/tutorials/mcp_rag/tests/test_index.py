@@ -0,0 +1,47 @@
+import time
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.001)
+
+
+def index(client, documents):
+    job = client.post("/api/v1/index", json={"documents": documents}).json()
+    wait_for(lambda: client.get(f"/api/v1/index/{job['job_id']}").json()["status"] in ("completed", "failed"))
+    return client.get(f"/api/v1/index/{job['job_id']}").json()
+
+
+def stored_contents(db, file_id):
+    rows = db.select("content", [("file_id", "=", file_id)], [], None, False).data
+    return sorted(row["content"] for row in rows)
+
+
+def test_failed_chunks_keep_the_stale_ones(client, fake_app, monkeypatch):
+    _, _, gemini, db = fake_app
+
+    def unreachable(*args, **kwargs):
+        raise ConnectionError("Gemini unreachable")
+
+    assert index(client, [{"file_id": "replace.md", "content": "old text"}])["chunks_written"] == 1
+
+    # The new chunk fails to embed, the old one is kept rather than leaving the document empty
+    with monkeypatch.context() as patch:
+        patch.setattr(gemini.models, "embed_content", unreachable)
+        job = index(client, [{"file_id": "replace.md", "content": "new text"}])
+    assert (job["chunks_failed"], job["chunks_deleted"]) == (1, 0)
+    assert stored_contents(db, "replace.md") == ["old text"]
+
+    # Once the new chunk is written, the old one is deleted
+    job = index(client, [{"file_id": "replace.md", "content": "new text"}])
+    assert (job["chunks_written"], job["chunks_deleted"]) == (1, 1)
+    assert stored_contents(db, "replace.md") == ["new text"]
+
+
+def test_duplicate_file_ids_are_rejected(client):
+    documents = [{"file_id": "twice.md", "content": "first"}, {"file_id": "twice.md", "content": "second"}]
+    response = client.post("/api/v1/index", json={"documents": documents})
+    assert response.status_code == 422
+    assert "twice.md" in response.text
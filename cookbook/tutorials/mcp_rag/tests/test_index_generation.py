@@ -0,0 +1,81 @@
+import threading
+import time
+
+from lib.index_generation import IndexGeneration
+
+
+def wait_for(condition, timeout=1.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.001)
+
+
+def test_reads_in_the_background():
+    release = threading.Event()
+    generation = IndexGeneration(lambda: release.wait(1.0) and 7, poll_interval=60)
+
+    # The read is slow, but the caller does not wait for it
+    start = time.monotonic()
+    assert generation.get() is None
+    assert time.monotonic() - start < 0.5
+
+    release.set()
+    wait_for(lambda: generation.get() == 7)
+
+
+def test_write_during_a_read_discards_its_value():
+    values = iter([1, 2])
+    started, release = threading.Event(), threading.Event()
+
+    def fetch():
+        started.set()
+        release.wait(1.0)
+        return next(values)
+
+    generation = IndexGeneration(fetch, poll_interval=60)
+    generation.get()
+    started.wait(1.0)
+
+    # The read in flight may have happened before the write
+    generation.invalidate()
+    release.set()
+    wait_for(lambda: not generation.refreshing)
+    assert generation.generation is None
+
+    # The next search reads it again, without waiting for the poll interval
+    generation.get()
+    wait_for(lambda: generation.get() == 2)
+
+
+def test_failed_read_disables_caching():
+    def fetch():
+        raise ConnectionError("database down")
+
+    generation = IndexGeneration(fetch, poll_interval=0)
+    assert generation.get() is None
+    wait_for(lambda: not generation.refreshing)
+    assert generation.generation is None
+
+
+def test_index_job_invalidates_cached_responses(client, monkeypatch):
+    from services.search import index_generation
+    body = {"query": "generation invalidation", "match_threshold": -1.0, "match_count": 5}
+
+    # The fakes have no index_generation table, stand in for it
+    monkeypatch.setattr(index_generation, "fetch_fn", lambda: 1)
+    index_generation.invalidate()
+    index_generation.get()
+    wait_for(lambda: index_generation.get() == 1)
+    before = client.post("/api/v1/search", json=body).json()["results"]
+    assert client.post("/api/v1/search", json=body).json()["results"] == before
+
+    # A chunk that matches the query exactly is ranked first once indexed
+    job = client.post("/api/v1/index", json={"documents": [{"file_id": "generation.md", "content": "generation invalidation"}]}).json()
+    wait_for(lambda: client.get(f"/api/v1/index/{job['job_id']}").json()["status"] in ("completed", "failed"), timeout=5.0)
+    assert index_generation.generation is None
+
+    monkeypatch.setattr(index_generation, "fetch_fn", lambda: 2)
+    after = client.post("/api/v1/search", json=body).json()["results"]
+    assert after[0]["file_id"] == "generation.md"
+    index_generation.invalidate()
@@ -0,0 +1,176 @@
+import os
+
+import pytest
+
+from fakes import FakeGeminiClient, FakeSupabase
+
+
+def paragraphs(name, count):
+    """Markdown text that splits into roughly `count` chunks"""
+    return "\n\n".join(f"{name} paragraph {n}. " + " ".join(f"{name}-{n}-{w}" for w in range(80)) for n in range(count))
+
+
+@pytest.fixture
+def indexer(tmp_path, monkeypatch):
+    """The markdown indexer on the fakes, indexing `docs/` in a temporary directory"""
+    monkeypatch.setenv("SUPABASE_URL", "http://localhost:54321")
+    monkeypatch.setenv("SUPABASE_KEY", "e30.e30.test")  # Must look like a JWT
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setenv("EMBEDDING_CACHE_FILE", "")
+    import indexer
+
+    gemini = FakeGeminiClient(latency=0.0)
+    db = FakeSupabase(latency=0.0)
+    monkeypatch.setattr(indexer, "client", gemini)
+    monkeypatch.setattr(indexer, "supabase", db)
+    monkeypatch.setattr(indexer, "cache", None)
+    monkeypatch.setattr(indexer, "EMBED_RETRY_ROUNDS", 1)
+    monkeypatch.setattr(indexer, "EMBED_RETRY_DELAY", 0)
+
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("docs")
+    for name in ("a", "b", "c"):
+        with open(f"docs/{name}.md", "w", encoding="utf-8") as f:
+            f.write(paragraphs(name, 4))
+
+    # Chunks containing a marker are not embedded while it is listed
+    failing = set()
+    embed_content = indexer.embed_content
+
+    def embed_failing(chunks):
+        chunks = embed_content(chunks)
+        for chunk in chunks:
+            if any(marker in chunk["content"] for marker in failing):
+                chunk["embedding"] = []
+        return chunks
+
+    monkeypatch.setattr(indexer, "embed_content", embed_failing)
+    return indexer, db, failing
+
+
+def embedded_texts(indexer, monkeypatch):
+    """Record the texts sent to the embedder"""
+    texts = []
+    embed_content = indexer.embed_content
+
+    def recorded(chunks):
+        texts.extend(chunk["content"] for chunk in chunks)
+        return embed_content(chunks)
+
+    monkeypatch.setattr(indexer, "embed_content", recorded)
+    return texts
+
+
+def test_resume_retries_failed_chunks_first(indexer, monkeypatch):
+    indexer, db, failing = indexer
+    from journal import Journal
+
+    # The first run is killed after the embedding retries gave up on a chunk of b.md
+    def killed(self, completed):
+        self.file.close()
+        self.file = None
+
+    failing.add("b paragraph 0.")
+    close = Journal.close
+    monkeypatch.setattr(Journal, "close", killed)
+    first = indexer.index_markdown_files("docs")
+    failed = first["stats"]["chunks_failed"]
+    assert failed >= 1
+    assert os.path.exists(indexer.JOURNAL_FILE)
+
+    monkeypatch.setattr(Journal, "close", close)
+    failing.clear()
+    # One split thread, so that files are read in the order they are discovered
+    monkeypatch.setattr(indexer, "SPLIT_WORKERS", 1)
+    discovered = []
+    read_and_split = indexer.read_and_split
+    monkeypatch.setattr(indexer, "read_and_split", lambda path, skip_hash=None: discovered.append(path) or read_and_split(path, skip_hash))
+    texts = embedded_texts(indexer, monkeypatch)
+
+    second = indexer.index_markdown_files("docs", resume=True)
+    assert discovered[0] == "docs/b.md"
+    assert len(texts) == failed and all("b paragraph 0." in text for text in texts)
+    assert second["stats"]["chunks_failed"] == 0
+    assert not os.path.exists(indexer.JOURNAL_FILE)
+    assert db.count() == first["stats"]["chunks_created"]
+
+
+def test_manifest_diff(tmp_path):
+    from manifest import Manifest
+
+    path = str(tmp_path / "manifest.json")
+    params = {"chunk_size": 600}
+    manifest = Manifest(path, params=params)
+    manifest.update("docs/a.md", "filehash", {"a_1": "h1", "a_2": "h2", "a_3": "h3"})
+    manifest.save()
+
+    manifest = Manifest(path, params=params)
+    assert manifest.file_hash("docs/a.md") == "filehash"
+    chunks = [{"id": "a_1", "hash": "h1"}, {"id": "a_2", "hash": "changed"}, {"id": "a_4", "hash": "h4"}]
+    changed, removed = manifest.diff_chunks("docs/a.md", chunks)
+    assert [chunk["id"] for chunk in changed] == ["a_2", "a_4"]
+    assert removed == ["a_3"]
+
+    # Unknown files are all new
+    changed, removed = manifest.diff_chunks("docs/b.md", chunks)
+    assert changed == chunks and removed == []
+
+    # Other parameters re-embed everything, the old chunk IDs are still deleted
+    manifest = Manifest(path, params={"chunk_size": 800})
+    assert manifest.file_hash("docs/a.md") is None
+    changed, removed = manifest.diff_chunks("docs/a.md", chunks)
+    assert changed == chunks and removed == ["a_3"]
+
+
+def test_incremental_run_embeds_only_changes(indexer, monkeypatch):
+    indexer, db, _ = indexer
+    first = indexer.index_markdown_files("docs", incremental=True)
+    assert first["stats"]["files_processed"] == 3
+
+    # One paragraph of a.md edited, one dropped from b.md, c.md deleted
+    with open("docs/a.md", "w", encoding="utf-8") as f:
+        f.write(paragraphs("a", 4).replace("a paragraph 3.", "a paragraph 3, edited."))
+    with open("docs/b.md", "w", encoding="utf-8") as f:
+        f.write(paragraphs("b", 3))
+    os.remove("docs/c.md")
+    texts = embedded_texts(indexer, monkeypatch)
+
+    second = indexer.index_markdown_files("docs", incremental=True)
+    assert texts and all("a paragraph 3, edited." in text for text in texts)
+    assert second["stats"]["files_removed"] == 1
+    assert second["stats"]["chunks_deleted"] > 0
+
+    # The table now holds exactly the chunks of the current files
+    from chunker import split_text
+    rows = db.select("id", [], ["id"], None, False).data
+    expected = split_text(paragraphs("b", 3), "docs/b.md") + split_text(
+        paragraphs("a", 4).replace("a paragraph 3.", "a paragraph 3, edited."), "docs/a.md"
+    )
+    assert sorted(row["id"] for row in rows) == sorted(chunk["id"] for chunk in expected)
+
+    # Nothing changed: every file is skipped without embedding
+    texts.clear()
+    third = indexer.index_markdown_files("docs", incremental=True)
+    assert texts == []
+    assert third["stats"]["files_skipped"] == 2
+
+
+def test_embed_errors_are_retried(indexer, monkeypatch):
+    indexer, db, _ = indexer
+    embed_content = indexer.embed_content
+    calls = []
+
+    # The first embedding request raises instead of returning empty embeddings
+    def flaky(chunks):
+        calls.append(len(chunks))
+        if len(calls) == 1:
+            raise ConnectionError("connection reset")
+        return embed_content(chunks)
+
+    monkeypatch.setattr(indexer, "embed_content", flaky)
+    result = indexer.index_markdown_files("docs")
+
+    assert len(calls) == 2 and calls[1] == calls[0]
+    assert result["stages"]["embed"]["errors"] == 1
+    assert result["stats"]["chunks_failed"] == 0
+    assert result["stats"]["chunks_indexed"] == result["stats"]["chunks_created"] == db.count()
@@ -0,0 +1,102 @@
+import pytest
+
+from fakes import fake_embedding
+
+
+@pytest.fixture
+def local_search(fake_app, monkeypatch):
+    """The synced local search backend, with the periodic reconcile out of the way and its ID scans recorded"""
+    from config import settings
+    from services import local_search
+
+    monkeypatch.setattr(settings, "RAG_LOCAL_RECONCILE_EVERY", 3600)
+    local_search.sync()
+    scans = []
+    reconcile = local_search._reconcile
+
+    def recorded():
+        scans.append(None)
+        return reconcile()
+
+    monkeypatch.setattr(local_search, "_reconcile", recorded)
+    return local_search, scans
+
+
+def rows(prefix, count, embedded=True):
+    return [
+        {
+            "id"        : f"{prefix}/doc_{n}.md_0",
+            "file_id"   : f"{prefix}/doc_{n}.md",
+            "content"   : f"Row {n} of {prefix}",
+            "embedding" : fake_embedding(f"{prefix} {n}", 768) if embedded else None,
+        }
+        for n in range(count)
+    ]
+
+
+def test_rows_without_embedding_do_not_force_a_reconcile(local_search, fake_app):
+    local_search, scans = local_search
+    _, _, _, db = fake_app
+    pending = rows("nulls", 3, embedded=False)
+    size = len(local_search.local_index)
+
+    db.upsert(pending)
+    try:
+        local_search.sync()
+        local_search.sync()
+        assert scans == []
+        assert len(local_search.local_index) == size
+    finally:
+        db.delete([row["id"] for row in pending])
+
+
+def test_deleted_and_cleared_rows_are_reconciled(local_search, fake_app):
+    local_search, scans = local_search
+    _, _, _, db = fake_app
+    gone = rows("gone", 2)
+    db.upsert(gone)
+    local_search.sync()
+    size = len(local_search.local_index)
+
+    # One row deleted upstream, the other one's embedding cleared
+    db.delete([gone[0]["id"]])
+    db.upsert([{**gone[1], "embedding": None}])
+    try:
+        local_search.sync()
+        assert len(scans) == 1
+        assert len(local_search.local_index) == size - 2
+
+        # Once the counts agree again, the next sync skips the ID scan
+        local_search.sync()
+        assert len(scans) == 1
+    finally:
+        db.delete([gone[1]["id"]])
+
+
+def test_ivf_build_runs_outside_the_lock(monkeypatch):
+    import threading
+    from lib.local_index import LocalIndex
+
+    index = LocalIndex(768, nprobe=1, ivf_min_rows=100)
+    index.upsert(rows("ivf", 150))
+    kmeans = LocalIndex._kmeans
+    searched = []
+
+    def concurrent_writes(vectors):
+        # Searches and writes from another thread are not blocked by the build
+        def other():
+            searched.append(index.search(fake_embedding("ivf 3", 768), -1.0, 1))
+            index.upsert(rows("late", 1) + [{**rows("ivf", 1)[0], "embedding": fake_embedding("late 0", 768)}])
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+        return kmeans(vectors)
+
+    monkeypatch.setattr(LocalIndex, "_kmeans", staticmethod(concurrent_writes))
+    index.optimize()
+
+    assert index.centroids is not None and searched[0][0]["id"] == "ivf/doc_3.md_0"
+    # Rows added or replaced during the build are assigned to the new lists
+    late = index.search(fake_embedding("late 0", 768), 0.99, 2)
+    assert {row["id"] for row in late} == {"late/doc_0.md_0", "ivf/doc_0.md_0"}
@@ -0,0 +1,113 @@
+import pytest
+
+from fakes import fake_embedding
+
+TIED   = 45
+UNIQUE = 30
+
+
+@pytest.fixture(scope="module")
+def tied_rows(fake_app):
+    """Rows of the "dup/" scope: identical chunks sharing one embedding, and unique ones"""
+    _, _, _, db = fake_app
+    shared = fake_embedding("duplicated chunk", 768)
+    rows = [
+        {"id": f"dup/same_{n:03}", "file_id": "dup/same.md", "content": "same", "embedding": shared}
+        for n in range(TIED)
+    ] + [
+        {"id": f"dup/unique_{n:03}", "file_id": "dup/unique.md", "content": "unique", "embedding": fake_embedding(f"unique {n}", 768)}
+        for n in range(UNIQUE)
+    ]
+    db.upsert(rows)
+    return {row["id"] for row in rows}
+
+
+def read_pages(client, page_size, **body):
+    """Follow next_cursor until the last page, returning every result in order"""
+    results, cursor = [], None
+    while True:
+        response = client.post("/api/v1/search", json={
+            "query": "tied pages", "match_threshold": -1.0, "match_count": page_size,
+            "file_prefix": "dup/", "cursor": cursor, **body,
+        })
+        assert response.status_code == 200, response.text
+        page = response.json()
+        assert len(page["results"]) <= page_size
+        results += page["results"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return results
+
+
+@pytest.mark.parametrize("backend", ["supabase", "local"])
+@pytest.mark.parametrize("page_size", [7, 20, 50])
+def test_pages_cover_tied_rows_once(client, tied_rows, monkeypatch, backend, page_size):
+    from config import settings
+    monkeypatch.setattr(settings, "RAG_SEARCH_BACKEND", backend)
+
+    results = read_pages(client, page_size)
+    ids = [item["id"] for item in results]
+
+    assert len(ids) == len(set(ids))
+    assert set(ids) == tied_rows
+    # Best first, and the tied group in ID order across page boundaries
+    similarities = [item["similarity"] for item in results]
+    assert similarities == sorted(similarities, reverse=True)
+    tied = [id for id in ids if id.startswith("dup/same_")]
+    assert tied == sorted(tied)
+
+
+def test_cursor_of_another_query_is_rejected(client, tied_rows):
+    page = client.post("/api/v1/search", json={
+        "query": "tied pages", "match_threshold": -1.0, "match_count": 5, "file_prefix": "dup/",
+    }).json()
+    assert page["next_cursor"]
+
+    response = client.post("/api/v1/search", json={
+        "query": "another query", "match_threshold": -1.0, "match_count": 5, "file_prefix": "dup/",
+        "cursor": page["next_cursor"],
+    })
+    assert response.status_code == 400
+
+
+def test_iterative_scan_is_rejected(client):
+    # The page keyset needs strict order, another scan mode cannot be honored
+    response = client.post("/api/v1/search", json={"query": "tied pages", "iterative_scan": "relaxed_order"})
+    assert response.status_code == 422
+
+    response = client.post("/api/v1/search", json={"query": "tied pages", "match_count": 5, "ef_search": 100})
+    assert response.status_code == 200
+
+
+@pytest.fixture
+def rpc_calls(fake_app, monkeypatch):
+    """(name, params) of every RPC sent to the fake database during the test"""
+    _, _, _, db = fake_app
+    calls, rpc = [], db.rpc
+
+    def record(name, params):
+        calls.append((name, params))
+        return rpc(name, params)
+
+    monkeypatch.setattr(db, "rpc", record)
+    return calls
+
+
+@pytest.mark.parametrize("page_size", [7, 50])
+def test_pages_of_the_two_stage_search(client, tied_rows, rpc_calls, monkeypatch, page_size):
+    from config import settings
+    monkeypatch.setattr(settings, "RAG_RERANK_CANDIDATES", 60)
+
+    results = read_pages(client, page_size, query=f"two-stage pages {page_size}")
+    ids = [item["id"] for item in results]
+
+    # Every page comes from the same pool of candidates of the "dup/" scope
+    assert len(ids) == len(set(ids)) == 60
+    assert set(ids) <= tied_rows
+    similarities = [item["similarity"] for item in results]
+    assert similarities == sorted(similarities, reverse=True)
+    tied = [id for id in ids if id.startswith("dup/same_")]
+    assert tied == sorted(tied)
+
+    assert {name for name, _ in rpc_calls} == {"match_file_embeddings_page"}
+    assert all(params["p_candidates"] == 60 and "p_ef_search" not in params for _, params in rpc_calls)
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from pipeline import Pipeline, Stage
+
+
+def test_bounded_queues_hold_back_the_source():
+    produced, release = [], threading.Event()
+
+    def source():
+        for n in range(100):
+            produced.append(n)
+            yield n
+
+    def blocked(item):
+        release.wait(5)
+        return []
+
+    pipeline = Pipeline(source(), [
+        Stage("double", lambda item: [item * 2], workers=1, queue_size=2),
+        Stage("sink",   blocked,                 workers=1, queue_size=2),
+    ])
+    runner = threading.Thread(target=pipeline.run)
+    runner.start()
+    time.sleep(0.2)
+
+    # Two queues of 2, plus an item held by each stage and one waiting to be put by the source
+    assert len(produced) <= 7
+    release.set()
+    runner.join(5)
+    assert not runner.is_alive() and len(produced) == 100
+
+
+def test_run_drains_every_stage_and_flushes_once():
+    buffered, flushed, out = [], [], []
+
+    def group(item):
+        buffered.append(item)
+        if len(buffered) < 3:
+            return []
+        batch = buffered[:]
+        buffered.clear()
+        return [batch]
+
+    def flush():
+        flushed.append(list(buffered))
+        return [buffered[:]] if buffered else []
+
+    stats = Pipeline(range(10), [
+        Stage("square", lambda item: [item * item], workers=4),
+        Stage("group",  group,                      workers=1, flush=flush),
+        Stage("sink",   lambda batch: out.append(batch) or [], workers=2),
+    ]).run()
+
+    assert sorted(item for batch in out for item in batch) == [n * n for n in range(10)]
+    assert len(flushed) == 1 and len(flushed[0]) == 1
+    assert stats["square"]["items_in"] == 10 and stats["group"]["items_out"] == 4 and stats["sink"]["items_in"] == 4
+    # The worker threads are gone once run returns
+    assert not [thread for thread in threading.enumerate() if thread.name.split("-")[0] in ("square", "group", "sink")]
+
+
+def test_failed_items_reach_the_error_sink():
+    retried, out = [], []
+
+    def flaky(item):
+        if item % 3 == 0:
+            raise ValueError(f"bad item {item}")
+        return [item]
+
+    def strict(item):
+        if item == 4:
+            raise ZeroDivisionError("no handler for 4")
+        return [item]
+
+    pipeline = Pipeline(range(9), [
+        Stage("flaky",  flaky, workers=2, on_error=lambda item, error: retried.append((item, str(error)))),
+        Stage("strict", strict, workers=1),
+        Stage("sink",   lambda item: out.append(item) or [], workers=1),
+    ])
+    stats = pipeline.run()
+
+    assert sorted(retried) == [(0, "bad item 0"), (3, "bad item 3"), (6, "bad item 6")]
+    assert stats["flaky"]["errors"] == 3 and stats["flaky"]["items_out"] == 6
+    # Without a sink the item is kept on the pipeline
+    assert [(name, item, type(error)) for name, item, error in pipeline.failed] == [("strict", 4, ZeroDivisionError)]
+    assert stats["strict"]["errors"] == 1
+    assert sorted(out) == [1, 2, 5, 7, 8]
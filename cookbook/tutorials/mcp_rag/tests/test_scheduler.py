@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+
+from lib import scheduler as scheduler_module
+from lib.scheduler import EmbeddingScheduler
+
+
+class FakeClock:
+    """Monotonic clock that only moves when slept on, by at least a millisecond like a real sleep"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.lock = threading.Lock()
+
+    def __call__(self) -> float:
+        with self.lock:
+            return self.now
+
+    def sleep(self, seconds: float) -> None:
+        with self.lock:
+            self.now += max(0.001, seconds)
+
+
+class QuotaError(Exception):
+    code = 429
+
+
+def embed(texts):
+    return [[float(len(text))] for text in texts]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Backoff delays take their upper bound instead of a random jitter
+    monkeypatch.setattr(scheduler_module.random, "uniform", lambda low, high: high)
+    return FakeClock()
+
+
+def test_requests_are_paced_by_the_quota(clock):
+    scheduler = EmbeddingScheduler(embed, max_in_flight=1, requests_per_minute=2, clock=clock, sleep=clock.sleep)
+
+    # The bucket starts full with a minute of quota, then refills at one request every 30s
+    results = scheduler.embed_batches([["a"], ["bb"], ["ccc"], ["dddd"]])
+    scheduler.shutdown()
+
+    assert results == [[[1.0]], [[2.0]], [[3.0]], [[4.0]]]
+    assert clock.now == pytest.approx(60.0, abs=0.01)
+    assert scheduler.stats["requests"] == 4
+
+
+def test_rate_limits_back_off_and_recover(clock):
+    calls = []
+
+    def limited(texts):
+        calls.append(clock())
+        if len(calls) <= 2:
+            raise QuotaError("429 RESOURCE_EXHAUSTED")
+        return embed(texts)
+
+    scheduler = EmbeddingScheduler(limited, max_in_flight=1, base_delay=1.0, clock=clock, sleep=clock.sleep)
+    assert scheduler.embed_batches([["text"]]) == [[[4.0]]]
+    scheduler.shutdown()
+
+    # Every worker pauses for the full-jitter delay, 1s then 2s, and the rate is halved twice
+    assert calls == pytest.approx([0.0, 1.0, 3.0], abs=0.01)
+    assert scheduler.stats == {"requests": 1, "retries": 2, "rate_limited": 2, "failed": 0}
+    # One success adds back 5% of the configured rate
+    assert scheduler.scale == pytest.approx(0.3)
+    assert scheduler.request_bucket.scale == scheduler.token_bucket.scale == scheduler.scale
+
+
+def test_permanent_errors_are_not_retried(clock):
+    calls = []
+
+    def invalid(texts):
+        calls.append(texts)
+        raise ValueError("400 INVALID_ARGUMENT")
+
+    scheduler = EmbeddingScheduler(invalid, clock=clock, sleep=clock.sleep)
+    assert scheduler.embed_batches([["text"]]) == [None]
+    scheduler.shutdown()
+
+    assert len(calls) == 1 and clock.now == 0.0
+    assert scheduler.stats["failed"] == 1 and scheduler.stats["retries"] == 0
+
+
+def test_shutdown_waits_for_requests_in_flight(clock):
+    started, release = threading.Event(), threading.Event()
+
+    def slow(texts):
+        started.set()
+        release.wait(5)
+        return embed(texts)
+
+    scheduler = EmbeddingScheduler(slow, max_in_flight=2, clock=clock, sleep=clock.sleep)
+    futures = [scheduler.submit(["a"]), scheduler.submit(["bb"]), scheduler.submit(["ccc"])]
+    assert started.wait(5)
+
+    stopper = threading.Thread(target=scheduler.shutdown)
+    stopper.start()
+    stopper.join(0.1)
+    assert stopper.is_alive()
+
+    release.set()
+    stopper.join(5)
+    assert not stopper.is_alive()
+    assert [future.result(0) for future in futures] == [[[1.0]], [[2.0]], [[3.0]]]
+    with pytest.raises(RuntimeError):
+        scheduler.submit(["late"])
@@ -0,0 +1,101 @@
+import pytest
+
+from lib import writer as writer_module
+from lib.writer import BulkWriter, WriteAbortedError, estimate_row_bytes
+
+
+class PostgrestError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+def rows(count, dimension=10):
+    return [{"id": f"row_{n:03}", "file_id": "doc.md", "content": "text", "embedding": [0.1] * dimension} for n in range(count)]
+
+
+class FakeTable:
+    """write_fn recording every request, failing with `errors` (first request first) or on `bad` rows"""
+
+    def __init__(self, errors=(), bad=()):
+        self.errors = list(errors)
+        self.bad = set(bad)
+        self.requests = []
+
+    def __call__(self, batch):
+        self.requests.append([row["id"] for row in batch])
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.bad & {row["id"] for row in batch}:
+            raise PostgrestError("expected 768 dimensions, not 10", "22000")
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    # Backoff delays take their upper bound instead of a random jitter
+    monkeypatch.setattr(writer_module.random, "uniform", lambda low, high: high)
+    return []
+
+
+def test_rows_are_packed_by_payload_size():
+    size = estimate_row_bytes(rows(1)[0])
+    writer = BulkWriter(FakeTable(), target_bytes=size * 4, max_rows=3)
+
+    assert [len(batch) for batch in writer.pack(rows(10))] == [3, 3, 3, 1]
+    writer.max_rows = 100
+    assert [len(batch) for batch in writer.pack(rows(10))] == [4, 4, 2]
+    # A row larger than the target gets a request of its own
+    assert [len(batch) for batch in writer.pack(rows(2, dimension=1000))] == [1, 1]
+
+
+def test_transient_errors_are_retried_with_backoff(delays):
+    table = FakeTable([PostgrestError("503 Service Unavailable", ""), PostgrestError("deadlock detected", "40P01")])
+    writer = BulkWriter(table, base_delay=0.5, sleep=delays.append)
+
+    assert writer.write(rows(5)) == [row["id"] for row in rows(5)]
+    assert len(table.requests) == 3 and delays == [0.5, 1.0]
+    assert writer.stats["retries"] == 2 and writer.stats["splits"] == 0
+
+
+def test_bad_rows_are_isolated_by_splitting(delays):
+    table = FakeTable(bad={"row_005"})
+    writer = BulkWriter(table, sleep=delays.append)
+
+    written = writer.write(rows(8))
+    assert written == [row["id"] for row in rows(8) if row["id"] != "row_005"]
+    assert writer.stats["rows_failed"] == 1 and writer.stats["splits"] == 3
+    # Data errors are not retried as is
+    assert delays == []
+
+
+def test_timeouts_split_and_lower_the_target(delays):
+    table = FakeTable([PostgrestError("canceling statement due to statement timeout", "57014")])
+    writer = BulkWriter(table, target_bytes=1_000_000, min_bytes=100_000, sleep=delays.append)
+
+    assert len(writer.write(rows(8))) == 8
+    assert [len(request) for request in table.requests] == [8, 4, 4]
+    # Halved by the timeout, then grown by 10% for each of the two successes
+    assert writer.target_bytes == int(int(500_000 * 1.1) * 1.1)
+
+
+@pytest.mark.parametrize("error", [
+    PostgrestError("permission denied for table file_embeddings", "42501"),
+    PostgrestError("JWT expired", "PGRST301"),
+    PostgrestError('relation "file_embeddings" does not exist', "42P01"),
+    PostgrestError("Could not find the 'embedding' column of 'file_embeddings' in the schema cache", "PGRST204"),
+])
+def test_auth_and_schema_errors_abort(delays, error):
+    table = FakeTable([error])
+    writer = BulkWriter(table, sleep=delays.append)
+
+    with pytest.raises(WriteAbortedError):
+        writer.write(rows(8))
+    assert len(table.requests) == 1 and writer.stats["splits"] == 0
+
+
+def test_unknown_errors_fail_the_batch_without_splitting(delays):
+    table = FakeTable([PostgrestError("something unexpected", "XX000")])
+    writer = BulkWriter(table, sleep=delays.append)
+
+    assert writer.write(rows(8)) == []
+    assert len(table.requests) == 1 and writer.stats["rows_failed"] == 8
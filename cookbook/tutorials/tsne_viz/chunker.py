@@ -0,0 +1,133 @@
+"""
+Reading and splitting of text files
+
+Kept free of API clients and other import-time side effects so the functions
+can run in worker processes (see `init_worker` and `read_and_split`).
+"""
+
+import os
+import hashlib
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Configuration
+CHUNK_SIZE    = 600
+CHUNK_OVERLAP = 200
+
+def content_hash(text: str) -> str:
+    """
+    Return a stable hash for a piece of text
+
+    Args:
+        text: Text to hash
+
+    Returns:
+        Hex encoded SHA-256 digest
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+@lru_cache(maxsize=None)
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    """
+    Get the text splitter, built once per process
+
+    Returns:
+        Shared RecursiveCharacterTextSplitter instance
+    """
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+
+def init_worker() -> None:
+    """Process pool initializer, builds the splitter before the first file arrives"""
+    get_text_splitter()
+
+def read_text_file(file_path: str) -> str:
+    """
+    Read a text file and return its contents
+
+    Args:
+        file_path: Path to the text file
+
+    Returns:
+        String content of the text file
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except Exception as e:
+        print(f"Error reading file {file_path}: {e}")
+        return ""
+
+def split_text(text: str, file_path: str) -> List[Dict[str, Any]]:
+    """
+    Split text into chunks and prepare for embedding
+
+    Args:
+        text: Text content to split
+        file_path: Original file path for tracking
+
+    Returns:
+        List of dictionaries with chunk information
+    """
+    # Split the text into chunks with this process's splitter
+    chunks = get_text_splitter().split_text(text)
+
+    # Get the relative file path for the file_id
+    file_id = os.path.relpath(file_path).replace("\\", "/")
+
+    # Create a list of chunk dictionaries
+    chunk_dicts = []
+    seen: Dict[str, int] = {}
+    search_from = 0
+    for chunk_text in chunks:
+        # Find the exact start position, searching forward from the previous chunk
+        start_pos = text.find(chunk_text, search_from)
+        if start_pos < 0:
+            start_pos = text.find(chunk_text)
+        if start_pos < 0:
+            # Not a verbatim slice of the text, keep the running offset instead of -1
+            start_pos = search_from
+        end_pos = min(start_pos + len(chunk_text), len(text))
+        search_from = max(search_from, end_pos - CHUNK_OVERLAP)
+
+        # Content-addressed ID, so edits elsewhere in the file don't change it.
+        # Repeated texts within a file get an ordinal to keep IDs unique.
+        chunk_hash = content_hash(chunk_text)
+        seen[chunk_hash] = seen.get(chunk_hash, 0) + 1
+        chunk_id = f"{file_id}_{chunk_hash[:16]}"
+        if seen[chunk_hash] > 1:
+            chunk_id += f"_{seen[chunk_hash]}"
+
+        chunk_dicts.append({
+            "id"       : chunk_id,
+            "file_id"  : file_id,
+            "content"  : chunk_text,
+            "start_pos": start_pos,
+            "end_pos"  : end_pos,
+            "hash"     : chunk_hash
+        })
+
+    return chunk_dicts
+
+def read_and_split(file_path: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Read and split one file, suitable for running in a process pool
+
+    Args:
+        file_path: Path to the text file
+
+    Returns:
+        List of chunk dictionaries, or None if the file could not be processed
+    """
+    try:
+        content = read_text_file(file_path)
+        if not content:
+            return None
+        return split_text(content, file_path)
+    except Exception as e:
+        print(f"Error processing file {file_path}: {e}")
+        return None
@@ -15,139 +15,150 @@ import glob
 import time
 import argparse
 import json
-from typing import List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional
 from pathlib import Path
 
 from dotenv import load_dotenv
 from google import genai
 from google.genai.types import EmbedContentConfig
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# The embedding scheduler and cache are shared with the MCP RAG tutorial's indexer
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mcp_rag", "app"))
+
+from chunker import init_worker, read_and_split
+from lib.scheduler import EmbeddingScheduler, pack_batches
+from lib.embedding_cache import EmbeddingCache
 
 # Load environment variables
 load_dotenv()
 
 # Configuration
-CHUNK_SIZE         = 600
-CHUNK_OVERLAP      = 200
 EMBEDDING_SIZE     = 768
-BATCH_SIZE         = 20   # Process files in batches to avoid rate limits
+SPLIT_PROCESSES    = int(os.getenv("SPLIT_PROCESSES", 0))  # Worker processes for reading and splitting (0 = off)
 GEMINI_BATCH_LIMIT = 100  # Maximum batch size for Gemini embedding API
+GEMINI_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", 20_000))  # Estimated token budget per embedding request
+TASK_TYPE          = "RETRIEVAL_DOCUMENT"
 OUTPUT_JSON_FILE   = "embeddings.json"
 
+# Embedding request pacing (override with env vars or CLI flags)
+EMBED_CONCURRENCY  = int(os.getenv("EMBED_CONCURRENCY", 4))              # Requests in flight
+EMBED_RPM          = float(os.getenv("EMBED_RPM", 1500))                 # Requests per minute
+EMBED_TPM          = float(os.getenv("EMBED_TPM", 1_000_000))            # Tokens per minute
+
+# Embedding cache, shared with the other indexers and the search API if they point to the same file
+EMBEDDING_CACHE_FILE = os.getenv("EMBEDDING_CACHE_FILE", ".embedding_cache.db")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 1_000_000))  # Max cached embeddings
+
 # Initialize Gemini client
 model_id = os.getenv("GEMINI_EMBEDDING_ID", "text-embedding-004")
 client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 
-def read_text_file(file_path: str) -> str:
+def embed_texts(texts: List[str]) -> List[List[float]]:
     """
-    Read a text file and return its contents
+    Embed one batch of texts with a single Gemini call
 
     Args:
-        file_path: Path to the text file
+        texts: Texts to embed (at most GEMINI_BATCH_LIMIT)
 
     Returns:
-        String content of the text file
+        One embedding vector per text
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except Exception as e:
-        print(f"Error reading file {file_path}: {e}")
-        return ""
+    response = client.models.embed_content(
+        model=model_id,
+        contents=texts,
+        config=EmbedContentConfig(
+            task_type=TASK_TYPE,
+            output_dimensionality=EMBEDDING_SIZE
+        )
+    )
+    return [embedding.values for embedding in response.embeddings]
+
+# Initialize the embedding cache (set EMBEDDING_CACHE_FILE="" to disable)
+cache: Optional[EmbeddingCache] = EmbeddingCache(EMBEDDING_CACHE_FILE, EMBEDDING_CACHE_SIZE) if EMBEDDING_CACHE_FILE else None
+
+# Initialize the embedding scheduler
+scheduler = EmbeddingScheduler(
+    embed_texts,
+    max_in_flight=EMBED_CONCURRENCY,
+    requests_per_minute=EMBED_RPM,
+    tokens_per_minute=EMBED_TPM
+)
 
-def split_text(text: str, file_path: str) -> List[Dict[str, Any]]:
+def configure_scheduler(concurrency: int, rpm: float, tpm: float) -> None:
     """
-    Split text into chunks and prepare for embedding
+    Replace the embedding scheduler with new pacing settings
 
     Args:
-        text: Text content to split
-        file_path: Original file path for tracking
-
-    Returns:
-        List of dictionaries with chunk information
+        concurrency: Maximum number of embedding requests in flight
+        rpm: Requests per minute quota
+        tpm: Tokens per minute quota
     """
-    # Initialize the text splitter
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP
+    global scheduler
+    scheduler.shutdown()
+    scheduler = EmbeddingScheduler(
+        embed_texts,
+        max_in_flight=concurrency,
+        requests_per_minute=rpm,
+        tokens_per_minute=tpm
     )
 
-    # Split the text into chunks
-    chunks = text_splitter.split_text(text)
-
-    # Get the relative file path for the file_id
-    file_id = os.path.relpath(file_path).replace("\\", "/")
-
-    # Create a list of chunk dictionaries
-    chunk_dicts = []
-    for i, chunk_text in enumerate(chunks):
-        # Get start position (approximate)
-        start_pos = i * (CHUNK_SIZE - CHUNK_OVERLAP) if i > 0 else 0
-        end_pos = start_pos + len(chunk_text)
-
-        chunk_id = f"{file_id}_{start_pos}-{end_pos}"
-
-        chunk_dicts.append({
-            "id"       : chunk_id,
-            "file_id"  : file_id,
-            "content"  : chunk_text,
-            "start_pos": start_pos,
-            "end_pos"  : end_pos
-        })
-
-    return chunk_dicts
-
 def embed_content(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Generate embeddings for a list of text chunks
 
+    Each distinct text is embedded once and its vector is shared by every chunk
+    with that text. Embeddings found in the local cache are reused, only the
+    misses are sent to Gemini.
+
     Args:
-        chunks: List of chunk dictionaries with content
+        chunks: List of chunk dictionaries with content and hash
 
     Returns:
         Chunks with embeddings added
     """
-    # Process in batches of GEMINI_BATCH_LIMIT to avoid API limitations
-    all_chunks_with_embeddings = []
-
-    for i in range(0, len(chunks), GEMINI_BATCH_LIMIT):
-        batch = chunks[i:i + GEMINI_BATCH_LIMIT]
-        print(f"Processing embedding batch {i//GEMINI_BATCH_LIMIT + 1} ({len(batch)} chunks)...")
-
-        # Extract text content from chunks
-        texts = [chunk["content"] for chunk in batch]
-
-        try:
-            # Generate embeddings
-            response = client.models.embed_content(
-                model=model_id,
-                contents=texts,
-                config=EmbedContentConfig(
-                    task_type="RETRIEVAL_DOCUMENT",
-                    output_dimensionality=EMBEDDING_SIZE
-                )
-            )
-
-            # Add embeddings to chunks
-            for j, embedding in enumerate(response.embeddings):
-                batch[j]["embedding"] = embedding.values
-
-            all_chunks_with_embeddings.extend(batch)
-
-        except Exception as e:
-            print(f"Error generating embeddings for batch {i//GEMINI_BATCH_LIMIT + 1}: {e}")
-            # Add chunks without embeddings
-            for chunk in batch:
-                chunk["embedding"] = []
-                all_chunks_with_embeddings.append(chunk)
-
-        # Add a small delay between batches to avoid rate limits
-        if i + GEMINI_BATCH_LIMIT < len(chunks):
-            time.sleep(0.5)
-
-    return all_chunks_with_embeddings
-
-def index_markdown_files(directory: str, file_types: List[str], dry_run: bool = False) -> Dict[str, Any]:
+    # Group identical texts (license headers, boilerplate, ...) across files
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for chunk in chunks:
+        groups.setdefault(chunk["hash"], []).append(chunk)
+    texts = [group[0]["content"] for group in groups.values()]
+    if len(texts) < len(chunks):
+        print(f"Deduplicated {len(chunks)} chunks to {len(texts)} distinct texts")
+
+    # Reuse cached embeddings
+    vectors = cache.get_many(model_id, EMBEDDING_SIZE, TASK_TYPE, texts) if cache else [None] * len(texts)
+    misses = [i for i, vector in enumerate(vectors) if vector is None]
+    if len(misses) < len(texts):
+        print(f"Reused {len(texts) - len(misses)} cached embeddings")
+
+    # Pack into as few requests as fit both the item limit and the token budget
+    packed = pack_batches([texts[i] for i in misses], GEMINI_BATCH_LIMIT, GEMINI_BATCH_TOKENS)
+    batches = [[misses[j] for j in batch] for batch in packed]
+    if batches:
+        print(f"Processing {len(batches)} embedding batches ({len(misses)} texts)...")
+
+    # Run the batches concurrently, paced by the scheduler's rate limits
+    results = scheduler.embed_batches([[texts[i] for i in batch] for batch in batches])
+
+    for n, (batch, embeddings) in enumerate(zip(batches, results), 1):
+        if embeddings is None or len(embeddings) != len(batch):
+            print(f"Error generating embeddings for batch {n}")
+            # Leave these chunks without embeddings
+            embeddings = [[] for _ in batch]
+        elif cache:
+            cache.put_many(model_id, EMBEDDING_SIZE, TASK_TYPE, [texts[i] for i in batch], embeddings)
+
+        for i, embedding in zip(batch, embeddings):
+            vectors[i] = embedding
+
+    # Fan each vector out to every chunk with that text
+    for group, vector in zip(groups.values(), vectors):
+        for chunk in group:
+            chunk["embedding"] = vector
+
+    return chunks
+
+def index_markdown_files(directory: str, file_types: List[str], dry_run: bool = False, processes: int = SPLIT_PROCESSES) -> Dict[str, Any]:
     """
     Find all specified file types in a directory and index them
 
@@ -155,6 +166,7 @@ def index_markdown_files(directory: str, file_types: List[str], dry_run: bool =
         directory: Path to directory to scan for files
         file_types: List of file extensions to index (e.g., ['.md', '.txt'])
         dry_run: If True, don't actually upload to Supabase
+        processes: Worker processes for reading and splitting (0 or 1 to split in this process)
 
     Returns:
         Dictionary with statistics about the indexing process
@@ -189,51 +201,47 @@ def index_markdown_files(directory: str, file_types: List[str], dry_run: bool =
         "processing_time": 0
     }
 
-    # Process files in batches
-    for i in range(0, len(all_found_files), BATCH_SIZE):
-        batch = all_found_files[i:i + BATCH_SIZE]
+    def embed_chunks(chunks: List[Dict[str, Any]]) -> None:
+        # Generate embeddings and keep the chunks that got one
+        chunks_with_embeddings = embed_content(chunks)
+        valid_chunks = [chunk for chunk in chunks_with_embeddings if chunk.get("embedding")]
+        all_processed_chunks.extend(valid_chunks)
+        print(f"Added {len(valid_chunks)} valid chunks")
 
-        all_chunks = []
+    # Read and split files in worker processes if requested; results stream back in file order
+    pool = ProcessPoolExecutor(max_workers=processes, initializer=init_worker) if processes > 1 else None
+    results = pool.map(read_and_split, all_found_files, chunksize=8) if pool else map(read_and_split, all_found_files)
 
-        # Process each file in the batch
-        for file_path in batch:
-            try:
-                # Read the file
-                content = read_text_file(file_path)
-                if not content:
-                    stats["files_failed"] += 1
-                    continue
+    # Embed whenever there are enough chunks to keep every in-flight request full
+    flush_size = GEMINI_BATCH_LIMIT * scheduler.max_in_flight
+    all_chunks = []
 
-                # Split the content into chunks
-                chunks = split_text(content, file_path)
+    try:
+        for file_path, chunks in zip(all_found_files, results):
+            if chunks is None:
+                stats["files_failed"] += 1
+                continue
 
-                # Add to the list of all chunks
-                all_chunks.extend(chunks)
+            # Add to the list of all chunks
+            all_chunks.extend(chunks)
 
-                # Update statistics
-                stats["files_processed"] += 1
-                stats["chunks_created"] += len(chunks)
+            # Update statistics
+            stats["files_processed"] += 1
+            stats["chunks_created"] += len(chunks)
 
-                print(f"Processed {file_path} - {len(chunks)} chunks")
+            print(f"Processed {file_path} - {len(chunks)} chunks")
 
-            except Exception as e:
-                print(f"Error processing file {file_path}: {e}")
-                stats["files_failed"] += 1
+            if len(all_chunks) >= flush_size:
+                embed_chunks(all_chunks)
+                all_chunks = []
 
-        # Generate embeddings for all chunks in the batch
         if all_chunks:
-            chunks_with_embeddings = embed_content(all_chunks)
-
-            # Filter out chunks without embeddings
-            valid_chunks = [chunk for chunk in chunks_with_embeddings if chunk.get("embedding")]
-
-            # Append valid chunks to the main list
-            all_processed_chunks.extend(valid_chunks)
-            print(f"Added {len(valid_chunks)} valid chunks from batch {i//BATCH_SIZE + 1}")
-
-        # Add a small delay between batches to avoid rate limits
-        if i + BATCH_SIZE < len(all_found_files):
-            time.sleep(1)
+            embed_chunks(all_chunks)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if cache is not None:
+            cache.flush()
 
     # Calculate total processing time
     stats["processing_time"] = round(time.time() - start_time, 2)
@@ -272,6 +280,11 @@ def main():
     parser.add_argument("--directory", nargs="?", default=".", help="Directory to scan for files (default: current directory)")
     parser.add_argument("--file-types", nargs='+', default=['.md'], help="List of file extensions to index (default: .md), e.g., --file-types .md .txt .rst")
     parser.add_argument("--dry-run", action="store_true", help="Perform a dry run without writing embeddings to file")
+    parser.add_argument("--no-cache", action="store_true", help="Always call Gemini instead of reusing cached embeddings")
+    parser.add_argument("--processes", type=int, default=SPLIT_PROCESSES, help="Read and split files in this many worker processes (default: off)")
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY, help=f"Embedding requests in flight (default: {EMBED_CONCURRENCY})")
+    parser.add_argument("--rpm", type=float, default=EMBED_RPM, help=f"Embedding requests per minute quota (default: {EMBED_RPM:g})")
+    parser.add_argument("--tpm", type=float, default=EMBED_TPM, help=f"Embedding tokens per minute quota (default: {EMBED_TPM:g})")
 
     args = parser.parse_args()
 
@@ -281,7 +294,11 @@ def main():
         sys.exit(1)
 
     # Run the indexer
-    result = index_markdown_files(args.directory, args.file_types, args.dry_run)
+    if args.no_cache:
+        global cache
+        cache = None
+    configure_scheduler(args.concurrency, args.rpm, args.tpm)
+    result = index_markdown_files(args.directory, args.file_types, args.dry_run, args.processes)
 
     # Print the result
     if result["status"] == "success":